@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from 'react';
 import { useParams, useRouter } from 'next/navigation';
-import { fetchScenario, submitDecision } from '@/lib/api';
+import { fetchScenario, prefetchStep, submitDecision } from '@/lib/api';
 import { Scenario, FrameworkAnalysis } from '@/lib/types';
 import DecisionTree from '@/components/scenario/decision-tree';
 import NeuralBackground from '@/components/neural-background';
@@ -32,7 +32,10 @@ export default function ScenarioPage() {
   // Load scenario
   useEffect(() => {
     fetchScenario(scenarioId)
-      .then(setScenario)
+      .then((loaded) => {
+        setScenario(loaded);
+        prefetchStep(loaded.id, 1, null);
+      })
       .catch((err) => {
         console.error('Failed to load scenario:', err);
         router.push('/');
@@ -73,6 +76,8 @@ export default function ScenarioPage() {
       if (response.is_final) {
         setIsComplete(true);
       } else if (response.next_step) {
+        prefetchStep(scenario.id, response.next_step, response.session_id);
+
         // Move to next step after brief delay
         setTimeout(() => {
           setCurrentStep(response.next_step!);
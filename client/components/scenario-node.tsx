@@ -1,11 +1,11 @@
 'use client';
 
 import Link from 'next/link';
-import { Scenario } from '@/lib/types';
+import { ScenarioSummary } from '@/lib/types';
 import { useState } from 'react';
 
 interface Props {
-  scenario: Scenario;
+  scenario: ScenarioSummary;
   index: number;
 }
 
@@ -50,7 +50,7 @@ export default function ScenarioNode({ scenario, index }: Props) {
           {/* Inner content */}
           <div className='text-center'>
             <div className={`text-lg font-light ${color.text}`}>
-              {scenario.decision_points.length}
+              {scenario.num_decision_points}
             </div>
             <div className='text-[10px] text-gray-600 uppercase tracking-wide'>
               nodes
@@ -1,9 +1,9 @@
-import { Scenario, DecisionResponse } from './types';
+import { Scenario, ScenarioSummary, DecisionResponse, ConsequenceHandle } from './types';
 
 const API_BASE = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
-export async function fetchScenarios(): Promise<Scenario[]> {
-  const response = await fetch(`${API_BASE}/api/scenarios`);
+export async function fetchScenarios(): Promise<ScenarioSummary[]> {
+  const response = await fetch(`${API_BASE}/api/scenarios/?view=summary`);
   if (!response.ok) throw new Error('Failed to fetch scenarios');
   return response.json();
 }
@@ -14,23 +14,61 @@ export async function fetchScenario(id: string): Promise<Scenario> {
   return response.json();
 }
 
-export async function submitDecision(data: {
-  scenario_id: string;
-  session_id: string | null;
-  step: number;
-  choice_id: string;
-  choice_text: string;
-}): Promise<DecisionResponse> {
-  const response = await fetch(`${API_BASE}/api/decisions/submit`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(data),
-  });
+// Lets the server warm analyses for the choices about to be shown
+export function prefetchStep(
+  scenarioId: string,
+  step: number,
+  sessionId: string | null
+): void {
+  const query = sessionId ? `?session_id=${encodeURIComponent(sessionId)}` : '';
+  fetch(`${API_BASE}/api/scenarios/${scenarioId}/step/${step}${query}`).catch(
+    () => {}
+  );
+}
+
+// The idempotency key makes a retry return the original response instead
+// of recording the choice (and running the analysis) twice
+export async function submitDecision(
+  data: {
+    scenario_id: string;
+    session_id: string | null;
+    step: number;
+    choice_id: string;
+    choice_text: string;
+    defer_consequences?: boolean;
+  },
+  idempotencyKey: string = crypto.randomUUID()
+): Promise<DecisionResponse> {
+  const send = () =>
+    fetch(`${API_BASE}/api/decisions/submit`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey,
+      },
+      body: JSON.stringify(data),
+    });
+
+  let response: Response;
+  try {
+    response = await send();
+  } catch {
+    // Network failure: the first attempt may still have gone through
+    response = await send();
+  }
+  if ([502, 503, 504].includes(response.status)) response = await send();
 
   if (!response.ok) throw new Error('Failed to submit decision');
   return response.json();
 }
 
+// Long-polls a deferred consequence for up to `wait` seconds
+export async function fetchConsequence(handleId: string, wait = 10): Promise<ConsequenceHandle> {
+  const response = await fetch(`${API_BASE}/api/decisions/consequences/${handleId}?wait=${wait}`);
+  if (!response.ok) throw new Error('Failed to fetch consequence');
+  return response.json();
+}
+
 export async function generateScenario(data: {
   topic: string;
   category: string;
@@ -20,6 +20,16 @@ export interface Scenario {
   decision_points: DecisionPoint[];
 }
 
+export interface ScenarioSummary {
+  id: string;
+  title: string;
+  description: string;
+  category: string;
+  difficulty: string;
+  estimated_time: number;
+  num_decision_points: number;
+}
+
 export interface FrameworkAnalysis {
   utilitarian: string;
   deontological: string;
@@ -27,12 +37,39 @@ export interface FrameworkAnalysis {
   care_ethics: string;
 }
 
+export interface TriggeredConsequence {
+  text: string;
+  trigger_step: number;
+  trigger_choice: string;
+  appears_at_step: number;
+  degraded: boolean;
+}
+
+export interface ConsequenceHandle {
+  handle_id: string;
+  session_id: string;
+  trigger_step: number;
+  trigger_choice: string;
+  appears_at_step: number;
+  status: 'pending' | 'ready' | 'failed';
+  text: string | null;
+  error: string | null;
+  degraded: boolean;
+  created_at: number;
+  finished_at: number | null;
+}
+
 export interface DecisionResponse {
   session_id: string;
   analysis: FrameworkAnalysis;
   consequence: string | null;
   consequence_trigger_step: number | null; // NEW
   consequence_trigger_choice: string | null; // NEW
+  consequences: TriggeredConsequence[];
+  consequence_handles: ConsequenceHandle[];
   next_step: number | null;
   is_final: boolean;
+  // Set when the LLM was unavailable and stand-ins were served
+  degraded: boolean;
+  degraded_analysis: 'cached' | 'precomputed' | 'template' | null;
 }
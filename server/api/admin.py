@@ -1,7 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends
 from models.scenario import Scenario
 from services.scenario_engine import scenario_engine
-import json
+from services.framework_analyzer import framework_analyzer
+from services.history_compactor import history_compactor
+from services.consequence_generator import consequence_generator
+from services.precompute import precomputer, precomputed_store
+from services.llm_service import llm_service
+from services.speculative import speculative_prefetcher
+from services.consequence_delivery import consequence_delivery
+from services.submission_log import submission_log
+from services.fused_analysis import fused_analyzer
+from services.degraded_mode import degraded_fallback
+from services.topic_suggestions import topic_suggestions
+from services.scenario_generator import scenario_generator
+from database.repositories.user_session_repo import session_repo
+from database.repositories.scenario_repo import scenario_repo
+import asyncio
 import os
 
 router = APIRouter()
@@ -16,20 +30,17 @@ async def verify_admin_key(api_key: str):
 async def create_scenario(scenario: Scenario):
     """Create new scenario"""
     
-    # Load existing scenarios
-    scenarios_path = "data/scenarios.json"
-    with open(scenarios_path, 'r') as f:
-        data = json.load(f)
+    # Write only this scenario's record
+    try:
+        created = await asyncio.to_thread(scenario_repo.save, scenario, False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Add new scenario
-    data['scenarios'].append(scenario.dict())
+    if not created:
+        raise HTTPException(status_code=409, detail="Scenario already exists")
     
-    # Save
-    with open(scenarios_path, 'w') as f:
-        json.dump(data, f, indent=2)
-    
-    # Reload scenarios in engine
-    scenario_engine._load_scenarios()
+    # Index just the new scenario in the engine
+    scenario_engine.upsert_scenario(scenario)
     
     return {"message": "Scenario created", "id": scenario.id}
 
@@ -37,23 +48,21 @@ async def create_scenario(scenario: Scenario):
 async def update_scenario(scenario_id: str, scenario: Scenario):
     """Update existing scenario"""
     
-    scenarios_path = "data/scenarios.json"
-    with open(scenarios_path, 'r') as f:
-        data = json.load(f)
+    if scenario.id != scenario_id:
+        raise HTTPException(status_code=400, detail="Scenario ID does not match URL")
     
-    # Find and update
-    for i, s in enumerate(data['scenarios']):
-        if s['id'] == scenario_id:
-            data['scenarios'][i] = scenario.dict()
-            break
-    else:
+    if not scenario_engine.get_scenario(scenario_id):
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    # Save
-    with open(scenarios_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    try:
+        await asyncio.to_thread(scenario_repo.save, scenario)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    scenario_engine.upsert_scenario(scenario)
     
-    scenario_engine._load_scenarios()
+    # Regenerate only the precomputed subtrees whose prompts changed
+    precomputer.schedule_rebuild(scenario_id)
     
     return {"message": "Scenario updated"}
 
@@ -61,15 +70,61 @@ async def update_scenario(scenario_id: str, scenario: Scenario):
 async def delete_scenario(scenario_id: str):
     """Delete scenario"""
     
-    scenarios_path = "data/scenarios.json"
-    with open(scenarios_path, 'r') as f:
-        data = json.load(f)
+    try:
+        await asyncio.to_thread(scenario_repo.delete, scenario_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    data['scenarios'] = [s for s in data['scenarios'] if s['id'] != scenario_id]
+    scenario_engine.remove_scenario(scenario_id)
+    precomputed_store.delete(scenario_id)
+    
+    return {"message": "Scenario deleted"}
+
+@router.post("/precompute/{scenario_id}", status_code=202, dependencies=[Depends(verify_admin_key)])
+async def precompute_scenario(scenario_id: str):
+    """
+    Start building (or incrementally rebuilding) a scenario's precomputed artifact
     
-    with open(scenarios_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    Returns immediately; poll GET /precompute/{scenario_id} for the outcome
+    """
+    if not scenario_engine.get_scenario(scenario_id):
+        raise HTTPException(status_code=404, detail="Scenario not found")
     
-    scenario_engine._load_scenarios()
+    return precomputer.schedule_build(scenario_id)
+
+@router.get("/precompute/{scenario_id}", dependencies=[Depends(verify_admin_key)])
+async def get_precompute_status(scenario_id: str):
+    """Status of a scenario's latest precompute build, with its counts once finished"""
+    status = precomputer.build_status(scenario_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="No precompute build for this scenario")
     
-    return {"message": "Scenario deleted"}
\ No newline at end of file
+    return status
+
+@router.get("/cache/stats", dependencies=[Depends(verify_admin_key)])
+async def cache_stats():
+    """Hit/miss counters for the LLM response caches"""
+    return {
+        "framework_analysis": framework_analyzer.cache.stats(),
+        "analysis_parsing": framework_analyzer.stats(),
+        "consequences": consequence_generator.cache.stats(),
+        "fused_analysis": fused_analyzer.stats(),
+        "consequence_delivery": consequence_delivery.stats(),
+        "degraded_mode": degraded_fallback.stats(),
+        "history_compaction": history_compactor.stats(),
+        "sessions": session_repo.stats(),
+        "submissions": submission_log.stats(),
+        "llm": llm_service.stats(),
+        "topic_suggestions": topic_suggestions.stats(),
+        "scenario_generation": scenario_generator.stats(),
+        "speculative_prefetch": speculative_prefetcher.stats()
+    }
+
+@router.delete("/cache", dependencies=[Depends(verify_admin_key)])
+async def clear_cache():
+    """Drop all cached framework analyses and consequences, including degraded-mode stand-ins"""
+    framework_analyzer.cache.clear()
+    consequence_generator.cache.clear()
+    fused_analyzer.cache.clear()
+    degraded_fallback.clear()
+    return {"message": "Cache cleared"}
\ No newline at end of file
@@ -1,24 +1,50 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from contextlib import aclosing
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from services.framework_analyzer import framework_analyzer
 from services.consequence_generator import consequence_generator
 from services.scenario_engine import scenario_engine
+from services.precompute import precomputed_store
+from services.speculative import speculative_prefetcher
+from services.consequence_delivery import consequence_delivery, ConsequenceHandle
+from services.submission_log import submission_log, Submission
+from services.fused_analysis import fused_analyzer
+from services.degraded_mode import degraded_fallback
+from services.llm_resilience import LLMError
+from services.metrics import timed
+from database.repositories.user_session_repo import session_repo
 from models.analysis import FrameworkAnalysis
-from models.scenario import UserDecisionHistory
+from utils.sse import format_sse, SSE_HEADERS
+from utils.http_errors import llm_http_error
+from models.scenario import Scenario, ConsequenceRule, UserDecisionHistory
+import asyncio
+import json
 import uuid
 
 router = APIRouter()
 
-# In-memory session storage (replace with Redis/DB later)
-sessions: dict[str, UserDecisionHistory] = {}
+# Marks a response that was stored from an earlier identical submit
+REPLAY_HEADERS = {"Idempotent-Replayed": "true"}
 
 class DecisionSubmitRequest(BaseModel):
-    scenario_id: str
-    session_id: Optional[str] = None
+    # Lengths match the session tables' columns
+    scenario_id: str = Field(max_length=128)
+    session_id: Optional[str] = Field(None, max_length=64)
     step: int
-    choice_id: str
+    choice_id: str = Field(max_length=32)
     choice_text: str
+    # Return as soon as the analysis is ready; consequences still being
+    # generated come back as handles (see GET /consequences/{handle_id})
+    defer_consequences: bool = False
+
+class TriggeredConsequence(BaseModel):
+    text: str
+    trigger_step: int
+    trigger_choice: str
+    appears_at_step: int
+    degraded: bool = False  # the rule's template, served because generation failed
 
 class DecisionSubmitResponse(BaseModel):
     session_id: str
@@ -26,113 +52,646 @@ class DecisionSubmitResponse(BaseModel):
     consequence: Optional[str] = None
     consequence_trigger_step: Optional[int] = None  # NEW: Which step triggered this
     consequence_trigger_choice: Optional[str] = None  # NEW: What choice triggered this
+    consequences: List[TriggeredConsequence] = []  # Every consequence triggered at this step
+    consequence_handles: List[ConsequenceHandle] = []  # Deferred consequences not ready yet
     next_step: Optional[int] = None
     is_final: bool
+    # Set when the LLM failed and stand-ins were served (see services/degraded_mode.py)
+    degraded: bool = False
+    degraded_analysis: Optional[str] = None  # "cached", "precomputed" or "template"
 
-@router.post("/submit", response_model=DecisionSubmitResponse)
-async def submit_decision(request: DecisionSubmitRequest):
-    """
-    Submit a decision and get analysis + consequences with causal chain info
-    """
+class _SubmissionContext(BaseModel):
+    """State shared by the regular and streaming submit paths"""
+    session_id: str
+    session: UserDecisionHistory
+    position: int  # index of this step's choice in session.choices_made
+    scenario: Scenario
+    context: str
+    decision_history: List[str]
+    pinned: List[int] = []  # history positions kept verbatim if compacted
+    triggered_rules: List[ConsequenceRule] = []
+
+def _unavailable_analysis() -> FrameworkAnalysis:
+    """Placeholder analysis used when the analysis call fails"""
+    return FrameworkAnalysis(
+        utilitarian="Analysis unavailable",
+        deontological="Analysis unavailable",
+        virtue_ethics="Analysis unavailable",
+        care_ethics="Analysis unavailable",
+        raw_response=""
+    )
+
+async def _prepare_submission(request: DecisionSubmitRequest) -> _SubmissionContext:
+    """Record the choice and gather everything the LLM jobs need"""
+    
+    # Get scenario context
+    with timed("scenario"):
+        compiled = scenario_engine.get_compiled(request.scenario_id)
+        if not compiled:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        
+        scenario = compiled.scenario
+        decision_point = compiled.steps.get(request.step)
     
     # Get or create session
     session_id = request.session_id or str(uuid.uuid4())
     
-    if session_id not in sessions:
-        sessions[session_id] = UserDecisionHistory(
-            scenario_id=request.scenario_id,
-            session_id=session_id,
-            current_step=request.step,
-            choices_made=[]
+    with timed("session"):
+        session = await session_repo.get(session_id, revalidate=True)
+        if session is None:
+            session = session_repo.create(
+                scenario_id=request.scenario_id,
+                session_id=session_id,
+                current_step=request.step
+            )
+        
+        # A step is answered once; a repeat whose stored response has expired
+        # is analyzed again without recording the choice twice
+        position = next(
+            (i for i, c in enumerate(session.choices_made) if c["step"] == request.step),
+            None
         )
+        if position is None:
+            # Record choice (persisted in the background)
+            session_repo.append_choice(session, {
+                "step": request.step,
+                "choice_id": request.choice_id,
+                "choice_text": request.choice_text
+            })
+            position = len(session.choices_made) - 1
+            recorded = True
+        elif session.choices_made[position]["choice_id"] != request.choice_id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Step {request.step} was already answered with a different choice"
+            )
+        else:
+            recorded = False
+    
+    # Check for triggered consequences
+    triggered_rules = consequence_generator.check_consequence_triggers(
+        history=session,
+        current_step=request.step,
+        rules=compiled.rules_by_step.get(request.step, ())
+    )
     
-    session = sessions[session_id]
+    if recorded:
+        # Speculation for the choices not taken is now wasted work
+        speculative_prefetcher.on_choice(session_id, request.step, request.choice_id)
+        
+        # Consequences this choice sets up for later steps start generating now
+        if not precomputed_store.has(scenario.id):
+            consequence_delivery.pregenerate(
+                session, request.step, request.choice_id, scenario.description, scenario.consequence_rules
+            )
     
-    # Record choice
-    session.choices_made.append({
-        "step": request.step,
-        "choice_id": request.choice_id,
-        "choice_text": request.choice_text
-    })
-    session.current_step = request.step
+    earlier = session.choices_made[:position]
+    return _SubmissionContext(
+        session_id=session_id,
+        session=session,
+        position=position,
+        scenario=scenario,
+        context=decision_point.context if decision_point else scenario.description,
+        decision_history=[c["choice_text"] for c in earlier],
+        pinned=consequence_generator.pending_trigger_positions(
+            earlier, scenario.consequence_rules, request.step
+        ),
+        triggered_rules=triggered_rules
+    )
+
+async def _begin_submission(
+    request: DecisionSubmitRequest,
+    idempotency_key: Optional[str]
+) -> tuple[Optional[Submission], Optional[_SubmissionContext], Optional[Submission]]:
+    """
+    Either the earlier submission this one repeats, or the context and
+    log entry for a new one: (replay, None, None) or (None, ctx, entry)
     
-    # Get scenario context
-    scenario = scenario_engine.get_scenario(request.scenario_id)
-    if not scenario:
-        raise HTTPException(status_code=404, detail="Scenario not found")
+    Runs under the session's lock so concurrent submits are recorded one
+    at a time.
+    """
+    fingerprint = (request.scenario_id, request.step, request.choice_id)
     
-    decision_point = scenario_engine.get_decision_point(
-        request.scenario_id, 
-        request.step
+    async with submission_log.ordered(request.session_id, idempotency_key):
+        replay = submission_log.find(request.session_id, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay, None, None
+        
+        ctx = await _prepare_submission(request)
+        return None, ctx, submission_log.start(ctx.session_id, idempotency_key, fingerprint)
+
+def _choice_path(ctx: _SubmissionContext) -> List[str]:
+    """Choice IDs made so far, used to address precomputed artifacts"""
+    return [c["choice_id"] for c in ctx.session.choices_made[:ctx.position + 1]]
+
+def _precomputed_analysis(ctx: _SubmissionContext, request: DecisionSubmitRequest) -> Optional[FrameworkAnalysis]:
+    """Analysis from the offline artifact, if one matches these exact inputs"""
+    raw = precomputed_store.get_analysis(
+        ctx.scenario.id,
+        _choice_path(ctx),
+        framework_analyzer.cache_key(ctx.context, request.choice_text, ctx.decision_history, ctx.pinned)
     )
+    return framework_analyzer.build_analysis(raw) if raw else None
+
+async def _analyze(ctx: _SubmissionContext, request: DecisionSubmitRequest) -> FrameworkAnalysis:
+    """Framework analysis for this submission, precomputed when available"""
+    with timed("analysis"):
+        analysis = _precomputed_analysis(ctx, request)
+        if analysis:
+            return analysis
+        
+        return await framework_analyzer.analyze_decision(
+            choice=request.choice_text,
+            context=ctx.context,
+            decision_history=ctx.decision_history,
+            pinned=ctx.pinned
+        )
+
+async def _generate_consequence(ctx: _SubmissionContext, rule: ConsequenceRule) -> str:
+    """Triggered consequence for this submission, precomputed when available"""
+    consequence = precomputed_store.get_consequence(
+        ctx.scenario.id,
+        _choice_path(ctx),
+        rule,
+        consequence_generator.input_key(
+            rule, ctx.session, ctx.scenario.description, ctx.scenario.consequence_rules
+        )
+    )
+    if consequence:
+        return consequence
     
-    # Generate framework analysis
-    decision_history = [c["choice_text"] for c in session.choices_made[:-1]]
+    # Generated in the background when the trigger fired
+    pregenerated = consequence_delivery.take(ctx.session_id, rule)
+    if pregenerated is not None:
+        try:
+            return await pregenerated
+        except Exception as e:
+            print(f"Pre-generated consequence unavailable, generating now: {str(e)}")
     
-    analysis = await framework_analyzer.analyze_decision(
-        choice=request.choice_text,
-        context=decision_point.context if decision_point else scenario.description,
-        decision_history=decision_history
+    return await consequence_generator.generate_consequence(
+        rule=rule,
+        history=ctx.session,
+        context=ctx.scenario.description,
+        rules=ctx.scenario.consequence_rules
     )
+
+async def _generate_consequences(ctx: _SubmissionContext) -> list:
+    """Generate every triggered consequence concurrently (text or exception per rule)"""
+    with timed("consequences"):
+        return await asyncio.gather(
+            *(_generate_consequence(ctx, rule) for rule in ctx.triggered_rules),
+            return_exceptions=True
+        )
+
+def _fusable_rules(ctx: _SubmissionContext, request: DecisionSubmitRequest) -> List[ConsequenceRule]:
+    """Triggered rules to write in a fused call with the analysis (none if it doesn't apply)"""
+    if not fused_analyzer.enabled or not ctx.triggered_rules or precomputed_store.has(ctx.scenario.id):
+        return []
     
-    # Check for triggered consequences
-    consequence = None
-    trigger_step = None
-    trigger_choice = None
+    analysis_key = framework_analyzer.cache_key(ctx.context, request.choice_text, ctx.decision_history, ctx.pinned)
+    if framework_analyzer.cache.contains(analysis_key):
+        return []
     
-    triggered_rule = consequence_generator.check_consequence_triggers(
-        history=session,
-        current_step=request.step,
-        rules=scenario.consequence_rules
+    # Consequences already cached or pre-generated need no call at all
+    return [
+        rule for rule in ctx.triggered_rules
+        if not consequence_delivery.has(ctx.session_id, rule)
+        and not consequence_generator.cache.contains(consequence_generator.input_key(
+            rule, ctx.session, ctx.scenario.description, ctx.scenario.consequence_rules
+        ))
+    ]
+
+async def _analyze_fused(
+    ctx: _SubmissionContext,
+    request: DecisionSubmitRequest,
+    fused_rules: List[ConsequenceRule]
+) -> tuple:
+    """
+    Analysis and consequences with one LLM call for fused_rules
+    
+    Returns (analysis result, consequence results) like running _analyze
+    and _generate_consequences side by side. Whatever a completed fused
+    call does not deliver is then generated the two-call way; if the call
+    itself fails with an LLM error, its parts fail with it.
+    """
+    others = [rule for rule in ctx.triggered_rules if rule not in fused_rules]
+    
+    async def fused():
+        with timed("fused"):
+            try:
+                return await fused_analyzer.analyze(
+                    context=ctx.context,
+                    scenario_context=ctx.scenario.description,
+                    choice=request.choice_text,
+                    history=ctx.session,
+                    position=ctx.position,
+                    pinned=ctx.pinned,
+                    triggered=fused_rules
+                )
+            except LLMError as e:
+                # Already retried; separate calls would fail the same way, so
+                # the failure goes to the degraded path (or the error response)
+                return e, [e] * len(fused_rules)
+            except Exception as e:
+                print(f"Fused analysis failed, falling back to separate calls: {str(e)}")
+                return None, [None] * len(fused_rules)
+    
+    (analysis, texts), other_results = await asyncio.gather(
+        fused(),
+        asyncio.gather(*(_generate_consequence(ctx, rule) for rule in others), return_exceptions=True)
     )
     
-    if triggered_rule:
-        consequence = await consequence_generator.generate_consequence(
-            rule=triggered_rule,
-            history=session,
-            context=scenario.description
+    # Rules are looked up by identity; they all come from ctx.triggered_rules
+    results = dict(zip(map(id, fused_rules), texts))
+    results.update(zip(map(id, others), other_results))
+    
+    missing = [rule for rule in fused_rules if results[id(rule)] is None]
+    jobs = [_generate_consequence(ctx, rule) for rule in missing]
+    if analysis is None:
+        jobs.append(_analyze(ctx, request))
+    retried = await asyncio.gather(*jobs, return_exceptions=True)
+    
+    if analysis is None:
+        analysis = retried.pop()
+    results.update(zip(map(id, missing), retried))
+    return analysis, [results[id(rule)] for rule in ctx.triggered_rules]
+
+def _resolve_analysis(
+    ctx: _SubmissionContext,
+    request: DecisionSubmitRequest,
+    analysis_result,
+    partial: bool
+) -> tuple[FrameworkAnalysis, Optional[str]]:
+    """
+    The analysis to send and, if it is a degraded-mode stand-in, its source
+
+    A failed LLM call gets a stand-in; any other failure is an error
+    unless ``partial`` (something else is being returned).
+    """
+    if not isinstance(analysis_result, Exception):
+        degraded_fallback.remember(ctx.scenario.id, request.step, request.choice_id, analysis_result)
+        return analysis_result, None
+    
+    if degraded_fallback.applies(analysis_result):
+        print(f"Analysis failed, serving a degraded analysis: {str(analysis_result)}")
+        return degraded_fallback.analysis(ctx.scenario.id, request.step, _choice_path(ctx), request.choice_text)
+    
+    if not partial:
+        raise llm_http_error(analysis_result, f"Failed to analyze decision: {str(analysis_result)}")
+    
+    print(f"Analysis failed, returning consequences only: {str(analysis_result)}")
+    return _unavailable_analysis(), None
+
+def _resolve_results(
+    ctx: _SubmissionContext,
+    request: DecisionSubmitRequest,
+    analysis_result,
+    consequence_results: list
+) -> tuple[FrameworkAnalysis, Optional[str], List[tuple[ConsequenceRule, str, bool]]]:
+    """
+    Apply partial-failure rules to the LLM results
+
+    The analysis and the consequences may fail independently, but not all
+    of them; in degraded mode failed LLM calls get stand-ins instead.
+    Results are the value returned by each job or the exception it raised;
+    consequence_results lines up with ctx.triggered_rules. Returns the
+    analysis, its stand-in source (if any) and (rule, text, degraded) per
+    consequence.
+    """
+    consequences = []
+    for rule, result in zip(ctx.triggered_rules, consequence_results):
+        if not isinstance(result, Exception):
+            consequences.append((rule, result, False))
+        elif degraded_fallback.applies(result):
+            print(f"Consequence generation failed, serving its template: {str(result)}")
+            consequences.append((rule, degraded_fallback.consequence(rule), True))
+        else:
+            print(f"Consequence generation failed, returning analysis only: {str(result)}")
+    
+    analysis, source = _resolve_analysis(ctx, request, analysis_result, partial=bool(consequences))
+    return analysis, source, consequences
+
+def _deliver_consequences(ctx: _SubmissionContext) -> List[ConsequenceHandle]:
+    """Start every triggered consequence detached from the request (deferred mode)"""
+    return [
+        consequence_delivery.deliver(
+            ctx.session_id,
+            rule,
+            _trigger_choice_text(ctx, rule),
+            lambda rule=rule: _generate_consequence(ctx, rule),
+            lambda error, rule=rule: degraded_fallback.consequence(rule) if degraded_fallback.applies(error) else None
         )
-        
-        # Store trigger information for causal chain visualization
-        trigger_step = triggered_rule.trigger_step
-        
-        # Find the actual choice text that triggered this consequence
-        for choice in session.choices_made:
-            if choice['step'] == trigger_step and choice['choice_id'] == triggered_rule.trigger_choice:
-                trigger_choice = choice['choice_text']
-                break
-        
-        # Fallback if not found (shouldn't happen, but safety)
-        if not trigger_choice:
-            trigger_choice = f"Choice {triggered_rule.trigger_choice} at step {trigger_step}"
+        for rule in ctx.triggered_rules
+    ]
+
+def _resolve_deferred(
+    ctx: _SubmissionContext,
+    request: DecisionSubmitRequest,
+    analysis_result,
+    handles: List[ConsequenceHandle]
+) -> tuple[FrameworkAnalysis, Optional[str], List[tuple[ConsequenceRule, str, bool]], List[ConsequenceHandle]]:
+    """
+    Deferred-mode counterpart of _resolve_results
+
+    Consequences that are ready go into the response as usual; the rest
+    are returned as pending handles. A failed analysis is only an error if
+    no consequence is ready or still on its way and no stand-in applies.
+    """
+    consequences = [
+        (rule, handle.text, handle.degraded)
+        for rule, handle in zip(ctx.triggered_rules, handles)
+        if handle.status == "ready"
+    ]
+    pending = [handle for handle in handles if not handle.done]
+    
+    analysis, source = _resolve_analysis(ctx, request, analysis_result, partial=bool(consequences or pending))
+    return analysis, source, consequences, pending
+
+def _trigger_choice_text(ctx: _SubmissionContext, rule: ConsequenceRule) -> str:
+    """Text of the choice that triggered a rule, for causal chain visualization"""
+    for choice in ctx.session.choices_made:
+        if choice['step'] == rule.trigger_step and choice['choice_id'] == rule.trigger_choice:
+            return choice['choice_text']
+    
+    # Fallback if not found (shouldn't happen, but safety)
+    return f"Choice {rule.trigger_choice} at step {rule.trigger_step}"
+
+def _build_response(
+    ctx: _SubmissionContext,
+    request: DecisionSubmitRequest,
+    analysis: FrameworkAnalysis,
+    analysis_source: Optional[str],
+    consequences: List[tuple[ConsequenceRule, str, bool]],
+    handles: List[ConsequenceHandle] = []
+) -> DecisionSubmitResponse:
+    """Assemble the submit response with causal chain info"""
+    triggered = [
+        TriggeredConsequence(
+            text=text,
+            trigger_step=rule.trigger_step,
+            trigger_choice=_trigger_choice_text(ctx, rule),
+            appears_at_step=rule.appears_at_step,
+            degraded=degraded
+        )
+        for rule, text, degraded in consequences
+    ]
     
     # Determine next step
     is_final = scenario_engine.is_final_step(request.scenario_id, request.step)
-    next_step = None if is_final else request.step + 1
+    next_step = None if is_final else scenario_engine.get_next_step_number(request.scenario_id, request.step)
+    
+    # The single-consequence fields carry the first consequence
+    first = triggered[0] if triggered else None
     
     return DecisionSubmitResponse(
-        session_id=session_id,
+        session_id=ctx.session_id,
         analysis=analysis,
-        consequence=consequence,
-        consequence_trigger_step=trigger_step,  # NEW
-        consequence_trigger_choice=trigger_choice,  # NEW
+        consequence=first.text if first else None,
+        consequence_trigger_step=first.trigger_step if first else None,  # NEW
+        consequence_trigger_choice=first.trigger_choice if first else None,  # NEW
+        consequences=triggered,
+        consequence_handles=handles,
         next_step=next_step,
-        is_final=is_final
+        is_final=is_final,
+        degraded=analysis_source is not None or any(c.degraded for c in triggered),
+        degraded_analysis=analysis_source
+    )
+
+async def _run_submission(ctx: _SubmissionContext, request: DecisionSubmitRequest) -> tuple[str, bool]:
+    """LLM work for a recorded submission; returns the serialized response and whether it is degraded"""
+    if request.defer_consequences:
+        handles = _deliver_consequences(ctx)
+        try:
+            analysis_result = await _analyze(ctx, request)
+        except Exception as e:
+            analysis_result = e
+        
+        analysis, source, consequences, pending = _resolve_deferred(ctx, request, analysis_result, handles)
+    else:
+        fused_rules = _fusable_rules(ctx, request)
+        if fused_rules:
+            analysis_result, consequence_results = await _analyze_fused(ctx, request, fused_rules)
+        else:
+            # Analysis and consequences are independent LLM jobs, so run them
+            # concurrently. gather() cancels all of them if the client goes away.
+            analysis_result, consequence_results = await asyncio.gather(
+                _analyze(ctx, request),
+                _generate_consequences(ctx),
+                return_exceptions=True
+            )
+        
+        analysis, source, consequences = _resolve_results(ctx, request, analysis_result, consequence_results)
+        pending = []
+    
+    # Serialized here (the model is already validated) so it shows up in Server-Timing
+    with timed("serialize"):
+        response = _build_response(ctx, request, analysis, source, consequences, pending)
+        return response.model_dump_json(), response.degraded
+
+@router.post("/submit", response_model=DecisionSubmitResponse)
+async def submit_decision(
+    request: DecisionSubmitRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    """
+    Submit a decision and get analysis + consequences with causal chain info
+    
+    With ``defer_consequences`` the response is sent as soon as the analysis
+    is ready; consequences still being generated are listed in
+    ``consequence_handles``.
+    
+    Safe to retry: a submit with the same ``Idempotency-Key``, or for a step
+    this session already answered with the same choice, returns the stored
+    response (marked ``Idempotent-Replayed``) without running again.
+    
+    If the LLM is unavailable the response carries stand-ins (see
+    services/degraded_mode.py) and ``degraded`` is set; it is not stored,
+    so a retry once the LLM is back gets a real analysis.
+    """
+    replay, ctx, entry = await _begin_submission(request, idempotency_key)
+    if replay is not None:
+        return Response(content=await replay.body(), media_type="application/json", headers=REPLAY_HEADERS)
+    
+    try:
+        body, degraded = await _run_submission(ctx, request)
+    except BaseException as e:
+        submission_log.fail(entry, e)
+        raise
+    
+    submission_log.complete(entry, body, replayable=not degraded)
+    return Response(content=body, media_type="application/json")
+
+async def _stream_submission(ctx: _SubmissionContext, request: DecisionSubmitRequest, entry: Submission):
+    """SSE events for a recorded submission (see submit_decision_stream)"""
+    # Consequences run alongside the streamed analysis
+    consequence_task = None
+    handles = None
+    if request.defer_consequences:
+        handles = _deliver_consequences(ctx)
+    elif ctx.triggered_rules:
+        consequence_task = asyncio.create_task(_generate_consequences(ctx))
+    
+    try:
+        analysis_result = _precomputed_analysis(ctx, request)
+        if analysis_result:
+            for field in framework_analyzer.FIELD_NAMES.values():
+                yield format_sse("section", {"framework": field, "text": getattr(analysis_result, field)})
+        else:
+            try:
+                async for event in framework_analyzer.stream_analysis(
+                    choice=request.choice_text,
+                    context=ctx.context,
+                    decision_history=ctx.decision_history,
+                    pinned=ctx.pinned
+                ):
+                    if event["type"] == "analysis":
+                        analysis_result = event["analysis"]
+                    else:
+                        yield format_sse(event.pop("type"), event)
+            except Exception as e:
+                analysis_result = e
+        
+        if handles is not None:
+            analysis, source, consequences, pending = _resolve_deferred(ctx, request, analysis_result, handles)
+        else:
+            consequence_results = await consequence_task if consequence_task else []
+            analysis, source, consequences = _resolve_results(ctx, request, analysis_result, consequence_results)
+            pending = []
+        
+        if source is not None:
+            # The stand-in replaces whatever streamed before the failure
+            for field in framework_analyzer.FIELD_NAMES.values():
+                yield format_sse("section", {"framework": field, "text": getattr(analysis, field)})
+        
+        response = _build_response(ctx, request, analysis, source, consequences, pending)
+        submission_log.complete(entry, response.model_dump_json(), replayable=not response.degraded)
+        yield format_sse("result", response.model_dump(mode="json"))
+        
+        # Push the deferred consequences as they arrive
+        async for handle in consequence_delivery.events(ctx.session_id, [h.handle_id for h in pending]):
+            yield format_sse("consequence", handle.model_dump(mode="json"))
+    
+    except HTTPException as e:
+        submission_log.fail(entry, e)
+        yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    finally:
+        # Client went away mid-stream: stop the consequences too
+        if consequence_task and not consequence_task.done():
+            consequence_task.cancel()
+        if not entry.done:
+            submission_log.fail(entry, asyncio.CancelledError())
+
+async def _stream_replay(replay: Submission):
+    """SSE events for a repeated submit, rebuilt from the stored response"""
+    try:
+        response = json.loads(await replay.body())
+    except HTTPException as e:
+        yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+        return
+    
+    for field in framework_analyzer.FIELD_NAMES.values():
+        yield format_sse("section", {"framework": field, "text": response["analysis"][field]})
+    yield format_sse("result", response)
+    
+    pending = [h["handle_id"] for h in response["consequence_handles"]]
+    async for handle in consequence_delivery.events(response["session_id"], pending):
+        yield format_sse("consequence", handle.model_dump(mode="json"))
+
+@router.post("/submit/stream")
+async def submit_decision_stream(
+    request: DecisionSubmitRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    """
+    Streaming variant of /submit over Server-Sent Events
+    
+    Events:
+        token: {"text": ...} analysis text as it is generated
+        section: {"framework": ..., "text": ...} once a framework is complete
+        result: the full DecisionSubmitResponse
+        consequence: a ConsequenceHandle as each deferred consequence finishes
+            (``defer_consequences`` only; sent after the result)
+        error: {"status_code": ..., "detail": ...}
+    
+    A repeated submit (see /submit) gets the stored analysis as ``section``
+    events followed by the stored ``result``.
+    
+    If the analysis fails in degraded mode, the stand-in analysis is sent
+    as ``section`` events before the (``degraded``) ``result``.
+    """
+    if not scenario_engine.get_compiled(request.scenario_id):
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    
+    async def events():
+        # The choice is only recorded once the stream is actually consumed
+        try:
+            replay, ctx, entry = await _begin_submission(request, idempotency_key)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        
+        stream = _stream_replay(replay) if replay is not None else _stream_submission(ctx, request, entry)
+        # Close the inner stream with this one so its cleanup runs on disconnect
+        async with aclosing(stream):
+            async for event in stream:
+                yield event
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
 
 @router.get("/session/{session_id}")
 async def get_session(session_id: str):
     """Get session history"""
-    if session_id not in sessions:
+    session = await session_repo.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return sessions[session_id]
+    return session
 
 @router.delete("/session/{session_id}")
 async def delete_session(session_id: str):
     """Clear session (for restart functionality)"""
-    if session_id in sessions:
-        del sessions[session_id]
+    consequence_delivery.forget_session(session_id)
+    submission_log.forget_session(session_id)
+    if await session_repo.delete(session_id):
         return {"message": "Session cleared"}
     
-    raise HTTPException(status_code=404, detail="Session not found")
\ No newline at end of file
+    raise HTTPException(status_code=404, detail="Session not found")
+
+@router.get("/consequences/{handle_id}", response_model=ConsequenceHandle)
+async def get_consequence(handle_id: str, wait: float = Query(0, ge=0, le=30)):
+    """
+    Poll a deferred consequence
+    
+    With ``wait`` the request is held for up to that many seconds until the
+    consequence is ready (long polling).
+    """
+    handle = await consequence_delivery.wait(handle_id, wait)
+    if handle is None:
+        raise HTTPException(status_code=404, detail="Consequence not found")
+    
+    return handle
+
+@router.get("/session/{session_id}/consequences/stream")
+async def stream_consequences(session_id: str):
+    """
+    Follow a session's pending deferred consequences over Server-Sent Events
+    
+    Sends one ``consequence`` event (a ConsequenceHandle) per consequence as
+    it finishes, then ``done``.
+    """
+    pending = [h.handle_id for h in consequence_delivery.pending(session_id)]
+    
+    async def events():
+        async for handle in consequence_delivery.events(session_id, pending):
+            yield format_sse("consequence", handle.model_dump(mode="json"))
+        yield format_sse("done", {"session_id": session_id})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
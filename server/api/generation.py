@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from services.scenario_generator import scenario_generator
 from services.scenario_engine import scenario_engine
-from services.llm_service import llm_service
+from services.topic_suggestions import topic_suggestions
+from services.batch_jobs import batch_job_manager
+from database.repositories.scenario_repo import scenario_repo
 from models.scenario import Scenario
-import json
+from utils.sse import format_sse, SSE_HEADERS
+from utils.http_errors import llm_http_error
+import asyncio
 
 router = APIRouter()
 
@@ -23,6 +28,7 @@ class BatchGenerateRequest(BaseModel):
     topics: list[str]
     category: str
     difficulty: str = "intermediate"
+    save_to_library: bool = False
 
 @router.post("/generate", response_model=GenerateScenarioResponse)
 async def generate_scenario(request: GenerateScenarioRequest):
@@ -45,22 +51,9 @@ async def generate_scenario(request: GenerateScenarioRequest):
         
         saved = False
         if request.save_to_library:
-            # Save to scenarios.json
-            scenarios_path = "data/scenarios.json"
-            
-            try:
-                with open(scenarios_path, 'r') as f:
-                    data = json.load(f)
-            except FileNotFoundError:
-                data = {"scenarios": []}
-            
-            data['scenarios'].append(scenario.model_dump())
-            
-            with open(scenarios_path, 'w') as f:
-                json.dump(data, f, indent=2)
-            
-            # Reload scenarios
-            scenario_engine._load_scenarios()
+            # Write just this scenario's record and index it
+            await asyncio.to_thread(scenario_repo.save, scenario)
+            scenario_engine.upsert_scenario(scenario)
             saved = True
         
         return GenerateScenarioResponse(
@@ -69,33 +62,135 @@ async def generate_scenario(request: GenerateScenarioRequest):
         )
     
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to generate scenario: {str(e)}"
-        )
+        raise llm_http_error(e, f"Failed to generate scenario: {str(e)}")
 
-@router.post("/generate/batch")
-async def generate_batch(request: BatchGenerateRequest):
-    """Generate multiple scenarios at once"""
+@router.post("/generate/stream")
+async def generate_scenario_stream(request: GenerateScenarioRequest):
+    """
+    Generate a scenario progressively over Server-Sent Events
     
-    try:
-        scenarios = await scenario_generator.generate_multiple(
-            topics=request.topics,
-            category=request.category,
-            difficulty=request.difficulty
-        )
+    With ``save_to_library`` each step is published to the scenario engine
+    as soon as it is generated, so the scenario can be played from step 1
+    while later steps are still on their way; the finished scenario is
+    then saved to the library. A scenario that fails is unpublished.
+    
+    Events:
+        header: {"scenario_id", "title", "description", ...} once known
+        decision_point: {"scenario_id", "decision_point"} each step, in order
+        repair: {"attempt", "missing_steps"} before a missing tail is requested
+        result: GenerateScenarioResponse
+        error: {"status_code": ..., "detail": ...}
+    """
+    async def events():
+        published = None
+        finished = False
+        try:
+            async for event in scenario_generator.stream_scenario(
+                topic=request.topic,
+                category=request.category,
+                difficulty=request.difficulty,
+                num_decision_points=request.num_decision_points
+            ):
+                kind = event["type"]
+                
+                if kind == "scenario":
+                    scenario = event["scenario"]
+                    if request.save_to_library:
+                        await asyncio.to_thread(scenario_repo.save, scenario)
+                        scenario_engine.upsert_scenario(scenario)
+                    finished = True
+                    response = GenerateScenarioResponse(scenario=scenario, saved=request.save_to_library)
+                    yield format_sse("result", response.model_dump(mode="json"))
+                    return
+                
+                if kind == "header":
+                    yield format_sse("header", {
+                        "scenario_id": event["scenario"].id,
+                        **event["scenario"].model_dump(mode="json", exclude={"id", "decision_points", "consequence_rules"})
+                    })
+                elif kind == "decision_point":
+                    if request.save_to_library:
+                        # Playable now; the remaining steps count as coming
+                        published = event["scenario"].id
+                        scenario_engine.upsert_scenario(event["scenario"], final_step=request.num_decision_points)
+                    yield format_sse("decision_point", {
+                        "scenario_id": event["scenario"].id,
+                        "decision_point": event["decision_point"].model_dump(mode="json")
+                    })
+                else:
+                    yield format_sse(kind, {k: v for k, v in event.items() if k != "type"})
         
-        return {
-            "generated": len(scenarios),
-            "requested": len(request.topics),
-            "scenarios": scenarios
-        }
+        except Exception as e:
+            error = llm_http_error(e, f"Failed to generate scenario: {str(e)}")
+            yield format_sse("error", {"status_code": error.status_code, "detail": error.detail})
+        finally:
+            # Failed or abandoned mid-way: don't leave a half scenario playable
+            if published and not finished:
+                scenario_engine.remove_scenario(published)
     
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Batch generation failed: {str(e)}"
-        )
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/generate/batch", status_code=202)
+async def generate_batch(request: BatchGenerateRequest):
+    """
+    Start generating multiple scenarios in the background
+    
+    Returns a job ID immediately; follow progress with
+    GET /generate/batch/{job_id} or GET /generate/batch/{job_id}/stream
+    """
+    if not request.topics:
+        raise HTTPException(status_code=400, detail="No topics given")
+    
+    job = batch_job_manager.submit(
+        topics=request.topics,
+        category=request.category,
+        difficulty=request.difficulty,
+        save_to_library=request.save_to_library
+    )
+    
+    return batch_job_manager.summary(job)
+
+@router.get("/generate/batch/{job_id}")
+async def get_batch_status(job_id: str, since: int = 0):
+    """Poll a batch job; returns scenarios finished after index `since`"""
+    job = batch_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    
+    return {
+        **batch_job_manager.summary(job),
+        "scenarios": job.scenarios[since:],
+        "failures": job.failed
+    }
+
+@router.get("/generate/batch/{job_id}/stream")
+async def stream_batch(job_id: str):
+    """
+    Stream a batch job over Server-Sent Events
+    
+    Events:
+        scenario: a generated Scenario, as soon as it finishes
+        failed: {"topic": ..., "error": ..., "attempts": ...}
+        done: final job summary
+    """
+    if not batch_job_manager.get(job_id):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    
+    async def events():
+        async for event, data in batch_job_manager.events(job_id):
+            yield format_sse(event, data)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.delete("/generate/batch/{job_id}")
+async def cancel_batch(job_id: str):
+    """Cancel a running batch job (finished scenarios are kept)"""
+    if not batch_job_manager.get(job_id):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    
+    cancelled = await batch_job_manager.cancel(job_id)
+    
+    return {"message": "Batch job cancelled" if cancelled else "Batch job already finished"}
 
 @router.post("/refine/{scenario_id}")
 async def refine_scenario(scenario_id: str, feedback: str):
@@ -114,42 +209,19 @@ async def refine_scenario(scenario_id: str, feedback: str):
         return {"scenario": refined}
     
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to refine scenario: {str(e)}"
-        )
+        raise llm_http_error(e, f"Failed to refine scenario: {str(e)}")
 
 @router.get("/suggestions")
-async def get_topic_suggestions(category: str):
-    """Get AI-generated topic suggestions"""
-    
-    system_prompt = "You suggest ethical dilemma topics for training scenarios. Output only a JSON array of strings."
+async def get_topic_suggestions(category: str, count: int = Query(10, ge=1, le=20)):
+    """
+    Get AI-generated topic suggestions
     
-    user_prompt = f"""Suggest 10 compelling ethical dilemma topics for the {category} category.
-
-Topics should be:
-- Realistic and relevant to modern professionals
-- Morally complex with no easy answers
-- Suitable for training and education
-- Culturally sensitive
-
-Output format: ["topic 1", "topic 2", ...]"""
-
+    Served from a per-category pool that is filled in the background;
+    successive requests get different topics.
+    """
     try:
-        response = await llm_service.generate_completion(
-            prompt=user_prompt,
-            system_prompt=system_prompt,
-            temperature=0.9,
-            max_tokens=500
-        )
-        
-        cleaned = response.strip().replace("```json", "").replace("```", "").strip()
-        topics = json.loads(cleaned)
-        
+        topics = await topic_suggestions.suggest(category, count)
         return {"category": category, "topics": topics}
     
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to generate suggestions: {str(e)}"
-        )
\ No newline at end of file
+        raise llm_http_error(e, f"Failed to generate suggestions: {str(e)}")
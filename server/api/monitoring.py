@@ -0,0 +1,150 @@
+# GET /metrics and /health
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from services.metrics import registry
+from services.llm_service import llm_service
+from services.framework_analyzer import framework_analyzer
+from services.consequence_generator import consequence_generator
+from services.history_compactor import history_compactor
+from services.scenario_engine import scenario_engine
+from services.speculative import speculative_prefetcher
+from services.degraded_mode import degraded_fallback
+from database.repositories.user_session_repo import session_repo
+import config
+
+router = APIRouter()
+
+_caches = {
+    "framework_analysis": framework_analyzer.cache,
+    "consequences": consequence_generator.cache
+}
+
+
+def _cache_lookups() -> dict:
+    values = {}
+    for name, cache in _caches.items():
+        values[(name, "memory_hit")] = cache.memory_hits
+        values[(name, "disk_hit")] = cache.disk_hits
+        values[(name, "miss")] = cache.misses
+    values[("sessions", "memory_hit")] = session_repo.cache_hits
+    values[("sessions", "miss")] = session_repo.cache_misses
+    return values
+
+
+def _cache_hit_ratio() -> dict:
+    values = {(name, ): cache.stats()["hit_ratio"] for name, cache in _caches.items()}
+    lookups = session_repo.cache_hits + session_repo.cache_misses
+    values[("sessions", )] = session_repo.cache_hits / lookups if lookups else 0.0
+    return values
+
+
+# Counters kept by the services themselves, read at scrape time
+registry.gauge(
+    "dilemma_cache_lookups_total", "Cache lookups by outcome",
+    _cache_lookups, ("cache", "result"), kind="counter"
+)
+registry.gauge("dilemma_cache_hit_ratio", "Cache hit ratio since start", _cache_hit_ratio, ("cache", ))
+registry.gauge(
+    "dilemma_cache_entries", "Entries held in memory",
+    lambda: {(name, ): cache.stats()["entries"] for name, cache in _caches.items()}, ("cache", )
+)
+registry.gauge("dilemma_llm_active_calls", "LLM calls holding a concurrency slot", lambda: llm_service.active_calls)
+registry.gauge("dilemma_llm_inflight_requests", "Distinct in-flight LLM completions", lambda: llm_service.stats()["in_flight"])
+registry.gauge(
+    "dilemma_llm_requests_total", "LLM completions sent upstream or coalesced onto one in flight",
+    lambda: {("upstream", ): llm_service.upstream_calls, ("coalesced", ): llm_service.coalesced_calls},
+    ("result", ), kind="counter"
+)
+registry.gauge("dilemma_llm_retries_total", "LLM call retries", lambda: llm_service.retries, kind="counter")
+registry.gauge(
+    "dilemma_llm_rate_limited_total", "429 responses from the LLM provider",
+    lambda: llm_service.limiter.rate_limited, kind="counter"
+)
+registry.gauge(
+    "dilemma_llm_circuit_state", "1 for the circuit breaker's current state",
+    lambda: {(state, ): int(llm_service.breaker.state == state) for state in ("closed", "open", "half_open")},
+    ("state", )
+)
+registry.gauge(
+    "dilemma_llm_queued_calls", "LLM calls waiting for a slot, by priority class",
+    lambda: {(name, ): c["queued_now"] for name, c in llm_service.admission.stats()["classes"].items()},
+    ("class", )
+)
+registry.gauge(
+    "dilemma_llm_shed_total", "LLM calls shed by admission control (queue full or wait exceeded)",
+    lambda: {
+        (name, reason): c[reason]
+        for name, c in llm_service.admission.stats()["classes"].items()
+        for reason in ("shed", "expired")
+    },
+    ("class", "reason"), kind="counter"
+)
+registry.gauge(
+    "dilemma_degraded_responses_total", "Stand-ins served for failed LLM calls on submits, by source",
+    lambda: {(source, ): count for source, count in degraded_fallback.served.items()},
+    ("source", ), kind="counter"
+)
+registry.gauge(
+    "dilemma_analysis_parse_total", "Fresh analyses by how they were parsed",
+    lambda: {
+        ("json", ): framework_analyzer.parsed_json,
+        ("heuristic", ): framework_analyzer.parsed_heuristic,
+        ("failed", ): framework_analyzer.parse_failures
+    },
+    ("result", ), kind="counter"
+)
+registry.gauge(
+    "dilemma_history_tokens_total", "Decision history tokens before and after compaction",
+    lambda: {("before", ): history_compactor.tokens_before, ("after", ): history_compactor.tokens_after},
+    ("stage", ), kind="counter"
+)
+registry.gauge("dilemma_scenarios_loaded", "Scenarios in the catalogue", lambda: len(scenario_engine.scenarios))
+registry.gauge("dilemma_sessions_cached", "Sessions held in the hot cache", lambda: session_repo.stats()["cached_sessions"])
+registry.gauge("dilemma_session_pending_writes", "Session writes waiting to be flushed", lambda: session_repo.stats()["pending_writes"])
+registry.gauge(
+    "dilemma_speculative_calls_total", "Speculative prefetch LLM calls by outcome",
+    lambda: {
+        ("scheduled", ): speculative_prefetcher.scheduled_calls,
+        ("cancelled", ): speculative_prefetcher.cancelled,
+        ("failed", ): speculative_prefetcher.failed
+    },
+    ("result", ), kind="counter"
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of latency histograms, token counts and counters"""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/health")
+async def health_check():
+    """
+    Readiness of the worker's dependencies
+
+    ``unhealthy`` (503) when the database does not answer or no scenarios
+    are loaded; ``degraded`` while the LLM circuit breaker is not closed
+    (cached and precomputed content is still served).
+    """
+    database = await session_repo.ping(config.HEALTH_DB_TIMEOUT_SECONDS)
+    checks = {
+        "database": "ok" if database else "unreachable",
+        "session_flusher": "ok" if session_repo.flushing else "stopped",
+        "scenarios": len(scenario_engine.scenarios),
+        "llm": llm_service.breaker.state
+    }
+
+    if not database or not checks["scenarios"]:
+        status = "unhealthy"
+    elif llm_service.degraded or not session_repo.flushing:
+        status = "degraded"
+    else:
+        status = "healthy"
+
+    return JSONResponse(
+        status_code=503 if status == "unhealthy" else 200,
+        content={"status": status, "checks": checks}
+    )
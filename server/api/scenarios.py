@@ -1,15 +1,134 @@
 # GET /scenarios
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response
 from services.scenario_engine import scenario_engine
-from models.scenario import Scenario, DecisionPoint
-from typing import List
+from services.speculative import speculative_prefetcher
+from database.repositories.user_session_repo import session_repo
+from models.scenario import Scenario, ScenarioSummary, DecisionPoint
+from collections import OrderedDict
+from typing import List, Literal, Optional, Union
+import base64
+import binascii
+import hashlib
 
 router = APIRouter()
 
-@router.get("/", response_model=List[Scenario])
-async def list_scenarios():
-    """Get all available scenarios"""
-    return scenario_engine.list_scenarios()
+# Rendered listing pages for the current catalogue version
+LISTING_CACHE_MAX_ENTRIES = 256
+_listing_cache: "OrderedDict[tuple, tuple[bytes, str, Optional[str]]]" = OrderedDict()
+_listing_cache_version = -1
+
+
+def _encode_cursor(scenario_id: str) -> str:
+    return base64.urlsafe_b64encode(scenario_id.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _render_listing(
+    view: str,
+    category: Optional[str],
+    difficulty: Optional[str],
+    cursor: Optional[str],
+    limit: Optional[int]
+) -> tuple[bytes, str, Optional[str]]:
+    """
+    Serialized page, strong ETag and next cursor for a listing query
+
+    Pages are keyset-paginated by scenario ID and memoized until the
+    catalogue version changes.
+    """
+    global _listing_cache_version
+
+    if _listing_cache_version != scenario_engine.version:
+        _listing_cache.clear()
+        _listing_cache_version = scenario_engine.version
+
+    key = (view, category, difficulty, cursor, limit)
+    cached = _listing_cache.get(key)
+    if cached is not None:
+        _listing_cache.move_to_end(key)
+        return cached
+
+    after = _decode_cursor(cursor) if cursor else None
+    page = []
+    has_more = False
+    for compiled in scenario_engine.list_compiled():
+        summary = compiled.summary
+        if after is not None and summary.id <= after:
+            continue
+        if category and summary.category.lower() != category:
+            continue
+        if difficulty and summary.difficulty.lower() != difficulty:
+            continue
+        if limit is not None and len(page) == limit:
+            has_more = True
+            break
+        page.append(compiled)
+
+    body = b"[" + b",".join(
+        c.summary_json if view == "summary" else c.full_json for c in page
+    ) + b"]"
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    next_cursor = _encode_cursor(page[-1].scenario.id) if has_more else None
+
+    _listing_cache[key] = (body, etag, next_cursor)
+    if len(_listing_cache) > LISTING_CACHE_MAX_ENTRIES:
+        _listing_cache.popitem(last=False)
+    return body, etag, next_cursor
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+# Either view is a plain list; the next-page cursor travels in headers
+@router.get(
+    "/",
+    response_model=Union[List[Scenario], List[ScenarioSummary]],
+    responses={304: {"description": "Not Modified (If-None-Match matched the ETag)"}}
+)
+async def list_scenarios(
+    request: Request,
+    view: Literal["full", "summary"] = "full",
+    category: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=100)
+):
+    """
+    Get available scenarios, ordered by ID
+
+    ``view=summary`` returns ScenarioSummary entries (no decision points).
+    With ``limit``, the next page's cursor is returned in the
+    ``X-Next-Cursor`` and ``Link`` headers. Responses carry a strong ETag
+    and honour ``If-None-Match`` with ``304 Not Modified``.
+    """
+    body, etag, next_cursor = _render_listing(
+        view,
+        category.lower() if category else None,
+        difficulty.lower() if difficulty else None,
+        cursor,
+        limit
+    )
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/{scenario_id}", response_model=Scenario)
 async def get_scenario(scenario_id: str):
@@ -21,9 +140,27 @@ async def get_scenario(scenario_id: str):
     
     return scenario
 
+async def _prefetch(scenario_id: str, step: int, session_id: Optional[str]):
+    """Speculatively warm analyses for the choices just served"""
+    session = await session_repo.get(session_id) if session_id else None
+    if session_id and (session is None or session.scenario_id != scenario_id):
+        return
+    
+    speculative_prefetcher.prefetch(scenario_id, step, session)
+
 @router.get("/{scenario_id}/step/{step}", response_model=DecisionPoint)
-async def get_decision_point(scenario_id: str, step: int):
-    """Get specific decision point in scenario"""
+async def get_decision_point(
+    scenario_id: str,
+    step: int,
+    background_tasks: BackgroundTasks,
+    session_id: Optional[str] = None
+):
+    """
+    Get specific decision point in scenario
+    
+    With speculative prefetch enabled, analyses for each choice (given the
+    session's history) start in the background after the response is sent.
+    """
     decision_point = scenario_engine.get_decision_point(scenario_id, step)
     
     if not decision_point:
@@ -32,4 +169,7 @@ async def get_decision_point(scenario_id: str, step: int):
             detail="Decision point not found"
         )
     
+    if speculative_prefetcher.enabled:
+        background_tasks.add_task(_prefetch, scenario_id, step, session_id)
+    
     return decision_point
\ No newline at end of file
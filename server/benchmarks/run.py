@@ -0,0 +1,322 @@
+# Offline benchmark and load test for the request path
+"""
+Drives the FastAPI app in-process against a stub LLM at increasing
+concurrency and reports throughput, latency percentiles and memory.
+
+Usage (from server/):
+    python -m benchmarks.run
+    python -m benchmarks.run --workloads decision_flow --levels 1,16,64 --ops 200
+    python -m benchmarks.run --latency 0.4 --jitter 0.2 --error-rate 0.02 --json bench.json
+    python -m benchmarks.run --cassette llm.cassette --timing-scale 1
+    python -m benchmarks.run --workloads consequence_steps --no-pregenerate --fused
+
+Runs fully offline: scenarios come from a temporary copy of the library,
+sessions go to in-memory SQLite and all LLM traffic hits StubLLM, or with
+--cassette, recorded provider responses (see services/llm_cassette.py)
+with the stub answering anything that was not recorded.
+"""
+import os
+import tempfile
+
+# Isolate all state before the app modules read their configuration
+os.environ["GROQ_API_KEY"] = "stub"
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["ANALYSIS_CACHE_PATH"] = ""
+os.environ["SCENARIO_LIBRARY_DIR"] = tempfile.mkdtemp(prefix="bench-library-")
+os.environ["PRECOMPUTE_DIR"] = tempfile.mkdtemp(prefix="bench-precomputed-")
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+import tracemalloc
+import httpx
+
+import main
+from services.llm_service import llm_service
+from services.framework_analyzer import framework_analyzer
+from services.consequence_generator import consequence_generator
+from services.fused_analysis import fused_analyzer
+from services.consequence_delivery import consequence_delivery
+from services.scenario_engine import scenario_engine
+from services.llm_cassette import LLMCassette
+from benchmarks.stub_llm import StubLLM, install
+
+WORKLOADS = ["listing", "suggestions", "decision_flow", "consequence_steps", "batch_generation"]
+CATEGORIES = ["business", "medical", "personal", "civic"]
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Workloads:
+    """One operation per workload; each returns the latencies it observed"""
+
+    def __init__(self, client: httpx.AsyncClient, seed: int):
+        self.client = client
+        self.random = random.Random(seed)
+        self.operations = 0
+
+    async def listing(self) -> list:
+        start = time.perf_counter()
+        response = await self.client.get("/api/scenarios/")
+        response.raise_for_status()
+        return [time.perf_counter() - start]
+
+    async def suggestions(self) -> list:
+        """Topic suggestions for a random category"""
+        start = time.perf_counter()
+        response = await self.client.get(
+            "/api/generate/suggestions", params={"category": self.random.choice(CATEGORIES)}
+        )
+        response.raise_for_status()
+        return [time.perf_counter() - start]
+
+    async def decision_flow(self) -> list:
+        """Play a random path through a random library scenario"""
+        # The whole path is drawn up front so the set of paths (and LLM
+        # requests) doesn't depend on timing, which cassette replay needs
+        scenario = self.random.choice(scenario_engine.list_scenarios())
+        path = [
+            (point, self.random.choice(point.choices))
+            for point in sorted(scenario.decision_points, key=lambda dp: dp.step)
+        ]
+        session_id = None
+        latencies = []
+
+        for point, choice in path:
+            start = time.perf_counter()
+            response = await self.client.post("/api/decisions/submit", json={
+                "scenario_id": scenario.id,
+                "session_id": session_id,
+                "step": point.step,
+                "choice_id": choice.id,
+                "choice_text": choice.text
+            })
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            session_id = response.json()["session_id"]
+
+        return latencies
+
+    async def consequence_steps(self) -> list:
+        """
+        Play a path that fires consequence rules; only the steps where
+        consequences appear are timed
+
+        Choice texts carry the operation number so every operation misses
+        the caches and reaches the LLM (compare with and without --fused).
+        """
+        self.operations += 1
+        tag = f" [{self.operations}]"
+        scenario = self.random.choice([s for s in scenario_engine.list_scenarios() if s.consequence_rules])
+        triggers = {}
+        for rule in scenario.consequence_rules:
+            triggers.setdefault(rule.trigger_step, rule.trigger_choice)
+
+        path = []
+        for point in sorted(scenario.decision_points, key=lambda dp: dp.step):
+            wanted = [c for c in point.choices if c.id == triggers.get(point.step)]
+            path.append((point, wanted[0] if wanted else self.random.choice(point.choices)))
+        chosen = {(point.step, choice.id) for point, choice in path}
+        firing = {
+            rule.appears_at_step for rule in scenario.consequence_rules
+            if (rule.trigger_step, rule.trigger_choice) in chosen
+        }
+
+        session_id = None
+        latencies = []
+        for point, choice in path:
+            start = time.perf_counter()
+            response = await self.client.post("/api/decisions/submit", json={
+                "scenario_id": scenario.id,
+                "session_id": session_id,
+                "step": point.step,
+                "choice_id": choice.id,
+                "choice_text": choice.text + tag
+            })
+            if point.step in firing:
+                latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            session_id = response.json()["session_id"]
+
+        return latencies
+
+    async def batch_generation(self) -> list:
+        """Submit a small batch job and poll until it completes"""
+        start = time.perf_counter()
+        response = await self.client.post("/api/generate/generate/batch", json={
+            "topics": [f"benchmark topic {i}" for i in range(4)],
+            "category": "business"
+        })
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+
+        while True:
+            status = (await self.client.get(f"/api/generate/generate/batch/{job_id}")).json()
+            if status["status"] != "running" and status["status"] != "pending":
+                break
+            await asyncio.sleep(0.01)
+
+        return [time.perf_counter() - start]
+
+
+async def run_level(workloads: Workloads, name: str, concurrency: int, ops: int) -> dict:
+    """Run `ops` operations of one workload with `concurrency` workers"""
+    operation = getattr(workloads, name)
+    latencies = []
+    errors = 0
+    remaining = ops
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                latencies.extend(await operation())
+            except Exception:
+                errors += 1
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+
+    latencies.sort()
+    return {
+        "workload": name,
+        "concurrency": concurrency,
+        "ops": ops,
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "peak_alloc_mb": round(peak / 2 ** 20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def print_table(results: list):
+    columns = ["workload", "concurrency", "requests", "errors", "throughput_rps",
+               "p50_ms", "p95_ms", "p99_ms", "llm_prompt_tokens", "peak_alloc_mb", "max_rss_mb"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r[c]).rjust(widths[c]) for c in columns))
+
+
+async def main_async(args) -> list:
+    stub = StubLLM(
+        latency=args.latency,
+        jitter=args.jitter,
+        per_token=args.per_token,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed
+    )
+    cassette = None
+    if args.cassette:
+        cassette = LLMCassette(
+            args.cassette,
+            mode=args.cassette_mode,
+            upstream=stub,
+            fallback=stub,
+            timing_scale=args.timing_scale
+        )
+    install(llm_service, cassette or stub)
+    if args.no_cache:
+        framework_analyzer.cache.max_entries = 0
+    fused_analyzer.enabled = args.fused
+    if args.no_pregenerate:
+        consequence_delivery.pregenerate_enabled = False
+
+    results = []
+    tracemalloc.start()
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            workloads = Workloads(client, args.seed)
+            for name in args.workloads:
+                for concurrency in args.levels:
+                    framework_analyzer.cache.clear()
+                    consequence_generator.cache.clear()
+                    prompt_tokens, completion_tokens = stub.prompt_tokens, stub.completion_tokens
+                    fused = fused_analyzer.stats()
+                    result = await run_level(workloads, name, concurrency, args.ops)
+                    result["llm_prompt_tokens"] = stub.prompt_tokens - prompt_tokens
+                    result["llm_completion_tokens"] = stub.completion_tokens - completion_tokens
+                    if args.fused:
+                        after = fused_analyzer.stats()
+                        result["fused_calls"] = after["calls"] - fused["calls"]
+                        result["fused_incomplete"] = sum(
+                            after[k] - fused[k] for k in ("missing_analysis", "missing_consequences", "errors")
+                        )
+                    result["stub_llm_calls"] = stub.requests
+                    result["llm_retries"] = llm_service.retries
+                    if cassette:
+                        result["cassette_replayed"] = cassette.replayed
+                        result["cassette_misses"] = cassette.misses
+                    results.append(result)
+
+    tracemalloc.stop()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the request path against a stub LLM")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help=f"Comma separated subset of {', '.join(WORKLOADS)}")
+    parser.add_argument("--levels", default="1,8,32", help="Comma separated concurrency levels")
+    parser.add_argument("--ops", type=int, default=100, help="Operations per workload and level")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub LLM base latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Stub LLM latency jitter (s)")
+    parser.add_argument("--per-token", type=float, default=0.0, help="Stub LLM seconds per completion token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of a 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Probability of a hung request")
+    parser.add_argument("--hang-seconds", type=float, default=60.0, help="How long hung requests hang")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the framework analysis cache")
+    parser.add_argument("--no-pregenerate", action="store_true",
+                        help="Generate consequences when they appear rather than when triggered")
+    parser.add_argument("--fused", action="store_true",
+                        help="One LLM call for the analysis and consequences on consequence steps")
+    parser.add_argument("--cassette", help="Replay LLM responses recorded in this cassette file")
+    parser.add_argument("--cassette-mode", choices=["replay", "auto"], default="replay",
+                        help="auto also records the stub's answers to unrecorded requests")
+    parser.add_argument("--timing-scale", type=float, default=1.0,
+                        help="Replay recorded latencies scaled by this factor (0 = instant)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    args.workloads = [w for w in args.workloads.split(",") if w]
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"Unknown workloads: {', '.join(sorted(unknown))}")
+    args.levels = [int(level) for level in args.levels.split(",")]
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main_async(args))
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,277 @@
+# Local stub of the Groq chat completions API for offline benchmarks and tests
+from typing import Optional
+import asyncio
+import json
+import random
+import re
+import time
+import httpx
+
+ANALYSIS_TEXT = """**Utilitarian:** Weighs the immediate benefit to the people involved against wider organizational harm and the precedent it sets.
+
+**Deontological:** Turns on whether the duty of confidentiality outweighs the duty of honesty owed to a friend.
+
+**Virtue Ethics:** Shows loyalty and compassion but risks undermining integrity and trustworthiness.
+
+**Care Ethics:** Prioritizes an existing relationship and its vulnerabilities over impartial institutional norms."""
+
+ANALYSIS_SECTIONS = {
+    field: text.split(":** ", 1)[1]
+    for field, text in zip(
+        ["utilitarian", "deontological", "virtue_ethics", "care_ethics"],
+        ANALYSIS_TEXT.split("\n\n")
+    )
+}
+
+CONSEQUENCE_TEXT = (
+    "Weeks later, the earlier decision resurfaces. Some colleagues quietly thank you, "
+    "while others have grown more guarded around you. Management has tightened its "
+    "document handling policy, and your name came up in the review that followed."
+)
+
+
+def stub_scenario(num_decision_points: int = 3) -> dict:
+    """Generated scenario body in the shape the generation prompt asks for"""
+    return {
+        "title": "Stub Dilemma",
+        "description": "A generated scenario used for offline benchmarking",
+        "category": "business",
+        "difficulty": "intermediate",
+        "estimated_time": 8,
+        "decision_points": [
+            {
+                "step": step,
+                "context": f"Situation at step {step}. " + "Details of the dilemma. " * 20,
+                "prompt": "What do you do?",
+                "choices": [
+                    {"id": "A", "text": f"Option A at step {step}"},
+                    {"id": "B", "text": f"Option B at step {step}"},
+                    {"id": "C", "text": f"Option C at step {step}"}
+                ]
+            }
+            for step in range(1, num_decision_points + 1)
+        ],
+        "consequence_rules": [
+            {
+                "trigger_choice": "A",
+                "trigger_step": step,
+                "appears_at_step": step + 2,
+                "consequence_template": f"Choosing A at step {step} has a delayed effect"
+            }
+            for step in range(1, num_decision_points - 1)
+        ]
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class StubLLM(httpx.AsyncBaseTransport):
+    """
+    httpx transport that answers ``POST .../chat/completions`` locally
+
+    Plug it into ``AsyncGroq(http_client=httpx.AsyncClient(transport=...))``
+    (see ``install``) so the real LLMService code path is exercised without
+    network access.
+
+    Latency is ``latency ± jitter`` seconds plus ``per_token`` seconds per
+    completion token. ``error_rate``, ``rate_limit_rate`` and
+    ``timeout_rate`` are the probabilities of a 500, a 429 (with
+    ``retry-after``) or a response that hangs for ``hang_seconds``.
+    Randomness is seeded so runs are reproducible.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        per_token: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        hang_seconds: float = 60.0,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_token = per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+
+        # Counters
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.errors = 0
+        self.topics_suggested = 0
+
+    # Response content
+
+    def completion_text(self, body: dict) -> str:
+        """Pick a canned answer based on what the prompt asks for"""
+        messages = body.get("messages", [])
+        system = " ".join(m["content"] for m in messages if m["role"] == "system")
+        user = " ".join(m["content"] for m in messages if m["role"] == "user")
+
+        if '"consequences"' in system:
+            # Fused analysis: one consequence per numbered "Triggered by" line
+            count = len(re.findall(r"^\d+\. Triggered by", user, re.M))
+            return json.dumps({**ANALYSIS_SECTIONS, "consequences": [CONSEQUENCE_TEXT] * count})
+        if "applied ethics" in system:
+            if body.get("response_format", {}).get("type") == "json_object":
+                return json.dumps(ANALYSIS_SECTIONS)
+            return ANALYSIS_TEXT
+        if "scenario writer" in system:
+            return CONSEQUENCE_TEXT
+        if "scenario designer" in system:
+            match = re.search(r"DECISION POINTS: (\d+)", user)
+            return json.dumps(stub_scenario(int(match.group(1)) if match else 3))
+        if "dilemma topics" in system:
+            # A fresh batch each call, so pools that deduplicate can fill up
+            match = re.search(r"Suggest (\d+) .*? for the (\S+) category", user)
+            count, category = (int(match.group(1)), match.group(2)) if match else (10, "general")
+            self.topics_suggested += count
+            first = self.topics_suggested - count + 1
+            return json.dumps([f"Stub {category} topic {n}" for n in range(first, first + count)])
+        if "refine ethical scenarios" in system:
+            match = re.search(r"Original Scenario:\n(\{.*\})\n\nFeedback:", user, re.S)
+            return match.group(1) if match else "{}"
+        return "OK"
+
+    # Transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "not found"}})
+
+        await request.aread()
+        body = json.loads(request.content)
+
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await self._respond(body)
+        finally:
+            self.in_flight -= 1
+
+    async def _respond(self, body: dict) -> httpx.Response:
+        roll = self.random.random()
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+        if roll < self.timeout_rate:
+            self.errors += 1
+            await asyncio.sleep(self.hang_seconds)
+            return httpx.Response(504, json={"error": {"message": "stub timeout"}})
+        roll -= self.timeout_rate
+
+        if roll < self.rate_limit_rate:
+            self.errors += 1
+            await asyncio.sleep(delay / 10)
+            return httpx.Response(
+                429,
+                headers={"retry-after": "1"},
+                json={"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}}
+            )
+        roll -= self.rate_limit_rate
+
+        if roll < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(delay)
+            return httpx.Response(500, json={"error": {"message": "stub internal error"}})
+
+        text = self.completion_text(body)
+        completion_tokens = estimate_tokens(text)
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in body.get("messages", []))
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        headers = {
+            "x-ratelimit-remaining-requests": "1000",
+            "x-ratelimit-remaining-tokens": "100000",
+            "x-ratelimit-reset-requests": "1m26.4s",
+            "x-ratelimit-reset-tokens": "600ms"
+        }
+
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={**headers, "content-type": "text/event-stream"},
+                stream=_SSEStream(self, body, text, delay, completion_tokens)
+            )
+
+        await asyncio.sleep(delay + self.per_token * completion_tokens)
+        return httpx.Response(200, headers=headers, json={
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": text}
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+
+class _SSEStream(httpx.AsyncByteStream):
+    """Streams a canned completion as OpenAI-style SSE chunks"""
+
+    def __init__(self, stub: StubLLM, body: dict, text: str, delay: float, tokens: int):
+        self.stub = stub
+        self.body = body
+        self.text = text
+        self.delay = delay
+        self.tokens = tokens
+
+    def _chunk(self, delta: dict, finish_reason: Optional[str] = None) -> bytes:
+        payload = {
+            "id": "stub-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(payload)}\n\n".encode()
+
+    async def __aiter__(self):
+        # Time to first token, then the rest paced per token
+        await asyncio.sleep(self.delay)
+        yield self._chunk({"role": "assistant", "content": ""})
+
+        pieces = re.findall(r"\S+\s*", self.text)
+        for piece in pieces:
+            if self.stub.per_token:
+                await asyncio.sleep(self.stub.per_token * self.tokens / max(1, len(pieces)))
+            yield self._chunk({"content": piece})
+
+        yield self._chunk({}, finish_reason="stop")
+        yield b"data: [DONE]\n\n"
+
+
+def install(service, stub: httpx.AsyncBaseTransport):
+    """Point an LLMService at the stub (or a cassette) instead of Groq"""
+    from groq import AsyncGroq
+    from services.llm_cassette import LLMCassette
+
+    service.set_client(
+        AsyncGroq(
+            api_key="stub",
+            http_client=httpx.AsyncClient(transport=stub),
+            max_retries=0
+        ),
+        cassette=stub if isinstance(stub, LLMCassette) else None
+    )
+    return stub
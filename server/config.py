@@ -0,0 +1,177 @@
+# Runtime configuration (environment driven)
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# LLM provider
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+
+# Maximum number of LLM calls in flight across the whole worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+# Per-call timeout (seconds) and connect timeout for the shared HTTP pool
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+
+# Shared HTTP connection pool
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "64"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "32"))
+
+# Client-side rate limits (0 = no static limit; provider headers still apply)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+
+# Retries for rate limits, timeouts and 5xx (jittered exponential backoff)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+# Circuit breaker: open after N consecutive failures, probe again after the reset
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Record/replay of LLM traffic (services/llm_cassette.py): "" (off), "record",
+# "replay" or "auto"; replayed latency is the recorded one times the scale
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "llm.cassette")
+LLM_CASSETTE_TIMING_SCALE = float(os.getenv("LLM_CASSETTE_TIMING_SCALE", "0"))
+
+# Background (speculative) LLM calls never hold more than this many slots
+LLM_BACKGROUND_MAX_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_MAX_CONCURRENCY", "4"))
+
+# Admission control: LLM calls queue for a slot by priority class, highest
+# first. Per class: (max queued, max queue wait in seconds, max concurrent
+# calls); calls beyond the queue or past the wait are shed with a 503
+LLM_PRIORITY_CLASSES = {
+    # Framework analysis for live players
+    "analysis": (
+        int(os.getenv("LLM_QUEUE_MAX_ANALYSIS", "256")),
+        float(os.getenv("LLM_QUEUE_WAIT_ANALYSIS", "10")),
+        LLM_MAX_CONCURRENCY
+    ),
+    "consequence": (
+        int(os.getenv("LLM_QUEUE_MAX_CONSEQUENCE", "256")),
+        float(os.getenv("LLM_QUEUE_WAIT_CONSEQUENCE", "15")),
+        LLM_MAX_CONCURRENCY
+    ),
+    # Scenario generation, refinement and topic suggestions
+    "generation": (
+        int(os.getenv("LLM_QUEUE_MAX_GENERATION", "32")),
+        float(os.getenv("LLM_QUEUE_WAIT_GENERATION", "30")),
+        int(os.getenv("LLM_GENERATION_MAX_CONCURRENCY", str(max(1, LLM_MAX_CONCURRENCY // 2))))
+    ),
+    # Speculative prefetch and consequence pre-generation
+    "background": (
+        int(os.getenv("LLM_QUEUE_MAX_BACKGROUND", "64")),
+        float(os.getenv("LLM_QUEUE_WAIT_BACKGROUND", "30")),
+        LLM_BACKGROUND_MAX_CONCURRENCY
+    )
+}
+
+# Framework analysis output: "json" (structured output mode) or "markdown"
+ANALYSIS_OUTPUT_FORMAT = os.getenv("ANALYSIS_OUTPUT_FORMAT", "json")
+
+# Framework analysis cache (ANALYSIS_CACHE_PATH enables the on-disk tier)
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "2048"))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "604800"))
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "")
+ANALYSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_ENTRIES", "50000"))
+
+# Decision history in prompts: token budget, latest steps always kept verbatim,
+# and words kept per older choice once it is folded into the summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "300"))
+HISTORY_KEEP_RECENT_STEPS = int(os.getenv("HISTORY_KEEP_RECENT_STEPS", "2"))
+HISTORY_SUMMARY_WORDS = int(os.getenv("HISTORY_SUMMARY_WORDS", "10"))
+
+# Steps where consequences fire: ask for the analysis and the consequences in
+# one structured call instead of one call each (non-streamed submits)
+FUSED_ANALYSIS = os.getenv("FUSED_ANALYSIS", "0") == "1"
+
+# Degraded mode: when the LLM fails, submits get the latest analysis of the same
+# choice (any history), the precomputed one or a template, and the rule's raw
+# consequence template, flagged as degraded; this many analyses are kept
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "1") == "1"
+DEGRADED_ANALYSIS_MAX_ENTRIES = int(os.getenv("DEGRADED_ANALYSIS_MAX_ENTRIES", "4096"))
+
+# Generated consequences, keyed on the rule, context and full decision history
+CONSEQUENCE_CACHE_MAX_ENTRIES = int(os.getenv("CONSEQUENCE_CACHE_MAX_ENTRIES", "1024"))
+
+# Offline precomputation of library scenarios (python -m services.precompute)
+PRECOMPUTE_DIR = os.getenv(
+    "PRECOMPUTE_DIR",
+    os.path.join(os.path.dirname(__file__), "data", "precomputed")
+)
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "4"))
+PRECOMPUTE_REQUESTS_PER_MINUTE = int(os.getenv("PRECOMPUTE_REQUESTS_PER_MINUTE", "30"))
+PRECOMPUTE_MAX_NODES = int(os.getenv("PRECOMPUTE_MAX_NODES", "500"))
+
+# Session database (PostgreSQL in production, SQLite for local runs and tests)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(os.path.dirname(__file__), "data", "sessions.db")
+)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# Hot session cache and write-behind flushing
+SESSION_CACHE_IDLE_SECONDS = float(os.getenv("SESSION_CACHE_IDLE_SECONDS", "900"))
+SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "0.5"))
+# A cached session is checked against the database before a write unless it was
+# checked this recently (another worker may have written to it); a single
+# worker can raise this to SESSION_CACHE_IDLE_SECONDS to skip the read
+SESSION_REVALIDATE_SECONDS = float(os.getenv("SESSION_REVALIDATE_SECONDS", "0"))
+# A flush the database can't take right now (connection, lock) is retried with
+# backoff this many times; writes it rejects, or that run out of retries, are
+# set aside (the latest ones kept for inspection) so they don't block the rest
+SESSION_FLUSH_MAX_RETRIES = int(os.getenv("SESSION_FLUSH_MAX_RETRIES", "10"))
+SESSION_DEAD_LETTER_MAX_ENTRIES = int(os.getenv("SESSION_DEAD_LETTER_MAX_ENTRIES", "1000"))
+
+# Scenario library: one JSON record per scenario, seeded from scenarios.json
+SCENARIO_SEED_PATH = os.getenv(
+    "SCENARIO_SEED_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "scenarios.json")
+)
+SCENARIO_LIBRARY_DIR = os.getenv(
+    "SCENARIO_LIBRARY_DIR",
+    os.path.join(os.path.dirname(__file__), "data", "library")
+)
+
+# Batch scenario generation jobs
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "4"))
+BATCH_GENERATION_MAX_RETRIES = int(os.getenv("BATCH_GENERATION_MAX_RETRIES", "2"))
+BATCH_JOB_RETENTION_SECONDS = float(os.getenv("BATCH_JOB_RETENTION_SECONDS", "3600"))
+
+# Topic suggestions: a pool per category, filled on the first request (or at
+# startup with SUGGESTION_PREWARM, which spends LLM calls on every boot) and in
+# the background whenever fewer than the low-water mark are left; each topic is
+# served to this many requests before it is retired
+SUGGESTION_CATEGORIES = os.getenv("SUGGESTION_CATEGORIES", "business,medical,personal,civic").split(",")
+SUGGESTION_PREWARM = os.getenv("SUGGESTION_PREWARM", "0") == "1"
+SUGGESTION_POOL_SIZE = int(os.getenv("SUGGESTION_POOL_SIZE", "40"))
+SUGGESTION_POOL_LOW_WATER = int(os.getenv("SUGGESTION_POOL_LOW_WATER", "20"))
+SUGGESTION_BATCH_SIZE = int(os.getenv("SUGGESTION_BATCH_SIZE", "20"))
+SUGGESTION_MAX_SERVES = int(os.getenv("SUGGESTION_MAX_SERVES", "5"))
+# Pools kept for categories outside SUGGESTION_CATEGORIES
+SUGGESTION_MAX_CATEGORIES = int(os.getenv("SUGGESTION_MAX_CATEGORIES", "32"))
+
+# Delayed consequences: generate them as soon as their trigger fires, and keep
+# deferred-delivery handles (and unclaimed pre-generated text) this long
+CONSEQUENCE_PREGENERATE = os.getenv("CONSEQUENCE_PREGENERATE", "1") == "1"
+CONSEQUENCE_HANDLE_RETENTION_SECONDS = float(os.getenv("CONSEQUENCE_HANDLE_RETENTION_SECONDS", "3600"))
+
+# Repeated decision submits (Idempotency-Key or same session and step) get the
+# stored response; this many responses are kept, for this long
+SUBMISSION_REPLAY_MAX_ENTRIES = int(os.getenv("SUBMISSION_REPLAY_MAX_ENTRIES", "10000"))
+SUBMISSION_REPLAY_TTL_SECONDS = float(os.getenv("SUBMISSION_REPLAY_TTL_SECONDS", "3600"))
+
+# Speculative prefetch of analyses/consequences when a decision point is served
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "0") == "1"
+SPECULATIVE_MAX_CALLS_PER_SESSION = int(os.getenv("SPECULATIVE_MAX_CALLS_PER_SESSION", "24"))
+
+# Monitoring: request timing (Server-Timing header and /metrics) and the
+# database round-trip budget for /health
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+HEALTH_DB_TIMEOUT_SECONDS = float(os.getenv("HEALTH_DB_TIMEOUT_SECONDS", "2"))
@@ -0,0 +1,38 @@
+# Database engine and connection pool
+from sqlalchemy import create_engine, MetaData
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+import config
+
+# Shared table metadata for all repositories
+metadata = MetaData()
+
+
+def create_db_engine(url: str = config.DATABASE_URL) -> Engine:
+    """
+    Create a pooled engine for the configured database
+
+    PostgreSQL gets a bounded QueuePool with pre-ping so stale connections
+    are replaced transparently. SQLite (used locally and in tests) shares a
+    single connection when in-memory so every thread sees the same data.
+    """
+    if url.startswith("sqlite"):
+        if ":memory:" in url or url == "sqlite://":
+            return create_engine(
+                url,
+                connect_args={"check_same_thread": False},
+                poolclass=StaticPool
+            )
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    return create_engine(
+        url,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True
+    )
+
+
+# Singleton engine
+engine = create_db_engine()
@@ -0,0 +1,137 @@
+# Scenario library persistence
+from models.scenario import Scenario
+from contextlib import contextmanager
+from typing import Optional, List
+import fcntl
+import json
+import os
+import re
+import threading
+import config
+
+# Scenario IDs double as file names
+SCENARIO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{1,128}$")
+
+
+class ScenarioRepository:
+    """
+    File-backed scenario store with one record per scenario
+
+    Each scenario lives in ``<directory>/<id>.json``. Writes go to a temp
+    file that is fsynced and renamed over the record, so readers never see
+    a partial file. Writers are serialized by a thread lock within the
+    process and an ``fcntl`` lock on ``.lock`` across worker processes.
+
+    On first use a new library is seeded from the legacy ``scenarios.json``.
+    """
+
+    def __init__(self, directory: str, seed_path: Optional[str] = None):
+        self.directory = directory
+        self.seed_path = seed_path
+        self._thread_lock = threading.Lock()
+
+    def _record_path(self, scenario_id: str) -> str:
+        if not SCENARIO_ID_PATTERN.match(scenario_id):
+            raise ValueError(f"Invalid scenario ID: {scenario_id!r}")
+        return os.path.join(self.directory, f"{scenario_id}.json")
+
+    @contextmanager
+    def _locked(self):
+        """Hold both the thread lock and the cross-process file lock"""
+        with self._thread_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, ".lock"), "w") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _write_atomic(self, path: str, data: dict):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            # The record itself is untouched; don't leave the partial file behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _seed(self):
+        """Import the legacy scenarios.json into a new library (once)"""
+        marker = os.path.join(self.directory, ".seeded")
+        if os.path.exists(marker):
+            return
+
+        with self._locked():
+            if os.path.exists(marker):
+                return
+
+            if self.seed_path and os.path.exists(self.seed_path):
+                with open(self.seed_path, "r") as f:
+                    data = json.load(f)
+                for scenario_data in data.get("scenarios", []):
+                    path = self._record_path(scenario_data["id"])
+                    if not os.path.exists(path):
+                        self._write_atomic(path, scenario_data)
+
+            open(marker, "w").close()
+
+    def load_all(self) -> List[dict]:
+        """All scenario records, ordered by ID"""
+        self._seed()
+        if not os.path.isdir(self.directory):
+            return []
+
+        records = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.directory, name), "r") as f:
+                records.append(json.load(f))
+        return records
+
+    def get(self, scenario_id: str) -> Optional[dict]:
+        """Single scenario record, or None"""
+        try:
+            with open(self._record_path(scenario_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def exists(self, scenario_id: str) -> bool:
+        return os.path.exists(self._record_path(scenario_id))
+
+    def save(self, scenario: Scenario, overwrite: bool = True) -> bool:
+        """
+        Atomically write one scenario record
+
+        Returns:
+            False if the record exists and overwrite is False, else True
+        """
+        path = self._record_path(scenario.id)
+        self._seed()
+        with self._locked():
+            if not overwrite and os.path.exists(path):
+                return False
+            self._write_atomic(path, scenario.model_dump())
+        return True
+
+    def delete(self, scenario_id: str) -> bool:
+        """Delete one scenario record. Returns False if it did not exist"""
+        path = self._record_path(scenario_id)
+        self._seed()
+        with self._locked():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return False
+        return True
+
+
+# Singleton instance
+scenario_repo = ScenarioRepository(config.SCENARIO_LIBRARY_DIR, config.SCENARIO_SEED_PATH)
@@ -0,0 +1,426 @@
+# User session persistence
+from sqlalchemy import Table, Column, Index, Integer, Float, String, Text, ForeignKey, select, insert, update, delete, func, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from database.connection import engine, metadata
+from models.scenario import UserDecisionHistory
+from collections import deque
+from typing import Deque, Optional, Dict, List
+import asyncio
+import time
+import config
+
+user_sessions = Table(
+    "user_sessions",
+    metadata,
+    Column("session_id", String(64), primary_key=True),
+    Column("scenario_id", String(128), nullable=False),
+    Column("current_step", Integer, nullable=False, default=0),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False)
+)
+
+session_choices = Table(
+    "session_choices",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(64), ForeignKey("user_sessions.session_id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("position", Integer, nullable=False),
+    Column("step", Integer, nullable=False),
+    Column("choice_id", String(32), nullable=False),
+    Column("choice_text", Text, nullable=False),
+    # Two workers appending from stale copies of a session collide here.
+    # A unique index (not a table constraint) so it can be added to
+    # existing tables too (see _ensure_schema)
+    Index("uq_session_choices_position", "session_id", "position", unique=True)
+)
+
+
+class SessionRepository:
+    """
+    Session store with a hot in-process cache and write-behind persistence
+
+    Reads are served from the cache and fall back to the database. Writes
+    update the cache immediately and are queued; a background task flushes
+    the queue in one transaction every ``flush_interval`` seconds, so the
+    submit path never waits on a database round-trip. Cached sessions idle
+    for longer than ``idle_seconds`` are evicted once their writes are flushed.
+
+    A flush that fails for a transient reason (connection lost, database
+    locked) is retried, backing off, up to ``max_retries`` times. Any other
+    failure means the database rejected a write: the batch is then replayed
+    one write at a time so only the rejected writes are set aside. Writes
+    set aside, or out of retries, go to a bounded dead-letter list.
+
+    With several workers, a cached session can be stale for as long as it
+    stays cached (up to ``idle_seconds``) if another worker wrote to it.
+    Callers about to write fetch it with ``get(..., revalidate=True)``,
+    which compares the cached copy with the database's choice count (one
+    indexed read, skipped while this worker still has writes queued for
+    the session or checked it within ``revalidate_seconds``) and reloads
+    it if they differ. Appends that still collide are rejected by the
+    unique (session_id, position) index, and the session is dropped from
+    the cache so the next read reloads it.
+    """
+
+    # Longest wait between flushes while the database keeps failing
+    MAX_BACKOFF_SECONDS = 30.0
+
+    def __init__(
+        self,
+        db_engine: Engine,
+        idle_seconds: float = config.SESSION_CACHE_IDLE_SECONDS,
+        flush_interval: float = config.SESSION_FLUSH_INTERVAL_SECONDS,
+        max_retries: int = config.SESSION_FLUSH_MAX_RETRIES,
+        dead_letter_max_entries: int = config.SESSION_DEAD_LETTER_MAX_ENTRIES,
+        revalidate_seconds: float = config.SESSION_REVALIDATE_SECONDS
+    ):
+        self.engine = db_engine
+        self.idle_seconds = idle_seconds
+        self.revalidate_seconds = revalidate_seconds
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._cache: Dict[str, UserDecisionHistory] = {}
+        self._last_access: Dict[str, float] = {}
+        # When each cached session was last known to match the database
+        self._validated: Dict[str, float] = {}
+        self._pending: List[tuple] = []
+        self._schema_ready = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        # Consecutive transiently failed flushes (drives the backoff)
+        self._retries = 0
+        # (op, error) for writes that were given up on, newest last
+        self.dead_letters: Deque[tuple] = deque(maxlen=dead_letter_max_entries)
+
+        # Counters
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.revalidations = 0
+        self.stale_reloads = 0
+        self.flushed_writes = 0
+        self.flush_retries = 0
+        self.dropped_writes = 0
+        self.evictions = 0
+
+    # Lifecycle
+
+    async def start(self):
+        """Create tables and start the background flusher"""
+        await asyncio.to_thread(self._ensure_schema)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still queued"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            metadata.create_all(self.engine)
+            # create_all skips the indexes of tables that already exist
+            for index in session_choices.indexes:
+                index.create(self.engine, checkfirst=True)
+            self._schema_ready = True
+
+    # Public API
+
+    async def get(self, session_id: str, revalidate: bool = False) -> Optional[UserDecisionHistory]:
+        """
+        Get a session from cache, loading it from the database on a miss
+
+        With ``revalidate`` (before writing to the session), a cached copy
+        another worker may have written past is checked against the
+        database first and reloaded if it is stale.
+        """
+        session = self._cache.get(session_id)
+        if session is not None and revalidate and self._needs_revalidation(session_id):
+            session = await self._revalidate(session)
+
+        if session is not None:
+            self.cache_hits += 1
+            self._last_access[session_id] = time.monotonic()
+            return session
+
+        self.cache_misses += 1
+        session = await asyncio.to_thread(self._load, session_id)
+        if session is not None:
+            self._remember(session)
+        return session
+
+    def create(self, scenario_id: str, session_id: str, current_step: int = 0) -> UserDecisionHistory:
+        """Create a session; persisted on the next flush"""
+        if session_id in self._cache:
+            return self._cache[session_id]
+
+        session = UserDecisionHistory(
+            scenario_id=scenario_id,
+            session_id=session_id,
+            current_step=current_step,
+            choices_made=[]
+        )
+        self._remember(session)
+
+        now = time.time()
+        self._pending.append(("create", {
+            "session_id": session_id,
+            "scenario_id": scenario_id,
+            "current_step": current_step,
+            "created_at": now,
+            "updated_at": now
+        }))
+        return session
+
+    def append_choice(self, session: UserDecisionHistory, choice: dict):
+        """Append a choice and advance current_step; persisted on the next flush"""
+        session.choices_made.append(choice)
+        session.current_step = choice["step"]
+        self._last_access[session.session_id] = time.monotonic()
+
+        self._pending.append(("append", {
+            "session_id": session.session_id,
+            "position": len(session.choices_made) - 1,
+            "step": choice["step"],
+            "choice_id": choice["choice_id"],
+            "choice_text": choice["choice_text"]
+        }))
+
+    async def delete(self, session_id: str) -> bool:
+        """Delete a session. Returns False if it did not exist"""
+        if await self.get(session_id) is None:
+            return False
+
+        self._forget(session_id)
+        self._pending.append(("delete", session_id))
+        # Flush right away so a later cache miss cannot reload the session
+        await self.flush()
+        return True
+
+    async def flush(self):
+        """Write all queued changes in a single transaction"""
+        # Batches must commit in order (a create before its appends)
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            ops, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._apply, ops)
+                self.flushed_writes += len(ops)
+                self._retries = 0
+            except Exception as e:
+                if self._transient(e):
+                    self._retry_later(ops, e)
+                else:
+                    print(f"Session flush rejected, writing one at a time: {str(e)}")
+                    await self._apply_each(ops)
+
+    async def ping(self, timeout: float) -> bool:
+        """True if the database answers a trivial query within ``timeout`` seconds"""
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self._ping), timeout=timeout)
+            return True
+        except Exception as e:
+            print(f"Database ping failed: {str(e) or type(e).__name__}")
+            return False
+
+    @property
+    def flushing(self) -> bool:
+        """True while the background flusher is running"""
+        return self._flusher is not None and not self._flusher.done()
+
+    def stats(self) -> dict:
+        return {
+            "cached_sessions": len(self._cache),
+            "pending_writes": len(self._pending),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "revalidations": self.revalidations,
+            "stale_reloads": self.stale_reloads,
+            "flushed_writes": self.flushed_writes,
+            "flush_retries": self.flush_retries,
+            "dropped_writes": self.dropped_writes,
+            "dead_letters": len(self.dead_letters),
+            "evictions": self.evictions
+        }
+
+    # Internals
+
+    def _remember(self, session: UserDecisionHistory):
+        """Cache a session just read from the database"""
+        now = time.monotonic()
+        self._cache[session.session_id] = session
+        self._last_access[session.session_id] = now
+        self._validated[session.session_id] = now
+
+    def _forget(self, session_id: str):
+        self._cache.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+        self._validated.pop(session_id, None)
+
+    def _queued_sessions(self) -> set:
+        """Sessions with writes still waiting for a flush"""
+        return {op[1] if op[0] == "delete" else op[1]["session_id"] for op in self._pending}
+
+    def _needs_revalidation(self, session_id: str) -> bool:
+        # Queued writes mean this worker wrote last; the unique index catches the rest
+        if time.monotonic() - self._validated.get(session_id, 0.0) < self.revalidate_seconds:
+            return False
+        return session_id not in self._queued_sessions()
+
+    async def _revalidate(self, session: UserDecisionHistory) -> Optional[UserDecisionHistory]:
+        """The cached session if it still matches the database, else a fresh copy (None if deleted)"""
+        self.revalidations += 1
+        stored = await asyncio.to_thread(self._choice_count, session.session_id)
+        if stored == len(session.choices_made):
+            self._validated[session.session_id] = time.monotonic()
+            return session
+
+        self.stale_reloads += 1
+        self._forget(session.session_id)
+        return None
+
+    async def _flush_loop(self):
+        while True:
+            # Back off while the database is failing
+            await asyncio.sleep(min(self.flush_interval * 2 ** self._retries, self.MAX_BACKOFF_SECONDS))
+            await self.flush()
+            self._evict_idle()
+
+    @staticmethod
+    def _transient(error: Exception) -> bool:
+        """Whether a failed flush may succeed as is later (vs. a rejected write)"""
+        if isinstance(error, DBAPIError) and error.connection_invalidated:
+            return True
+        return isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError))
+
+    def _retry_later(self, ops: List[tuple], error: Exception):
+        """Requeue a transiently failed batch (in order), or give up on it after max_retries"""
+        self._retries += 1
+        if self._retries > self.max_retries:
+            print(f"Session flush failed {self._retries} times, dropping {len(ops)} writes: {str(error)}")
+            self._retries = 0
+            for op in ops:
+                self._dead_letter(op, error)
+            return
+
+        print(f"Session flush failed, will retry: {str(error)}")
+        self.flush_retries += 1
+        self._pending = ops + self._pending
+
+    async def _apply_each(self, ops: List[tuple]):
+        """Write ops one transaction each, setting aside the ones the database rejects"""
+        for i, op in enumerate(ops):
+            try:
+                await asyncio.to_thread(self._apply, [op])
+                self.flushed_writes += 1
+            except Exception as e:
+                if self._transient(e):
+                    self._retry_later(ops[i:], e)
+                    return
+                print(f"Session write rejected, dropping it: {str(e)}")
+                self._dead_letter(op, e)
+                if op[0] != "delete":
+                    # Most likely another worker wrote first: reload on next read
+                    self._forget(op[1]["session_id"])
+        self._retries = 0
+
+    def _dead_letter(self, op: tuple, error: Exception):
+        self.dead_letters.append((op, str(error)))
+        self.dropped_writes += 1
+
+    def _evict_idle(self):
+        """Drop idle sessions from the cache once nothing is queued for them"""
+        cutoff = time.monotonic() - self.idle_seconds
+        queued = self._queued_sessions()
+
+        for session_id, last_access in list(self._last_access.items()):
+            if last_access < cutoff and session_id not in queued:
+                self._forget(session_id)
+                self.evictions += 1
+
+    def _ping(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    def _choice_count(self, session_id: str) -> Optional[int]:
+        """Choices stored for a session, None if it does not exist"""
+        self._ensure_schema()
+        with self.engine.connect() as conn:
+            exists = conn.execute(
+                select(user_sessions.c.session_id).where(user_sessions.c.session_id == session_id)
+            ).first()
+            if exists is None:
+                return None
+            return conn.execute(
+                select(func.count()).select_from(session_choices).where(session_choices.c.session_id == session_id)
+            ).scalar_one()
+
+    def _load(self, session_id: str) -> Optional[UserDecisionHistory]:
+        self._ensure_schema()
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(user_sessions).where(user_sessions.c.session_id == session_id)
+            ).mappings().first()
+            if row is None:
+                return None
+
+            choices = conn.execute(
+                select(session_choices.c.step, session_choices.c.choice_id, session_choices.c.choice_text)
+                .where(session_choices.c.session_id == session_id)
+                .order_by(session_choices.c.position)
+            ).mappings().all()
+
+        return UserDecisionHistory(
+            scenario_id=row["scenario_id"],
+            session_id=row["session_id"],
+            current_step=row["current_step"],
+            choices_made=[dict(c) for c in choices]
+        )
+
+    def _apply(self, ops: List[tuple]):
+        self._ensure_schema()
+        now = time.time()
+
+        with self.engine.begin() as conn:
+            appends = []
+
+            def write_appends():
+                if not appends:
+                    return
+                conn.execute(insert(session_choices), appends)
+                # One current_step update per session, taken from its last append
+                last_steps = {a["session_id"]: a["step"] for a in appends}
+                for session_id, step in last_steps.items():
+                    conn.execute(
+                        update(user_sessions)
+                        .where(user_sessions.c.session_id == session_id)
+                        .values(current_step=step, updated_at=now)
+                    )
+                appends.clear()
+
+            for kind, payload in ops:
+                if kind == "append":
+                    appends.append(payload)
+                    continue
+
+                write_appends()
+                if kind == "create":
+                    conn.execute(insert(user_sessions), [payload])
+                elif kind == "delete":
+                    conn.execute(delete(session_choices).where(session_choices.c.session_id == payload))
+                    conn.execute(delete(user_sessions).where(user_sessions.c.session_id == payload))
+
+            write_appends()
+
+
+# Singleton instance
+session_repo = SessionRepository(engine)
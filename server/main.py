@@ -1,15 +1,38 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api import scenarios, decisions
 from api import scenarios, decisions, generation
-from api import admin
+from api import admin, monitoring
+from services.llm_service import llm_service
+from services.framework_analyzer import framework_analyzer
+from services.topic_suggestions import topic_suggestions
+from database.repositories.user_session_repo import session_repo
+from utils.server_timing import ServerTimingMiddleware
+import asyncio
+import config
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await session_repo.start()
+    if config.SUGGESTION_PREWARM:
+        topic_suggestions.start()
+    yield
+    await topic_suggestions.stop()
+    # Flush queued session writes before exiting
+    await session_repo.stop()
+    # Commit queued analysis cache writes
+    await asyncio.to_thread(framework_analyzer.cache.flush)
+    # Release the shared LLM connection pool
+    await llm_service.aclose()
+
 
 app = FastAPI(
     title="Dilemma Decision Tree API",
     description="Ethical decision-making analysis API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -19,13 +42,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Idempotent-Replayed"],
 )
 
+# Per-request phase timing (Server-Timing header, latency histograms)
+if config.METRICS_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
 # Routes
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(generation.router, prefix="/api/generate", tags=["generation"])
 app.include_router(scenarios.router, prefix="/api/scenarios", tags=["scenarios"])
 app.include_router(decisions.router, prefix="/api/decisions", tags=["decisions"])
+app.include_router(monitoring.router, tags=["monitoring"])
 
 @app.get("/")
 def read_root():
@@ -34,7 +63,3 @@ def read_root():
         "docs": "/docs",
         "version": "1.0.0"
     }
-
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
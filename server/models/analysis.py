@@ -1,5 +1,17 @@
 # FrameworkAnalysis
 from pydantic import BaseModel, Field
+from typing import List
+
+class FrameworkSections(BaseModel):
+    """Structured-output shape the model is asked to return (one string per framework)"""
+    utilitarian: str = Field(min_length=1)
+    deontological: str = Field(min_length=1)
+    virtue_ethics: str = Field(min_length=1)
+    care_ethics: str = Field(min_length=1)
+
+class FusedSections(FrameworkSections):
+    """Single-call shape: the four analyses plus one text per triggered consequence, in order"""
+    consequences: List[str]
 
 class FrameworkAnalysis(BaseModel):
     """Response model for ethical framework analysis"""
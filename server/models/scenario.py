@@ -1,6 +1,6 @@
 # Scenario, DecisionPoint
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 # from enum import Enum
 
 class ChoiceOption(BaseModel):
@@ -33,12 +33,22 @@ class Scenario(BaseModel):
     consequence_rules: List[ConsequenceRule] = Field(description="Consequence generation rules")
     estimated_time: int = Field(description="Estimated completion time in minutes")
     
+class ScenarioSummary(BaseModel):
+    """Catalogue entry without decision point bodies"""
+    id: str
+    title: str
+    description: str
+    category: str
+    difficulty: str
+    estimated_time: int
+    num_decision_points: int
+    
 class UserDecisionHistory(BaseModel):
     """Track user's path through scenario"""
     scenario_id: str
     session_id: str
     current_step: int = 0
-    choices_made: List[Dict[str, str]] = []  # [{"step": 1, "choice_id": "A"}]
+    choices_made: List[Dict[str, Any]] = []  # [{"step": 1, "choice_id": "A"}]
     
 class DecisionRequest(BaseModel):
     """Request to submit a decision"""
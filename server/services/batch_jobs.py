@@ -0,0 +1,212 @@
+# Background batch scenario generation
+from services.scenario_generator import scenario_generator
+from services.scenario_engine import scenario_engine
+from services.llm_resilience import LLMError
+from database.repositories.scenario_repo import scenario_repo
+from models.scenario import Scenario
+from pydantic import BaseModel
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import random
+import time
+import uuid
+import config
+
+
+class FailedTopic(BaseModel):
+    topic: str
+    error: str
+    attempts: int
+
+
+class BatchJob(BaseModel):
+    """State of one batch generation job"""
+    job_id: str
+    status: str = "pending"  # pending, running, completed, cancelled, failed
+    error: Optional[str] = None
+    category: str
+    difficulty: str
+    topics: List[str]
+    save_to_library: bool = False
+    scenarios: List[Scenario] = []
+    failed: List[FailedTopic] = []
+    created_at: float
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "cancelled", "failed")
+
+
+class BatchJobManager:
+    """
+    Runs batch generation jobs in the background
+
+    Topics from every job share one semaphore, so total parallelism against
+    the LLM is bounded by ``concurrency`` no matter how many jobs run. Each
+    topic is retried with jittered exponential backoff before it is
+    reported as failed. Finished jobs are kept for ``retention_seconds``.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = config.BATCH_GENERATION_CONCURRENCY,
+        max_retries: int = config.BATCH_GENERATION_MAX_RETRIES,
+        retention_seconds: float = config.BATCH_JOB_RETENTION_SECONDS
+    ):
+        self.max_retries = max_retries
+        self.retention_seconds = retention_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._jobs: Dict[str, BatchJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._updates: Dict[str, asyncio.Event] = {}
+
+    def submit(
+        self,
+        topics: List[str],
+        category: str,
+        difficulty: str = "intermediate",
+        save_to_library: bool = False
+    ) -> BatchJob:
+        """Start a job and return immediately"""
+        self._purge_finished()
+
+        job = BatchJob(
+            job_id=uuid.uuid4().hex,
+            category=category,
+            difficulty=difficulty,
+            topics=topics,
+            save_to_library=save_to_library,
+            created_at=time.time()
+        )
+        self._jobs[job.job_id] = job
+        self._updates[job.job_id] = asyncio.Event()
+        self._tasks[job.job_id] = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self._jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a running job; scenarios finished so far are kept"""
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def events(self, job_id: str) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Follow a job's progress
+
+        Yields ("scenario", ...) and ("failed", ...) events as topics finish
+        (replaying any that finished earlier), then one ("done", ...) event.
+        """
+        job = self._jobs[job_id]
+        sent_scenarios = 0
+        sent_failures = 0
+
+        while True:
+            # Grab the event before reading state so no update is missed
+            update = self._updates[job_id]
+
+            while sent_scenarios < len(job.scenarios):
+                yield "scenario", job.scenarios[sent_scenarios].model_dump(mode="json")
+                sent_scenarios += 1
+            while sent_failures < len(job.failed):
+                yield "failed", job.failed[sent_failures].model_dump()
+                sent_failures += 1
+
+            if job.done:
+                yield "done", self.summary(job)
+                return
+
+            await update.wait()
+
+    def summary(self, job: BatchJob) -> dict:
+        """Job status without the scenario bodies"""
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "requested": len(job.topics),
+            "generated": len(job.scenarios),
+            "failed": len(job.failed),
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+            "error": job.error
+        }
+
+    def _notify(self, job: BatchJob):
+        """Wake everyone following this job"""
+        event = self._updates[job.job_id]
+        self._updates[job.job_id] = asyncio.Event()
+        event.set()
+
+    async def _run(self, job: BatchJob):
+        job.status = "running"
+        self._notify(job)
+
+        try:
+            await asyncio.gather(*(self._generate_topic(job, topic) for topic in job.topics))
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            # e.g. saving to the library failed; followers must still see the end
+            print(f"Batch job {job.job_id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._tasks.pop(job.job_id, None)
+            self._notify(job)
+
+    async def _generate_topic(self, job: BatchJob, topic: str):
+        """Generate one topic with retries, recording the outcome on the job"""
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                async with self._semaphore:
+                    scenario = await scenario_generator.generate_scenario(
+                        topic=topic,
+                        category=job.category,
+                        difficulty=job.difficulty
+                    )
+            except Exception as e:
+                if attempt > self.max_retries:
+                    print(f"Failed to generate scenario for '{topic}': {str(e)}")
+                    job.failed.append(FailedTopic(topic=topic, error=str(e), attempts=attempt))
+                    self._notify(job)
+                    return
+
+                # Wait at least as long as the limiter or admission control asked
+                delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+                if isinstance(e, LLMError) and e.retry_after:
+                    delay = max(delay, e.retry_after)
+                await asyncio.sleep(delay)
+                continue
+
+            if job.save_to_library:
+                await asyncio.to_thread(scenario_repo.save, scenario)
+                scenario_engine.upsert_scenario(scenario)
+
+            job.scenarios.append(scenario)
+            self._notify(job)
+            return
+
+    def _purge_finished(self):
+        """Forget jobs that finished more than retention_seconds ago"""
+        cutoff = time.time() - self.retention_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                del self._updates[job_id]
+
+
+# Singleton instance
+batch_job_manager = BatchJobManager()
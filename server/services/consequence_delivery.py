@@ -0,0 +1,293 @@
+# Background generation and delivery of delayed consequences
+from services.consequence_generator import consequence_generator
+from services.llm_service import background_priority
+from services.precompute import rule_key
+from models.scenario import ConsequenceRule, UserDecisionHistory
+from pydantic import BaseModel
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+import asyncio
+import time
+import uuid
+import config
+
+
+class ConsequenceHandle(BaseModel):
+    """A consequence being generated after the submit response was sent"""
+    handle_id: str
+    session_id: str
+    trigger_step: int
+    trigger_choice: str  # text of the triggering choice
+    appears_at_step: int
+    status: str = "pending"  # pending, ready, failed
+    text: Optional[str] = None
+    error: Optional[str] = None
+    degraded: bool = False  # text is a stand-in served because generation failed
+    created_at: float
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status != "pending"
+
+
+class ConsequenceDelivery:
+    """
+    Generates consequences off the submit path
+
+    Pre-generation: when a choice fires a rule whose consequence appears at
+    a later step, the consequence is generated right away at background LLM
+    priority, from the history as it stands at the trigger. The submit at
+    ``appears_at_step`` then takes the finished (or still running) job
+    instead of starting a call.
+
+    Handles: in deferred mode the submit response returns once the
+    analysis is ready and each consequence is delivered through a handle
+    that can be polled or followed over SSE. Handles and unclaimed
+    pre-generated jobs are kept for ``retention_seconds``.
+    """
+
+    def __init__(
+        self,
+        pregenerate: bool = config.CONSEQUENCE_PREGENERATE,
+        retention_seconds: float = config.CONSEQUENCE_HANDLE_RETENTION_SECONDS
+    ):
+        self.pregenerate_enabled = pregenerate
+        self.retention_seconds = retention_seconds
+
+        # (session_id, rule key) -> (pre-generation task, started at)
+        self._pregenerated: Dict[tuple, tuple[asyncio.Task, float]] = {}
+
+        self._handles: Dict[str, ConsequenceHandle] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._updates: Dict[str, asyncio.Event] = {}  # per session
+
+        # Counters
+        self.pregenerated = 0
+        self.pregenerated_used = 0
+        self.pregenerated_failed = 0
+        self.handles_created = 0
+
+    # Pre-generation
+
+    def pregenerate(
+        self,
+        session: UserDecisionHistory,
+        step: int,
+        choice_id: str,
+        context: str,
+        rules: Iterable[ConsequenceRule]
+    ) -> int:
+        """
+        Start generating every consequence the choice just made triggers later
+
+        Returns:
+            Number of jobs started
+        """
+        if not self.pregenerate_enabled:
+            return 0
+        self._purge()
+
+        rules = tuple(rules)
+        started = 0
+        for rule in rules:
+            if (rule.trigger_step, rule.trigger_choice) != (step, choice_id) or rule.appears_at_step <= step:
+                continue
+
+            key = (session.session_id, rule_key(rule))
+            if key in self._pregenerated:
+                continue
+
+            snapshot = session.model_copy(update={"choices_made": list(session.choices_made)})
+            task = asyncio.create_task(self._pregenerate(rule, snapshot, context, rules))
+            # Failures are counted in _pregenerate; don't warn about unclaimed ones
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._pregenerated[key] = (task, time.time())
+            started += 1
+
+        self.pregenerated += started
+        return started
+
+    def has(self, session_id: str, rule: ConsequenceRule) -> bool:
+        """Whether a pre-generation job for a rule is waiting to be claimed"""
+        return (session_id, rule_key(rule)) in self._pregenerated
+
+    def take(self, session_id: str, rule: ConsequenceRule) -> Optional[asyncio.Task]:
+        """Claim the pre-generation job for a rule, if one was started"""
+        entry = self._pregenerated.pop((session_id, rule_key(rule)), None)
+        if entry is None:
+            return None
+
+        self.pregenerated_used += 1
+        return entry[0]
+
+    async def _pregenerate(
+        self,
+        rule: ConsequenceRule,
+        history: UserDecisionHistory,
+        context: str,
+        rules: tuple
+    ) -> str:
+        background_priority.set(True)
+        try:
+            return await consequence_generator.generate_consequence(
+                rule=rule,
+                history=history,
+                context=context,
+                rules=rules
+            )
+        except Exception as e:
+            print(f"Consequence pre-generation failed: {str(e)}")
+            self.pregenerated_failed += 1
+            raise
+
+    # Handles
+
+    def deliver(
+        self,
+        session_id: str,
+        rule: ConsequenceRule,
+        trigger_choice: str,
+        generate: Callable[[], Awaitable[str]],
+        fallback: Optional[Callable[[Exception], Optional[str]]] = None
+    ) -> ConsequenceHandle:
+        """
+        Run ``generate`` detached from the request and return its handle
+
+        If it fails and ``fallback`` returns text for the error, the handle
+        is ready with that text and flagged as degraded.
+        """
+        self._purge()
+
+        handle = ConsequenceHandle(
+            handle_id=uuid.uuid4().hex,
+            session_id=session_id,
+            trigger_step=rule.trigger_step,
+            trigger_choice=trigger_choice,
+            appears_at_step=rule.appears_at_step,
+            created_at=time.time()
+        )
+        self._handles[handle.handle_id] = handle
+        self._updates.setdefault(session_id, asyncio.Event())
+        self._tasks[handle.handle_id] = asyncio.create_task(self._run(handle, generate, fallback))
+        self.handles_created += 1
+        return handle
+
+    def get(self, handle_id: str) -> Optional[ConsequenceHandle]:
+        return self._handles.get(handle_id)
+
+    async def wait(self, handle_id: str, timeout: float) -> Optional[ConsequenceHandle]:
+        """Wait up to ``timeout`` seconds for a handle to finish (long polling)"""
+        handle = self._handles.get(handle_id)
+        task = self._tasks.get(handle_id)
+        if handle is not None and task is not None and timeout > 0:
+            await asyncio.wait({task}, timeout=timeout)
+        return handle
+
+    def pending(self, session_id: str) -> List[ConsequenceHandle]:
+        return [h for h in self._handles.values() if h.session_id == session_id and not h.done]
+
+    async def events(self, session_id: str, handle_ids: Iterable[str]) -> AsyncIterator[ConsequenceHandle]:
+        """Yield each handle as it finishes (finished ones first), in completion order"""
+        waiting = [h for h in (self._handles.get(i) for i in handle_ids) if h is not None]
+
+        while waiting:
+            # Grab the event before reading state so no update is missed
+            update = self._updates.setdefault(session_id, asyncio.Event())
+
+            for handle in [h for h in waiting if h.done]:
+                waiting.remove(handle)
+                yield handle
+
+            if waiting:
+                await update.wait()
+
+    def forget_session(self, session_id: str):
+        """
+        Cancel and drop everything held for a session
+
+        Pending handles are failed first and followers are woken, so a
+        stream following them ends instead of waiting forever.
+        """
+        for key in [k for k in self._pregenerated if k[0] == session_id]:
+            self._pregenerated.pop(key)[0].cancel()
+        for handle_id in [i for i, h in self._handles.items() if h.session_id == session_id]:
+            handle = self._handles.pop(handle_id)
+            task = self._tasks.pop(handle_id, None)
+            if task is not None:
+                task.cancel()
+            if not handle.done:
+                handle.status = "failed"
+                handle.error = "session deleted"
+                handle.finished_at = time.time()
+
+        update = self._updates.pop(session_id, None)
+        if update is not None:
+            update.set()
+
+    def stats(self) -> dict:
+        return {
+            "pregenerate": self.pregenerate_enabled,
+            "pregenerated": self.pregenerated,
+            "pregenerated_used": self.pregenerated_used,
+            "pregenerated_failed": self.pregenerated_failed,
+            "pregenerated_waiting": len(self._pregenerated),
+            "handles_created": self.handles_created,
+            "handles_pending": len(self._tasks)
+        }
+
+    async def _run(
+        self,
+        handle: ConsequenceHandle,
+        generate: Callable[[], Awaitable[str]],
+        fallback: Optional[Callable[[Exception], Optional[str]]]
+    ):
+        try:
+            handle.text = await generate()
+            handle.status = "ready"
+        except asyncio.CancelledError:
+            if not handle.done:
+                handle.status = "failed"
+                handle.error = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Deferred consequence failed: {str(e)}")
+            text = fallback(e) if fallback is not None else None
+            if text is not None:
+                handle.text = text
+                handle.status = "ready"
+                handle.degraded = True
+            else:
+                handle.status = "failed"
+                handle.error = str(e)
+        finally:
+            handle.finished_at = time.time()
+            self._tasks.pop(handle.handle_id, None)
+            self._notify(handle.session_id)
+
+    def _notify(self, session_id: str):
+        """Wake everyone following this session's consequences"""
+        event = self._updates.get(session_id)
+        if event is not None:
+            self._updates[session_id] = asyncio.Event()
+            event.set()
+
+    def _purge(self):
+        """Forget finished handles and unclaimed jobs older than retention_seconds"""
+        cutoff = time.time() - self.retention_seconds
+
+        for key, (task, started_at) in list(self._pregenerated.items()):
+            if started_at < cutoff:
+                task.cancel()
+                del self._pregenerated[key]
+
+        for handle_id, handle in list(self._handles.items()):
+            if handle.finished_at is not None and handle.finished_at < cutoff:
+                del self._handles[handle_id]
+
+        active = {h.session_id for h in self._handles.values()}
+        for session_id in [s for s in self._updates if s not in active]:
+            del self._updates[session_id]
+
+
+# Singleton instance
+consequence_delivery = ConsequenceDelivery()
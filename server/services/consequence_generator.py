@@ -1,16 +1,57 @@
 # Delayed consequences
 from services.llm_service import llm_service
+from services.response_cache import ResponseCache, make_cache_key, normalize_text
+from services.history_compactor import history_compactor
+from services.metrics import timed
 from models.scenario import ConsequenceRule, UserDecisionHistory
-from typing import Optional
+from typing import Iterable, List
+import config
 
 class ConsequenceGenerator:
     """Generates realistic consequences based on decision history"""
     
+    # Bump when the prompts change so stale precomputed consequences are not served
+    PROMPT_VERSION = 1
+    
+    def __init__(self):
+        self.cache = ResponseCache(
+            name="consequences",
+            max_entries=config.CONSEQUENCE_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.ANALYSIS_CACHE_TTL_SECONDS
+        )
+    
+    def input_key(
+        self,
+        rule: ConsequenceRule,
+        history: UserDecisionHistory,
+        context: str,
+        rules: Iterable[ConsequenceRule] = ()
+    ) -> str:
+        """Content address of a consequence prompt's inputs"""
+        choices = history.choices_made
+        compact = self._compact(rule, history, rules)
+        if compact.summary is None:
+            history_key = [[c["step"], normalize_text(c["choice_text"])] for c in choices]
+        else:
+            history_key = [normalize_text(compact.summary)] + [
+                [choices[p]["step"], normalize_text(text)] for p, text in compact.verbatim
+            ]
+        
+        return make_cache_key(
+            "consequence",
+            self.PROMPT_VERSION,
+            llm_service.model,
+            rule.model_dump(),
+            normalize_text(context),
+            history_key
+        )
+    
     async def generate_consequence(
         self,
         rule: ConsequenceRule,
         history: UserDecisionHistory,
-        context: str
+        context: str,
+        rules: Iterable[ConsequenceRule] = ()
     ) -> str:
         """
         Generate consequence text based on a rule and user history
@@ -19,13 +60,22 @@ class ConsequenceGenerator:
             rule: ConsequenceRule defining the consequence
             history: User's complete decision history
             context: Current scenario context
+            rules: The scenario's consequence rules; choices that trigger
+                any still to come are kept verbatim if the history is compacted
             
         Returns:
             Generated consequence text
         """
         
+        # Same rule, context and history -> same prompt
+        key = self.input_key(rule, history, context, rules)
+        with timed("cache"):
+            cached = await self.cache.fetch(key)
+        if cached is not None:
+            return cached
+        
         # Build decision history summary
-        history_text = self._format_history(history)
+        history_text = self._format_history(rule, history, rules)
         
         system_prompt = """You are a scenario writer creating realistic consequences for ethical decisions.
 Generate consequences that:
@@ -50,51 +100,90 @@ The consequence should feel natural and show how the earlier decision ripples fo
             prompt=user_prompt,
             system_prompt=system_prompt,
             temperature=0.8,  # Higher for creative consequences
-            max_tokens=200
+            max_tokens=200,
+            priority="consequence"
         )
         
-        return consequence.strip()
+        consequence = consequence.strip()
+        self.cache.set(key, consequence)
+        
+        return consequence
     
-    def _format_history(self, history: UserDecisionHistory) -> str:
+    def _compact(
+        self,
+        rule: ConsequenceRule,
+        history: UserDecisionHistory,
+        rules: Iterable[ConsequenceRule],
+        record: bool = False
+    ):
+        """Fit the history to the token budget, keeping the rule's trigger verbatim"""
+        choices = history.choices_made
+        pinned = {i for i, c in enumerate(choices) if c["step"] == rule.trigger_step}
+        pinned.update(self.pending_trigger_positions(choices, rules, rule.appears_at_step))
+        return history_compactor.compact([c["choice_text"] for c in choices], pinned, record=record)
+    
+    def _format_history(
+        self,
+        rule: ConsequenceRule,
+        history: UserDecisionHistory,
+        rules: Iterable[ConsequenceRule] = ()
+    ) -> str:
         """Format decision history for LLM context"""
         if not history.choices_made:
             return "No previous decisions."
         
+        compact = self._compact(rule, history, rules, record=True)
         formatted = []
-        for choice in history.choices_made:
-            formatted.append(f"Step {choice['step']}: {choice['choice_text']}")
+        if compact.summary is not None:
+            formatted.append(f"Earlier steps (summarized): {compact.summary}")
+        for position, text in compact.verbatim:
+            formatted.append(f"Step {history.choices_made[position]['step']}: {text}")
         
         return "\n".join(formatted)
     
+    def pending_trigger_positions(
+        self,
+        choices: List[dict],
+        rules: Iterable[ConsequenceRule],
+        current_step: int
+    ) -> List[int]:
+        """Positions in choices that trigger a consequence appearing after current_step"""
+        pending = {
+            (rule.trigger_step, rule.trigger_choice)
+            for rule in rules
+            if rule.appears_at_step > current_step
+        }
+        return [
+            i for i, choice in enumerate(choices)
+            if (choice["step"], choice["choice_id"]) in pending
+        ]
+    
     def check_consequence_triggers(
         self,
         history: UserDecisionHistory,
         current_step: int,
-        rules: list[ConsequenceRule]
-    ) -> Optional[ConsequenceRule]:
+        rules: Iterable[ConsequenceRule]
+    ) -> List[ConsequenceRule]:
         """
-        Check if any consequence should trigger at current step
+        Find every consequence that should trigger at current step
         
         Args:
             history: User's decision history
             current_step: Current step number
-            rules: All consequence rules for scenario
+            rules: Candidate rules, ideally pre-filtered with
+                ScenarioEngine.get_rules_at_step
             
         Returns:
-            ConsequenceRule if triggered, None otherwise
+            All triggered ConsequenceRules, in rule order (empty if none)
         """
-        for rule in rules:
-            # Check if consequence should appear at this step
-            if rule.appears_at_step != current_step:
-                continue
-            
-            # Check if triggering choice was made
-            for choice in history.choices_made:
-                if (choice['step'] == rule.trigger_step and 
-                    choice['choice_id'] == rule.trigger_choice):
-                    return rule
+        # (step, choice_id) pairs the user has chosen
+        chosen = {(choice['step'], choice['choice_id']) for choice in history.choices_made}
         
-        return None
+        return [
+            rule for rule in rules
+            if rule.appears_at_step == current_step
+            and (rule.trigger_step, rule.trigger_choice) in chosen
+        ]
 
 
 # Singleton instance
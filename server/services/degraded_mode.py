@@ -0,0 +1,121 @@
+# Degraded-mode answers for decision submits while the LLM is unavailable
+from services.framework_analyzer import framework_analyzer
+from services.precompute import precomputed_store
+from services.response_cache import ResponseCache, make_cache_key
+from services.llm_resilience import LLMError
+from models.analysis import FrameworkAnalysis
+from models.scenario import ConsequenceRule
+from typing import List, Optional
+import config
+
+
+class DegradedFallback:
+    """
+    Keeps a play-through going when the analysis or consequence calls fail
+
+    Every complete analysis served for a (scenario, step, choice) is kept,
+    whatever the history it was written for. When the LLM call for a
+    submit fails, the closest available stand-in is served instead, in
+    this order:
+
+        cached: the latest analysis of the same choice in another session
+        precomputed: the offline artifact's analysis of the same choice
+        template: generic per-framework prompts built from the choice text
+
+    A failed consequence is replaced by its rule's ``consequence_template``.
+    Responses that use any of these are flagged as degraded.
+
+    Only LLM failures (provider errors, timeouts, open circuit, shed load)
+    fall back; anything else still surfaces as an error.
+    """
+
+    TEMPLATES = {
+        "utilitarian": 'Weigh who is helped and who is harmed by choosing to "{choice}", and whether the overall outcome leaves people better off.',
+        "deontological": 'Consider which duties, promises and rules are honored or broken by choosing to "{choice}".',
+        "virtue_ethics": 'Consider what choosing to "{choice}" shows about character: honesty, courage, fairness and loyalty.',
+        "care_ethics": 'Consider how choosing to "{choice}" affects the relationships and the people who depend on you.'
+    }
+
+    def __init__(self, enabled: bool = config.DEGRADED_MODE):
+        self.enabled = enabled
+        self.analyses = ResponseCache(
+            name="degraded_analyses",
+            max_entries=config.DEGRADED_ANALYSIS_MAX_ENTRIES,
+            ttl_seconds=config.ANALYSIS_CACHE_TTL_SECONDS
+        )
+
+        # Fallbacks served, by source
+        self.served = {"cached": 0, "precomputed": 0, "template": 0, "consequence_template": 0}
+
+    def applies(self, error: BaseException) -> bool:
+        """Whether a failed LLM job may be answered in degraded mode"""
+        return self.enabled and isinstance(error, LLMError)
+
+    def remember(self, scenario_id: str, step: int, choice_id: str, analysis: FrameworkAnalysis):
+        """Keep a complete analysis as the stand-in for this choice"""
+        if self.enabled and framework_analyzer.is_complete(analysis):
+            self.analyses.set(
+                self._key(scenario_id, step, choice_id),
+                analysis.model_dump_json(exclude={"raw_response"})
+            )
+
+    def analysis(
+        self,
+        scenario_id: str,
+        step: int,
+        choice_path: List[str],
+        choice_text: str
+    ) -> tuple[FrameworkAnalysis, str]:
+        """
+        Closest stand-in analysis for the last choice in choice_path
+
+        Returns:
+            (analysis, source) with source "cached", "precomputed" or "template"
+        """
+        cached = self.analyses.get(self._key(scenario_id, step, choice_path[-1]))
+        if cached is not None:
+            return self._serve(framework_analyzer.build_analysis(cached), "cached")
+
+        raw = precomputed_store.closest_analysis(scenario_id, choice_path)
+        if raw:
+            analysis = framework_analyzer.build_analysis(raw)
+            if framework_analyzer.is_complete(analysis):
+                return self._serve(analysis, "precomputed")
+
+        return self._serve(self.template_analysis(choice_text), "template")
+
+    def template_analysis(self, choice_text: str) -> FrameworkAnalysis:
+        """Generic analysis prompts for a choice, written without the LLM"""
+        choice = " ".join(choice_text.split()).rstrip(".")
+        return FrameworkAnalysis(
+            **{field: template.format(choice=choice) for field, template in self.TEMPLATES.items()},
+            raw_response=""
+        )
+
+    def consequence(self, rule: ConsequenceRule) -> str:
+        """Stand-in consequence: the rule's own template"""
+        self.served["consequence_template"] += 1
+        return rule.consequence_template
+
+    def clear(self):
+        """Forget the kept analyses (e.g. after a prompt or model change)"""
+        self.analyses.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "served": dict(self.served),
+            "analyses": self.analyses.stats()
+        }
+
+    def _serve(self, analysis: FrameworkAnalysis, source: str) -> tuple[FrameworkAnalysis, str]:
+        self.served[source] += 1
+        return analysis, source
+
+    @staticmethod
+    def _key(scenario_id: str, step: int, choice_id: str) -> str:
+        return make_cache_key("degraded_analysis", scenario_id, step, choice_id)
+
+
+# Singleton instance
+degraded_fallback = DegradedFallback()
@@ -1,7 +1,14 @@
 # Ethical framework analysis
 from services.llm_service import llm_service
-from models.analysis import FrameworkAnalysis
-from typing import List
+from services.response_cache import ResponseCache, make_cache_key, normalize_text
+from services.history_compactor import history_compactor
+from services.metrics import timed
+from models.analysis import FrameworkAnalysis, FrameworkSections
+from pydantic import ValidationError
+from typing import AsyncIterator, Iterable, List, Optional
+import json
+import re
+import config
 
 class FrameworkAnalyzer:
     """Analyzes decisions through multiple ethical frameworks"""
@@ -11,12 +18,79 @@ class FrameworkAnalyzer:
         "Virtue Ethics",
         "Care Ethics"
     ]
+
+    # FrameworkAnalysis field for each framework heading
+    FIELD_NAMES = {
+        "Utilitarian": "utilitarian",
+        "Deontological": "deontological",
+        "Virtue Ethics": "virtue_ethics",
+        "Care Ethics": "care_ethics"
+    }
+
+    # Bump when the prompts change so stale cached analyses are not served
+    PROMPT_VERSION = 1
+    TEMPERATURE = 0.6
+    MAX_TOKENS = 600
+
+    # A finished "field": "value" pair while a JSON analysis streams in
+    JSON_SECTION = re.compile(r'"(utilitarian|deontological|virtue_ethics|care_ethics)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+    def __init__(self, output_format: str = config.ANALYSIS_OUTPUT_FORMAT):
+        # "json" asks for structured output; "markdown" for **Framework:** sections
+        self.output_format = output_format
+
+        # How responses were parsed
+        self.parsed_json = 0
+        self.parsed_heuristic = 0
+        self.parse_failures = 0
+
+        self.cache = ResponseCache(
+            name="framework_analysis",
+            max_entries=config.ANALYSIS_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.ANALYSIS_CACHE_TTL_SECONDS,
+            disk_path=config.ANALYSIS_CACHE_PATH or None,
+            disk_max_entries=config.ANALYSIS_CACHE_DISK_MAX_ENTRIES
+        )
+
+    def cache_key(
+        self,
+        context: str,
+        choice: str,
+        decision_history: List[str] = None,
+        pinned: Iterable[int] = ()
+    ) -> str:
+        """
+        Content address of an analysis: normalized inputs plus model settings
+
+        The history is keyed as it appears in the prompt, so it is only
+        affected by ``pinned`` once the history is long enough to be compacted.
+        """
+        history = history_compactor.compact(decision_history or [], pinned)
+        if history.summary is None:
+            history_key = [normalize_text(d) for d in decision_history or []]
+        else:
+            history_key = [normalize_text(history.summary)] + [
+                [position, normalize_text(text)] for position, text in history.verbatim
+            ]
+
+        return make_cache_key(
+            "analysis",
+            self.PROMPT_VERSION,
+            self.output_format,
+            llm_service.model,
+            self.TEMPERATURE,
+            self.MAX_TOKENS,
+            normalize_text(context),
+            normalize_text(choice),
+            history_key
+        )
     
     async def analyze_decision(
         self,
         context: str,
         choice: str,
-        decision_history: List[str] = None
+        decision_history: List[str] = None,
+        pinned: Iterable[int] = ()
     ) -> FrameworkAnalysis:
         """
         Analyze a single decision through all ethical frameworks
@@ -25,20 +99,66 @@ class FrameworkAnalyzer:
             choice: The decision made (e.g., "Tell Tom immediately")
             context: Current scenario context
             decision_history: Previous choices made
+            pinned: Positions in decision_history to keep verbatim if the
+                history has to be compacted (e.g. pending consequence triggers)
             
         Returns:
             FrameworkAnalysis object with all 4 framework perspectives
         """
         
-        # Build context with history
+        # Identical inputs always produce the same prompt, so serve from cache
+        key = self.cache_key(context, choice, decision_history, pinned)
+        with timed("cache"):
+            cached = await self.cache.fetch(key)
+        if cached is not None:
+            return self.build_analysis(cached)
+
+        system_prompt, user_prompt = self._build_prompts(context, choice, decision_history, pinned)
+
+        # Generate analysis
+        response = await llm_service.generate_completion(
+            prompt=user_prompt,
+            system_prompt=system_prompt,
+            temperature=self.TEMPERATURE,  # Lower for more consistent analysis
+            max_tokens=self.MAX_TOKENS,
+            json_mode=self.output_format == "json",
+            priority="analysis"
+        )
+        
+        analysis = self.build_analysis(response, record=True)
+        if self.is_complete(analysis):
+            self.cache.set(key, response)
+        
+        return analysis
+    
+    def _build_prompts(
+        self,
+        context: str,
+        choice: str,
+        decision_history: List[str] = None,
+        pinned: Iterable[int] = ()
+    ) -> tuple[str, str]:
+        """Build (system_prompt, user_prompt) for an analysis request"""
+        # Build context with history, compacted to the history token budget
         history_text = ""
         if decision_history:
-            history_text = "\n\nPrevious decisions:\n" + "\n".join(
-                f"{i+1}. {d}" for i, d in enumerate(decision_history)
-            )
+            history = history_compactor.compact(decision_history, pinned, record=True)
+            lines = [f"{i+1}. {d}" for i, d in history.verbatim]
+            if history.summary is not None:
+                lines.insert(0, f"Earlier (summarized): {history.summary}")
+            history_text = "\n\nPrevious decisions:\n" + "\n".join(lines)
         
         # System prompt for consistent output
-        system_prompt = """You are an expert in applied ethics. Analyze decisions through multiple ethical frameworks.
+        if self.output_format == "json":
+            system_prompt = """You are an expert in applied ethics. Analyze decisions through multiple ethical frameworks.
+Be concise (20-30 words per framework), objective, and non-judgmental.
+Respond with a single JSON object with exactly these string fields:
+
+{"utilitarian": "...", "deontological": "...", "virtue_ethics": "...", "care_ethics": "..."}
+
+Do NOT use emojis or markdown. Be professional and educational."""
+        else:
+            system_prompt = """You are an expert in applied ethics. Analyze decisions through multiple ethical frameworks.
 Be concise (20-30 words per framework), objective, and non-judgmental.
 Use this format for EACH framework:
 
@@ -59,16 +179,119 @@ Analyze this decision through these 4 frameworks:
 
 Provide analysis for each framework."""
 
-        # Generate analysis
-        response = await llm_service.generate_completion(
+        return system_prompt, user_prompt
+
+    async def stream_analysis(
+        self,
+        context: str,
+        choice: str,
+        decision_history: List[str] = None,
+        pinned: Iterable[int] = ()
+    ) -> AsyncIterator[dict]:
+        """
+        Stream an analysis as it is generated
+
+        Yields events in order:
+            {"type": "token", "text": ...} for each streamed chunk
+            {"type": "section", "framework": ..., "text": ...} as soon as a
+                framework's section is complete (the next one has started)
+            {"type": "analysis", "analysis": FrameworkAnalysis} at the end
+
+        Cache hits skip the token events and emit all sections at once.
+        """
+        key = self.cache_key(context, choice, decision_history, pinned)
+        with timed("cache"):
+            cached = await self.cache.fetch(key)
+        if cached is not None:
+            analysis = self.build_analysis(cached)
+            for framework in self.FRAMEWORKS:
+                yield self._section_event(framework, analysis)
+            yield {"type": "analysis", "analysis": analysis}
+            return
+
+        system_prompt, user_prompt = self._build_prompts(context, choice, decision_history, pinned)
+
+        response = ""
+        emitted = set()
+
+        # No json_mode: Groq does not support response_format together with
+        # stream=True, so the JSON shape comes from the system prompt alone
+        async for chunk in llm_service.stream_completion(
             prompt=user_prompt,
             system_prompt=system_prompt,
-            temperature=0.6,  # Lower for more consistent analysis
-            max_tokens=600
-        )
-        
-        # Parse response into structured format
+            temperature=self.TEMPERATURE,
+            max_tokens=self.MAX_TOKENS,
+            priority="analysis"
+        ):
+            response += chunk
+            yield {"type": "token", "text": chunk}
+
+            if self.output_format == "json":
+                # A section is complete once its string value is closed
+                for match in self.JSON_SECTION.finditer(response):
+                    field = match.group(1)
+                    if field in emitted:
+                        continue
+                    try:
+                        # Models put raw newlines in strings; strict=False accepts them
+                        text = json.loads(f'"{match.group(2)}"', strict=False)
+                    except ValueError:
+                        # Left to the final parse below
+                        continue
+                    emitted.add(field)
+                    yield {"type": "section", "framework": field, "text": text}
+                continue
+
+            # A section is complete once a later framework heading shows up
+            seen = [fw for fw in self.FRAMEWORKS if fw in response]
+            if len(seen) - 1 > len(emitted):
+                seen.sort(key=response.find)
+                parsed = self._parse_analysis(response)
+                for framework in seen[:-1]:
+                    field = self.FIELD_NAMES[framework]
+                    if field not in emitted and framework in parsed:
+                        emitted.add(field)
+                        yield {"type": "section", "framework": field, "text": parsed[framework]}
+
+        analysis = self.build_analysis(response, record=True)
+        if self.is_complete(analysis):
+            self.cache.set(key, response)
+
+        for framework in self.FRAMEWORKS:
+            if self.FIELD_NAMES[framework] not in emitted:
+                yield self._section_event(framework, analysis)
+        yield {"type": "analysis", "analysis": analysis}
+
+    def _section_event(self, framework: str, analysis: FrameworkAnalysis) -> dict:
+        """Section event for a framework taken from a finished analysis"""
+        field = self.FIELD_NAMES[framework]
+        return {"type": "section", "framework": field, "text": getattr(analysis, field)}
+
+    def build_analysis(self, response: str, record: bool = False) -> FrameworkAnalysis:
+        """
+        Parse raw LLM response into a FrameworkAnalysis
+
+        JSON responses are validated straight from the text by pydantic;
+        anything else (or invalid JSON) goes through the heuristic
+        ``**Framework:**`` parser. ``record`` counts the outcome in the
+        parse stats (fresh LLM responses only, not cache hits).
+        """
+        with timed("parse"):
+            return self._build_analysis(response, record)
+
+    def _build_analysis(self, response: str, record: bool) -> FrameworkAnalysis:
+        sections = self._parse_json(response)
+        if sections is not None:
+            if record:
+                self.parsed_json += 1
+            return FrameworkAnalysis(**sections.model_dump(), raw_response=response)
+
         analysis = self._parse_analysis(response)
+        if record:
+            if len(analysis) == len(self.FRAMEWORKS):
+                self.parsed_heuristic += 1
+            else:
+                self.parse_failures += 1
         
         return FrameworkAnalysis(
             utilitarian=analysis.get("Utilitarian", "Analysis unavailable"),
@@ -78,6 +301,46 @@ Provide analysis for each framework."""
             raw_response=response
         )
     
+    def is_complete(self, analysis: FrameworkAnalysis) -> bool:
+        """True when every framework section was found"""
+        return all(
+            getattr(analysis, field) != "Analysis unavailable"
+            for field in self.FIELD_NAMES.values()
+        )
+
+    def stats(self) -> dict:
+        """How responses were parsed, and how often the JSON path was missed"""
+        total = self.parsed_json + self.parsed_heuristic + self.parse_failures
+        return {
+            "output_format": self.output_format,
+            "parsed_json": self.parsed_json,
+            "parsed_heuristic": self.parsed_heuristic,
+            "parse_failures": self.parse_failures,
+            "fallback_ratio": round((total - self.parsed_json) / total, 4) if total else 0.0
+        }
+
+    def _parse_json(self, response: str) -> Optional[FrameworkSections]:
+        """
+        Validate a structured-output response, or None if it is not one
+
+        Streamed responses aren't constrained by JSON mode, so the object
+        may come wrapped in a code fence or prose, and its strings may hold
+        raw newlines.
+        """
+        start, end = response.find("{"), response.rfind("}")
+        if start < 0 or end < start:
+            return None
+        text = response[start:end + 1]
+
+        try:
+            return FrameworkSections.model_validate_json(text)
+        except ValidationError:
+            pass
+        try:
+            return FrameworkSections.model_validate(json.loads(text, strict=False))
+        except (ValueError, ValidationError):
+            return None
+
     def _parse_analysis(self, response: str) -> dict:
         """Parse LLM response into framework dictionary"""
         analysis = {}
@@ -0,0 +1,240 @@
+# Framework analysis and triggered consequences in one LLM call
+from services.llm_service import llm_service
+from services.framework_analyzer import framework_analyzer
+from services.history_compactor import history_compactor
+from services.response_cache import ResponseCache, make_cache_key
+from services.metrics import timed
+from models.analysis import FrameworkAnalysis, FrameworkSections, FusedSections
+from models.scenario import ConsequenceRule, UserDecisionHistory
+from pydantic import ValidationError
+from typing import Iterable, List, Optional
+import json
+import config
+
+
+class FusedAnalyzer:
+    """
+    One structured request for a step's analysis and its consequences
+
+    On steps where consequences fire, the two-call path sends the scenario
+    context and decision history once for the analysis and again for each
+    consequence. The fused prompt carries them once and asks for a single
+    JSON object holding the four framework analyses and one consequence per
+    triggered rule. Complete responses are cached under their own keys
+    (the prompts and sampling settings), never under the two-call keys: a
+    fused answer comes from a different prompt and temperature, and must
+    not be served as a two-call one.
+
+    Anything the response lacks is left to the caller: the analysis is
+    None unless all four frameworks came back, and a missing consequence
+    is None.
+    """
+
+    # Bump when the prompts change so stale cached responses are not served
+    PROMPT_VERSION = 1
+    # Between the analysis (0.6) and consequence (0.8) settings
+    TEMPERATURE = 0.7
+    MAX_TOKENS = framework_analyzer.MAX_TOKENS
+    MAX_TOKENS_PER_CONSEQUENCE = 200
+
+    def __init__(self, enabled: bool = config.FUSED_ANALYSIS):
+        self.enabled = enabled
+        self.cache = ResponseCache(
+            name="fused_analysis",
+            max_entries=config.ANALYSIS_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.ANALYSIS_CACHE_TTL_SECONDS
+        )
+
+        # Counters
+        self.calls = 0
+        self.complete = 0
+        self.missing_analysis = 0
+        self.missing_consequences = 0
+        self.errors = 0
+
+    async def analyze(
+        self,
+        context: str,
+        scenario_context: str,
+        choice: str,
+        history: UserDecisionHistory,
+        position: int,
+        pinned: Iterable[int],
+        triggered: List[ConsequenceRule]
+    ) -> tuple[Optional[FrameworkAnalysis], List[Optional[str]]]:
+        """
+        Analyze the choice at ``history.choices_made[position]`` and write
+        the ``triggered`` consequences in one call
+
+        Args:
+            context: Current decision point context
+            scenario_context: Scenario description (the consequence context)
+            choice: The decision made
+            history: Session history including the current choice
+            position: Index of the current choice in history.choices_made
+            pinned: History positions the analysis keeps verbatim if compacted
+            triggered: Rules whose consequences are written in this call
+
+        Returns:
+            (analysis or None, consequence text or None per triggered rule)
+
+        Raises:
+            LLMError: if the call itself fails
+        """
+        system_prompt, user_prompt = self._build_prompts(
+            context, scenario_context, choice, history, position, pinned, triggered
+        )
+        max_tokens = self.MAX_TOKENS + self.MAX_TOKENS_PER_CONSEQUENCE * len(triggered)
+        key = make_cache_key(
+            "fused",
+            self.PROMPT_VERSION,
+            llm_service.model,
+            self.TEMPERATURE,
+            max_tokens,
+            system_prompt,
+            user_prompt
+        )
+
+        with timed("cache"):
+            cached = await self.cache.fetch(key)
+        if cached is not None:
+            sections, consequences = self._parse(cached, len(triggered))
+            return FrameworkAnalysis(**sections.model_dump(), raw_response=cached), consequences
+
+        self.calls += 1
+        try:
+            response = await llm_service.generate_completion(
+                prompt=user_prompt,
+                system_prompt=system_prompt,
+                temperature=self.TEMPERATURE,
+                max_tokens=max_tokens,
+                json_mode=True,
+                priority="analysis"
+            )
+        except Exception:
+            self.errors += 1
+            raise
+
+        with timed("parse"):
+            sections, consequences = self._parse(response, len(triggered))
+
+        analysis = None
+        if sections is not None:
+            analysis = FrameworkAnalysis(**sections.model_dump(), raw_response=response)
+        else:
+            self.missing_analysis += 1
+        self.missing_consequences += consequences.count(None)
+
+        if analysis is not None and None not in consequences:
+            self.complete += 1
+            self.cache.set(key, response)
+        return analysis, consequences
+
+    def _build_prompts(
+        self,
+        context: str,
+        scenario_context: str,
+        choice: str,
+        history: UserDecisionHistory,
+        position: int,
+        pinned: Iterable[int],
+        triggered: List[ConsequenceRule]
+    ) -> tuple[str, str]:
+        """Build (system_prompt, user_prompt) for a fused request"""
+        choices = history.choices_made[:position]
+
+        # History once, compacted keeping the analysis pins and every trigger
+        keep = set(pinned)
+        triggers = {(rule.trigger_step, rule.trigger_choice) for rule in triggered}
+        keep.update(i for i, c in enumerate(choices) if (c["step"], c["choice_id"]) in triggers)
+
+        lines = []
+        if choices:
+            compact = history_compactor.compact([c["choice_text"] for c in choices], keep, record=True)
+            if compact.summary is not None:
+                lines.append(f"Earlier steps (summarized): {compact.summary}")
+            lines.extend(f"Step {choices[p]['step']}: {text}" for p, text in compact.verbatim)
+        history_text = "\n".join(lines) or "No previous decisions."
+
+        step = history.choices_made[position]["step"]
+        consequence_lines = "\n".join(
+            f"{i + 1}. Triggered by the choice made at step {rule.trigger_step}. "
+            f"Template: {rule.consequence_template}"
+            for i, rule in enumerate(triggered)
+        )
+
+        system_prompt = """You are an expert in applied ethics and a scenario writer.
+Analyze decisions through multiple ethical frameworks: concise (20-30 words per framework), objective, and non-judgmental.
+Write consequences of earlier decisions that are believable, connect logically to those decisions, are 50-100 words, neutral in tone, and show both positive and negative ripple effects.
+Respond with a single JSON object with exactly these fields:
+
+{"utilitarian": "...", "deontological": "...", "virtue_ethics": "...", "care_ethics": "...", "consequences": ["...", ...]}
+
+"consequences" holds one string per requested consequence, in the order listed.
+Do NOT use emojis or markdown. Be professional and educational."""
+
+        user_prompt = f"""Scenario Context: {scenario_context}
+
+Current Situation: {context}
+
+User Decision History:
+{history_text}
+
+Current Decision (step {step}): "{choice}"
+
+Analyze this decision through these 4 frameworks:
+1. **Utilitarian:** Focus on consequences and overall welfare
+2. **Deontological:** Focus on duties, rules, and principles
+3. **Virtue Ethics:** Focus on character and moral virtues demonstrated
+4. **Care Ethics:** Focus on relationships, empathy, and context
+
+Then write these consequences, which appear now at step {step}; each should feel natural and show how the earlier decision ripples forward in unexpected ways:
+{consequence_lines}"""
+
+        return system_prompt, user_prompt
+
+    def _parse(self, response: str, count: int) -> tuple[Optional[FrameworkSections], List[Optional[str]]]:
+        """Sections and consequences from a response, salvaging what is valid"""
+        text = response.strip()
+        if text.startswith("```"):
+            text = text.strip("`").removeprefix("json").strip()
+
+        try:
+            fused = FusedSections.model_validate_json(text)
+            if len(fused.consequences) == count:
+                return fused, [c.strip() or None for c in fused.consequences]
+        except ValidationError:
+            pass
+
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None, [None] * count
+        if not isinstance(data, dict):
+            return None, [None] * count
+
+        try:
+            sections = FrameworkSections.model_validate(data)
+        except ValidationError:
+            sections = None
+
+        consequences = data.get("consequences")
+        if not isinstance(consequences, list):
+            consequences = []
+        consequences = [c.strip() or None if isinstance(c, str) else None for c in consequences[:count]]
+        return sections, consequences + [None] * (count - len(consequences))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "complete": self.complete,
+            "missing_analysis": self.missing_analysis,
+            "missing_consequences": self.missing_consequences,
+            "errors": self.errors,
+            "cache": self.cache.stats()
+        }
+
+
+# Singleton instance
+fused_analyzer = FusedAnalyzer()
@@ -0,0 +1,142 @@
+# Token-budgeted compaction of decision histories for prompts
+from collections import OrderedDict
+from typing import Iterable, List, NamedTuple, Optional
+import config
+
+
+# Between summary lines
+SEPARATOR = "; "
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+
+class CompactHistory(NamedTuple):
+    """A history as it goes into a prompt"""
+    summary: Optional[str]  # older choices folded into one line, or None
+    verbatim: List[tuple[int, str]]  # (position, text) of choices kept as-is
+    tokens_before: int
+    tokens_after: int
+
+
+class HistoryCompactor:
+    """
+    Keeps the decision history in a prompt within ``token_budget``
+
+    Histories that fit are left untouched, so short scenarios get exactly
+    the prompts (and cache keys) they always had. Longer ones keep the
+    ``keep_recent`` latest choices and any pinned positions (choices that
+    trigger consequences still to come) verbatim and fold the oldest of
+    the rest into a summary line until the budget is met.
+
+    Summaries are extractive: each choice is cut to its first
+    ``summary_words`` words. The line for a choice is computed once, the
+    first time it ages out, and reused by every later prompt; the result
+    is deterministic, so prompts stay content-addressable.
+    """
+
+    MAX_MEMO_ENTRIES = 4096
+
+    def __init__(
+        self,
+        token_budget: int = config.HISTORY_TOKEN_BUDGET,
+        keep_recent: int = config.HISTORY_KEEP_RECENT_STEPS,
+        summary_words: int = config.HISTORY_SUMMARY_WORDS
+    ):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_words = summary_words
+        self._lines: "OrderedDict[str, str]" = OrderedDict()
+
+        # Counters over prompts actually sent
+        self.prompts = 0
+        self.prompts_compacted = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def compact(self, texts: List[str], pinned: Iterable[int] = (), record: bool = False) -> CompactHistory:
+        """
+        Fit ``texts`` (oldest first) into the token budget
+
+        ``record`` counts the result in the before/after token stats; pass
+        it only when the history is really going into a prompt.
+        """
+        tokens_before = sum(estimate_tokens(text) for text in texts)
+
+        if tokens_before <= self.token_budget:
+            result = CompactHistory(None, list(enumerate(texts)), tokens_before, tokens_before)
+        else:
+            result = self._fold(texts, set(pinned), tokens_before)
+
+        if record:
+            self.prompts += 1
+            self.prompts_compacted += result.summary is not None
+            self.tokens_before += result.tokens_before
+            self.tokens_after += result.tokens_after
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "prompts": self.prompts,
+            "prompts_compacted": self.prompts_compacted,
+            "history_tokens_before": self.tokens_before,
+            "history_tokens_after": self.tokens_after,
+            "saved_ratio": round(1 - self.tokens_after / self.tokens_before, 4) if self.tokens_before else 0.0
+        }
+
+    def _fold(self, texts: List[str], pinned: set, tokens_before: int) -> CompactHistory:
+        keep = pinned | set(range(max(0, len(texts) - self.keep_recent), len(texts)))
+
+        # Fold the oldest unpinned choices until the budget is met
+        folded: List[int] = []
+        tokens = tokens_before
+        for position, text in enumerate(texts):
+            if tokens <= self.token_budget:
+                break
+            if position in keep:
+                continue
+            folded.append(position)
+            tokens += estimate_tokens(self._summary_line(text) + SEPARATOR) - estimate_tokens(text)
+
+        folded_set = set(folded)
+        verbatim = [(p, text) for p, text in enumerate(texts) if p not in folded_set]
+        verbatim_tokens = sum(estimate_tokens(text) for _, text in verbatim)
+
+        # Still over budget once joined: drop the oldest summary lines altogether
+        lines = [self._summary_line(texts[position]) for position in folded]
+        omitted = 0
+        summary = self._join(lines, omitted)
+        while lines and verbatim_tokens + estimate_tokens(summary) > self.token_budget:
+            lines.pop(0)
+            omitted += 1
+            summary = self._join(lines, omitted)
+
+        tokens_after = estimate_tokens(summary) + verbatim_tokens
+        return CompactHistory(summary or None, verbatim, tokens_before, tokens_after)
+
+    @staticmethod
+    def _join(lines: List[str], omitted: int) -> str:
+        summary = SEPARATOR.join(lines)
+        if omitted:
+            summary = f"({omitted} earlier decisions omitted) {summary}".strip()
+        return summary
+
+    def _summary_line(self, text: str) -> str:
+        """One-line digest of a choice, memoized"""
+        line = self._lines.get(text)
+        if line is None:
+            words = text.split()
+            line = " ".join(words[:self.summary_words])
+            if len(words) > self.summary_words:
+                line += "..."
+            self._lines[text] = line
+            if len(self._lines) > self.MAX_MEMO_ENTRIES:
+                self._lines.popitem(last=False)
+        return line
+
+
+# Singleton instance
+history_compactor = HistoryCompactor()
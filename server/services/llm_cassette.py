@@ -0,0 +1,318 @@
+# Record/replay of LLM provider traffic for reproducible offline runs
+"""
+Usage (from server/):
+    LLM_CASSETTE_MODE=record LLM_CASSETTE_PATH=llm.cassette uvicorn main:app
+    LLM_CASSETTE_MODE=replay LLM_CASSETTE_PATH=llm.cassette LLM_CASSETTE_TIMING_SCALE=1 uvicorn main:app
+    python -m benchmarks.run --cassette llm.cassette --timing-scale 1
+    python -m services.llm_cassette llm.cassette    # summary of a recording
+"""
+from typing import Dict, List, Optional
+from services.response_cache import make_cache_key
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+import httpx
+
+MODES = ("record", "replay", "auto")
+
+
+def request_fingerprint(body: dict) -> str:
+    """Stable key of a chat completion request (model, messages, sampling, stream)"""
+    return make_cache_key(body)
+
+
+def _kept_headers(headers: httpx.Headers) -> dict:
+    """Response headers the client reacts to: content type, retry and rate-limit budget"""
+    return {
+        name: value
+        for name, value in headers.items()
+        if name in ("content-type", "retry-after") or name.startswith("x-ratelimit-")
+    }
+
+
+def _usage(body: bytes, content_type: str) -> tuple[int, int]:
+    """(prompt, completion) tokens reported in a recorded response, if any"""
+    try:
+        if "text/event-stream" in content_type:
+            # Usage comes on the final chunk (x_groq.usage on Groq)
+            for line in reversed(body.decode("utf-8").splitlines()):
+                if line.startswith("data: {") and '"usage"' in line:
+                    chunk = json.loads(line[6:])
+                    usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                    if usage:
+                        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            return 0, 0
+        usage = json.loads(body).get("usage") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    except (ValueError, AttributeError):
+        return 0, 0
+
+
+class LLMCassette(httpx.AsyncBaseTransport):
+    """
+    httpx transport that records provider responses and plays them back
+
+    Modes:
+        record: every request goes to ``upstream``; the response is stored
+        replay: requests are answered from the cassette only; a request
+            that was never recorded goes to ``fallback`` if one is given,
+            otherwise it fails with a 400 (not retried)
+        auto: replay what was recorded, record the rest
+
+    A recording is the status, the headers the client reacts to, the body
+    (zlib compressed) and when each body chunk arrived, so streamed
+    completions keep their time to first token and pacing. Token usage and
+    latency are stored alongside for reporting. Recordings live in a SQLite
+    file indexed by request fingerprint; a request made several times
+    keeps each response and replays them in order, wrapping around.
+
+    ``timing_scale`` stretches replayed timing: 0 answers instantly, 1
+    reproduces the recorded latencies.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "replay",
+        upstream: Optional[httpx.AsyncBaseTransport] = None,
+        fallback: Optional[httpx.AsyncBaseTransport] = None,
+        timing_scale: float = 0.0
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r} (expected one of {', '.join(MODES)})")
+        if mode != "replay" and upstream is None:
+            raise ValueError(f"Cassette mode {mode!r} needs an upstream transport")
+
+        self.path = path
+        self.mode = mode
+        self.upstream = upstream
+        self.fallback = fallback
+        self.timing_scale = timing_scale
+
+        # fingerprint -> next recording to replay
+        self._cursor: Dict[str, int] = {}
+
+        # Counters
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS recordings ("
+            "fingerprint TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "request BLOB NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, "
+            "body BLOB NOT NULL, chunks TEXT NOT NULL, "
+            "latency REAL NOT NULL, first_byte REAL NOT NULL, "
+            "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "recorded_at REAL NOT NULL, PRIMARY KEY (fingerprint, seq))"
+        )
+        self._db.commit()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        fingerprint = request_fingerprint(json.loads(request.content or b"{}"))
+
+        if self.mode != "record":
+            row = self._next_recording(fingerprint)
+            if row is not None:
+                self.replayed += 1
+                return self._replay(request, row)
+
+            self.misses += 1
+            if self.mode == "replay":
+                if self.fallback is not None:
+                    return await self.fallback.handle_async_request(request)
+                return httpx.Response(
+                    400,
+                    json={"error": {"message": f"No cassette recording for request {fingerprint[:12]}"}},
+                    request=request
+                )
+
+        return await self._record(request, fingerprint)
+
+    async def aclose(self):
+        for transport in (self.upstream, self.fallback):
+            if transport is not None:
+                await transport.aclose()
+
+    def close(self):
+        """Close the cassette file"""
+        self._db.close()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "timing_scale": self.timing_scale,
+            "recordings": self._db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0],
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses
+        }
+
+    # Replay
+
+    def _next_recording(self, fingerprint: str) -> Optional[tuple]:
+        rows = self._db.execute(
+            "SELECT status, headers, body, chunks FROM recordings WHERE fingerprint = ? ORDER BY seq",
+            (fingerprint, )
+        ).fetchall()
+        if not rows:
+            return None
+
+        cursor = self._cursor.get(fingerprint, 0)
+        self._cursor[fingerprint] = cursor + 1
+        return rows[cursor % len(rows)]
+
+    def _replay(self, request: httpx.Request, row: tuple) -> httpx.Response:
+        status, headers, body, chunks = row
+        return httpx.Response(
+            status,
+            headers=json.loads(headers),
+            stream=_ReplayStream(zlib.decompress(body), json.loads(chunks), self.timing_scale),
+            request=request
+        )
+
+    # Record
+
+    async def _record(self, request: httpx.Request, fingerprint: str) -> httpx.Response:
+        # Stored bodies are replayed as-is, so ask for them uncompressed
+        request.headers["Accept-Encoding"] = "identity"
+        started = time.perf_counter()
+        response = await self.upstream.handle_async_request(request)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(self, request, fingerprint, response, started),
+            request=request,
+            extensions=response.extensions
+        )
+
+    def _save(
+        self,
+        request: httpx.Request,
+        fingerprint: str,
+        response: httpx.Response,
+        body: bytes,
+        chunks: List[list],
+        first_byte: float,
+        latency: float
+    ):
+        prompt_tokens, completion_tokens = _usage(body, response.headers.get("content-type", ""))
+        seq = self._db.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM recordings WHERE fingerprint = ?", (fingerprint, )
+        ).fetchone()[0]
+        self._db.execute(
+            "INSERT INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                fingerprint, seq, zlib.compress(request.content), response.status_code,
+                json.dumps(_kept_headers(response.headers)), zlib.compress(body), json.dumps(chunks),
+                latency, first_byte, prompt_tokens, completion_tokens, time.time()
+            )
+        )
+        self._db.commit()
+        self.recorded += 1
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Recorded body, chunk by chunk at the recorded (scaled) offsets"""
+
+    def __init__(self, body: bytes, chunks: List[list], timing_scale: float):
+        self.body = body
+        self.chunks = chunks  # [seconds since the request was sent, length]
+        self.timing_scale = timing_scale
+
+    async def __aiter__(self):
+        started = time.perf_counter()
+        position = 0
+        for offset, length in self.chunks:
+            if self.timing_scale:
+                delay = offset * self.timing_scale - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield self.body[position:position + length]
+            position += length
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes the upstream body through and saves it once fully read"""
+
+    def __init__(
+        self,
+        cassette: LLMCassette,
+        request: httpx.Request,
+        fingerprint: str,
+        response: httpx.Response,
+        started: float
+    ):
+        self.cassette = cassette
+        self.request = request
+        self.fingerprint = fingerprint
+        self.response = response
+        self.started = started
+        self.first_byte = time.perf_counter() - started
+
+    async def __aiter__(self):
+        parts: List[bytes] = []
+        chunks: List[list] = []
+        async for part in self.response.stream:
+            chunks.append([round(time.perf_counter() - self.started, 4), len(part)])
+            parts.append(part)
+            yield part
+
+        # Only complete responses are worth replaying
+        self.cassette._save(
+            self.request,
+            self.fingerprint,
+            self.response,
+            b"".join(parts),
+            chunks,
+            self.first_byte,
+            time.perf_counter() - self.started
+        )
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+def summary(path: str) -> dict:
+    """Counts, tokens and latency of a cassette file"""
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute(
+            "SELECT status, latency, first_byte, prompt_tokens, completion_tokens FROM recordings"
+        ).fetchall()
+        fingerprints = db.execute("SELECT COUNT(DISTINCT fingerprint) FROM recordings").fetchone()[0]
+    finally:
+        db.close()
+
+    latencies = sorted(row[1] for row in rows)
+    statuses: Dict[int, int] = {}
+    for row in rows:
+        statuses[row[0]] = statuses.get(row[0], 0) + 1
+
+    return {
+        "recordings": len(rows),
+        "distinct_requests": fingerprints,
+        "statuses": statuses,
+        "prompt_tokens": sum(row[3] for row in rows),
+        "completion_tokens": sum(row[4] for row in rows),
+        "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "latency_max": latencies[-1] if latencies else 0.0,
+        "first_byte_mean": sum(row[2] for row in rows) / len(rows) if rows else 0.0
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python -m services.llm_cassette PATH")
+    print(json.dumps(summary(sys.argv[1]), indent=2))
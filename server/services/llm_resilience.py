@@ -0,0 +1,430 @@
+# Client-side rate limiting, retry classification, circuit breaking and admission control for LLM calls
+from collections import deque
+from typing import Dict, Mapping, Optional, Tuple
+import asyncio
+import math
+import re
+import time
+
+import groq
+
+
+class LLMError(Exception):
+    """
+    LLM call failure
+
+    ``retryable`` marks errors worth retrying (rate limits, timeouts,
+    connection failures, 5xx); ``retry_after`` is the provider's hint in
+    seconds, when it sent one.
+    """
+    retryable = False
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMError):
+    """Provider answered 429"""
+    retryable = True
+
+
+class LLMTimeoutError(LLMError):
+    """No response within the call timeout"""
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    """Provider 5xx or connection failure"""
+    retryable = True
+
+
+class LLMUnavailableError(LLMError):
+    """Circuit breaker is open; the call was not attempted"""
+
+
+class LLMOverloadedError(LLMError):
+    """Shed by admission control (queue full or queue deadline passed); not attempted"""
+
+
+def classify_error(error: Exception, prefix: str) -> LLMError:
+    """Map a provider/transport exception onto the LLMError hierarchy"""
+    if isinstance(error, LLMError):
+        return error
+
+    if isinstance(error, (asyncio.TimeoutError, groq.APITimeoutError)):
+        return LLMTimeoutError(f"{prefix}: timed out")
+
+    message = f"{prefix}: {str(error)}"
+    if isinstance(error, groq.RateLimitError):
+        return LLMRateLimitError(message, retry_after=parse_duration(error.response.headers.get("retry-after")))
+    if isinstance(error, groq.APIStatusError):
+        if error.status_code >= 500 or error.status_code == 408:
+            return LLMServerError(message)
+        return LLMError(message)
+    if isinstance(error, groq.APIConnectionError):
+        return LLMServerError(message)
+    return LLMError(message)
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse provider durations into seconds
+
+    Accepts plain seconds ("7", "0.5") and Go-style durations as sent in
+    Groq's ``x-ratelimit-reset-*`` headers ("2m59.56s", "120ms").
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at ``per_minute / 60`` per second
+
+    ``per_minute <= 0`` disables the static limit, but ``block`` (used for
+    provider resets and Retry-After) still applies. Waiters are served in
+    arrival order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waited_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def _refill(self, now: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until ``amount`` can be taken, then take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.capacity <= 0:
+                        return
+                    # Requests larger than the bucket wait for a full bucket
+                    needed = min(amount, self.capacity)
+                    if self.level >= needed:
+                        self.level -= amount
+                        return
+                    wait = (needed - self.level) / self.rate
+
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
+
+    def refund(self, amount: float):
+        """Give back tokens that were reserved but not used"""
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+    def resize(self, capacity: float, level: float):
+        """Switch to a new per-minute capacity, starting from ``level`` tokens"""
+        self.capacity = float(capacity)
+        self.level = min(self.capacity, level)
+        self.updated = time.monotonic()
+
+    def clamp(self, remaining: float):
+        """Never believe we have more left than the provider says"""
+        self._refill(time.monotonic())
+        self.level = min(self.level, remaining)
+
+    def block(self, seconds: float):
+        """Hold every acquirer for ``seconds``"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        self._refill(time.monotonic())
+        return {
+            "per_minute": self.capacity,
+            "available": round(self.level, 1),
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            "waited_seconds": round(self.waited_seconds, 3)
+        }
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one provider
+
+    Reservations are estimated before a call and reconciled with the
+    reported usage after it. Provider ``x-ratelimit-*`` headers tighten
+    the buckets: remaining tokens clamp the token bucket, a token limit
+    replaces the configured one, and an exhausted quota blocks until reset.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.rate_limited = 0
+
+    async def acquire(self, estimated_tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def reconcile(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Refund the difference between the reservation and actual usage"""
+        if used_tokens is not None and used_tokens < estimated_tokens:
+            self.tokens.refund(estimated_tokens - used_tokens)
+
+    def observe(self, headers: Mapping[str, str]):
+        """Feed provider rate-limit headers back into the buckets"""
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if not (remaining_tokens and remaining_tokens.isdigit()):
+            remaining_tokens = None
+
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        if limit_tokens and limit_tokens.isdigit() and float(limit_tokens) != self.tokens.capacity:
+            # Groq reports the per-minute token limit here. A new (or first)
+            # limit starts from what the provider says is left: clamp alone
+            # can only lower the level, which would leave it near empty
+            limit = float(limit_tokens)
+            self.tokens.resize(limit, float(remaining_tokens) if remaining_tokens is not None else limit)
+
+        if remaining_tokens is not None:
+            self.tokens.clamp(float(remaining_tokens))
+            if int(remaining_tokens) == 0:
+                self.tokens.block(parse_duration(headers.get("x-ratelimit-reset-tokens")) or 1.0)
+
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if remaining_requests == "0":
+            self.requests.block(parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0)
+
+    def on_rate_limited(self, retry_after: Optional[float]):
+        """A 429 pauses every queued call, not just the one that got it"""
+        self.rate_limited += 1
+        self.requests.block(retry_after or 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests.stats(),
+            "tokens": self.tokens.stats(),
+            "rate_limited": self.rate_limited
+        }
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls raise LLMUnavailableError without reaching the provider. After
+    ``reset_seconds`` one probe call is let through (half-open); its
+    success closes the breaker, its failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"  # closed, open, half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    @property
+    def degraded(self) -> bool:
+        return self.state != "closed"
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a probe through"""
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self):
+        """Raise LLMUnavailableError if the call must not be attempted"""
+        if self.state == "open" and self.retry_after() <= 0:
+            self.state = "half_open"
+
+        if self.state == "open" or (self.state == "half_open" and self._probing):
+            self.rejected += 1
+            raise LLMUnavailableError(
+                "LLM provider unavailable (circuit open)",
+                retry_after=self.retry_after() or self.reset_seconds
+            )
+
+        if self.state == "half_open":
+            self._probing = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """A probe ended without a verdict (e.g. cancelled)"""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_after_seconds": round(self.retry_after(), 3) if self.state == "open" else 0.0
+        }
+
+
+class AdmissionController:
+    """
+    Priority admission to a fixed number of concurrent LLM calls
+
+    ``classes`` maps each priority class, highest first, to (max queued,
+    max queue wait in seconds, max concurrent calls). A freed slot goes to
+    the oldest waiter of the highest class that is under its own
+    concurrency cap, so a lower class never runs ahead of a waiting higher
+    one, and capping the low classes keeps slots free for the high ones.
+
+    Calls are shed with LLMOverloadedError rather than queued without
+    bound: immediately when their class's queue is full, or when they have
+    waited longer than the class allows. ``retry_after`` estimates when a
+    slot is likely to be free from the recent time calls hold one.
+    """
+
+    def __init__(self, capacity: int, classes: Dict[str, Tuple[int, float, int]]):
+        self.capacity = capacity
+        self.classes = classes
+        self.active = 0
+        self._active: Dict[str, int] = {name: 0 for name in classes}
+        self._queues: Dict[str, deque] = {name: deque() for name in classes}
+        self._hold_seconds = 1.0  # moving average of how long a slot is held
+
+        # Counters per class
+        self.admitted = {name: 0 for name in classes}
+        self.queued = {name: 0 for name in classes}
+        self.shed = {name: 0 for name in classes}
+        self.expired = {name: 0 for name in classes}
+
+    async def acquire(self, name: str) -> float:
+        """
+        Wait for a slot; returns the time it was granted (pass it to release)
+
+        Raises:
+            LLMOverloadedError: if the call is shed
+        """
+        if self._can_run(name) and not self._waiting_ahead(name):
+            return self._start(name)
+
+        max_queued, max_wait, _ = self.classes[name]
+        queue = self._queues[name]
+        if len(queue) >= max_queued:
+            self.shed[name] += 1
+            raise LLMOverloadedError(
+                f"LLM queue for {name} calls is full",
+                retry_after=self.retry_after(name)
+            )
+
+        self.queued[name] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            async with asyncio.timeout(max_wait):
+                return await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up: pass the slot on
+                self.release(name, waiter.result())
+            else:
+                waiter.cancel()
+                # release() may already have dropped it as cancelled
+                if waiter in queue:
+                    queue.remove(waiter)
+            if isinstance(e, TimeoutError):
+                self.expired[name] += 1
+                raise LLMOverloadedError(
+                    f"LLM queue wait for {name} calls exceeded {max_wait:g}s",
+                    retry_after=self.retry_after(name)
+                ) from None
+            raise
+
+    def release(self, name: str, started: float):
+        """Give back a slot and hand it to the next waiter in line"""
+        self.active -= 1
+        self._active[name] -= 1
+        self._hold_seconds += 0.1 * ((time.monotonic() - started) - self._hold_seconds)
+
+        for waiting in self.classes:
+            queue = self._queues[waiting]
+            while queue and self._can_run(waiting):
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(self._start(waiting))
+            if self.active >= self.capacity:
+                break
+
+    def retry_after(self, name: str) -> float:
+        """Seconds until a call of this class could plausibly get a slot"""
+        ahead = sum(len(self._queues[n]) for n in self._higher_or_equal(name))
+        return min(60.0, max(1.0, math.ceil(self._hold_seconds * (ahead + 1) / max(1, self.capacity))))
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "hold_seconds": round(self._hold_seconds, 3),
+            "classes": {
+                name: {
+                    "active": self._active[name],
+                    "max_active": max_active,
+                    "queued_now": len(self._queues[name]),
+                    "max_queued": max_queued,
+                    "max_wait_seconds": max_wait,
+                    "admitted": self.admitted[name],
+                    "queued": self.queued[name],
+                    "shed": self.shed[name],
+                    "expired": self.expired[name]
+                }
+                for name, (max_queued, max_wait, max_active) in self.classes.items()
+            }
+        }
+
+    def _can_run(self, name: str) -> bool:
+        return self.active < self.capacity and self._active[name] < self.classes[name][2]
+
+    def _higher_or_equal(self, name: str) -> list:
+        names = list(self.classes)
+        return names[:names.index(name) + 1]
+
+    def _waiting_ahead(self, name: str) -> bool:
+        """Whether anyone of this or a higher class is already queued"""
+        return any(self._queues[n] for n in self._higher_or_equal(name))
+
+    def _start(self, name: str) -> float:
+        self.active += 1
+        self._active[name] += 1
+        self.admitted[name] += 1
+        return time.monotonic()
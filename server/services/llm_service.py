@@ -1,101 +1,529 @@
 # # Groq/LLM integration
-from groq import Groq
-import os
-from typing import Optional
-from dotenv import load_dotenv
+from groq import AsyncGroq
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import httpx
+from typing import AsyncIterator, Dict, Optional
+from services.response_cache import make_cache_key
+from services.llm_cassette import LLMCassette
+from services.metrics import current_route, llm_call_seconds, llm_tokens, record_phase
+from services.llm_resilience import (
+    LLMError,
+    LLMRateLimitError,
+    LLMServerError,
+    LLMTimeoutError,
+    AdmissionController,
+    CircuitBreaker,
+    RateLimiter,
+    classify_error
+)
+import random
+import time
+import config
 
-load_dotenv()
+# Set to True in tasks whose LLM calls are speculative; they then run in the
+# "background" admission class whatever priority they ask for (inherited by
+# tasks created from them)
+background_priority: ContextVar[bool] = ContextVar("llm_background_priority", default=False)
+
+class _CallPriority:
+    """Admission class of one upstream call, raised when a more urgent caller joins it"""
+    def __init__(self, name: str):
+        self.name = name
+        self.raised = asyncio.Event()
 
 class LLMService:
     """Centralized service for all LLM interactions"""
     def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.model = "llama-3.3-70b-versatile"
-        
+        self.model = config.LLM_MODEL
+
         # Model parameters
-        self.default_temperature = 0.7  
+        self.default_temperature = 0.7
         self.default_max_tokens = 1000
-    
+
+        # Concurrency and timeouts
+        self.timeout = config.LLM_TIMEOUT_SECONDS
+        self.max_concurrency = config.LLM_MAX_CONCURRENCY
+        self.admission = AdmissionController(self.max_concurrency, config.LLM_PRIORITY_CLASSES)
+        self._client: Optional[AsyncGroq] = None
+
+        # Back-pressure and failure handling
+        self.limiter = RateLimiter(config.LLM_REQUESTS_PER_MINUTE, config.LLM_TOKENS_PER_MINUTE)
+        self.breaker = CircuitBreaker(config.LLM_BREAKER_FAILURE_THRESHOLD, config.LLM_BREAKER_RESET_SECONDS)
+        self.max_retries = config.LLM_MAX_RETRIES
+        self.retries = 0
+        # Failed attempts by error kind (LLMRateLimitError, LLMTimeoutError, ...)
+        self.errors: Dict[str, int] = {}
+
+        # Single-flight: request key -> shared upstream call and its waiter count
+        self._inflight: Dict[str, list] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.priority_raised = 0  # shared calls lifted to a joining caller's priority
+
+        # Calls currently holding a concurrency slot
+        self.active_calls = 0
+
+        # Record/replay of provider traffic (LLM_CASSETTE_MODE)
+        self.cassette: Optional[LLMCassette] = None
+
+    @property
+    def client(self) -> AsyncGroq:
+        """Async Groq client sharing one pooled HTTP connection (created lazily)"""
+        if self._client is None:
+            transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=config.LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_POOL_MAX_KEEPALIVE
+                )
+            )
+            if config.LLM_CASSETTE_MODE:
+                self.cassette = LLMCassette(
+                    config.LLM_CASSETTE_PATH,
+                    mode=config.LLM_CASSETTE_MODE,
+                    upstream=transport,
+                    timing_scale=config.LLM_CASSETTE_TIMING_SCALE
+                )
+                transport = self.cassette
+
+            http_client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(
+                    self.timeout,
+                    connect=config.LLM_CONNECT_TIMEOUT_SECONDS
+                )
+            )
+            self._client = AsyncGroq(
+                # Replaying needs no credentials
+                api_key=config.GROQ_API_KEY or "cassette",
+                http_client=http_client,
+                timeout=self.timeout,
+                max_retries=0  # retried here, under the rate limiter and breaker
+            )
+        return self._client
+
+    def set_client(self, client: AsyncGroq, cassette: Optional[LLMCassette] = None):
+        """Replace the provider client (used by benchmarks and tests)"""
+        self._client = client
+        self.cassette = cassette
+
+    @property
+    def degraded(self) -> bool:
+        """True while the circuit breaker is not closed"""
+        return self.breaker.degraded
+
+    async def aclose(self):
+        """Close the shared HTTP connection pool"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
     async def generate_completion(
         self,
         prompt: str,
         system_prompt: Optional[str] = None,
         temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        json_mode: bool = False,
+        priority: str = "generation"
     ) -> str:
         """
         Generic completion method for all LLM calls
-        
+
         Args:
             prompt: User prompt
             system_prompt: System instructions (optional)
             temperature: Randomness (0-2, default 0.7)
             max_tokens: Response length limit
-            
+            timeout: Per-call timeout in seconds (default LLM_TIMEOUT_SECONDS)
+            json_mode: Ask the provider for a single JSON object (the
+                prompt must mention JSON)
+            priority: Admission class (see LLM_PRIORITY_CLASSES): "analysis",
+                "consequence" or "generation"
+
         Returns:
             Generated text response
+
+        Raises:
+            LLMOverloadedError: if admission control sheds the call
+        """
+        messages = self._build_messages(prompt, system_prompt)
+
+        return await self._complete(messages, temperature, max_tokens, timeout, json_mode, priority)
+
+    async def generate_with_history(
+        self,
+        messages: list[dict],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        priority: str = "generation"
+    ) -> str:
         """
+        Generate completion with conversation history
+        Useful for multi-turn scenarios
+
+        Args:
+            messages: List of {"role": "user/assistant", "content": "..."}
+
+        Returns:
+            Generated text response
+        """
+        return await self._complete(messages, temperature, max_tokens, timeout, priority=priority)
+
+    async def stream_completion(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        json_mode: bool = False,
+        priority: str = "generation"
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion chunk by chunk
+
+        Holds a concurrency slot for the lifetime of the stream. ``timeout``
+        applies to opening the stream and to each gap between chunks.
+        Opening the stream is retried like a completion; once text has
+        been yielded, failures are raised as-is.
+
+        Yields:
+            Text deltas as they arrive
+        """
+        params = self._request_params(self._build_messages(prompt, system_prompt), temperature, max_tokens, json_mode)
+        timeout = timeout or self.timeout
+        prefix = "Failed to stream completion"
+        priority = _CallPriority(self._caller_priority(priority))
+
+        for attempt in range(self.max_retries + 1):
+            started = False
+            self.breaker.before_call()
+            call_started = None
+            try:
+                await self._admit(params)
+                async with self._slot(priority):
+                    call_started = time.perf_counter()
+                    raw = await asyncio.wait_for(
+                        self.client.chat.completions.with_raw_response.create(
+                            **params,
+                            stream=True,
+                            timeout=timeout
+                        ),
+                        timeout=timeout
+                    )
+                    self.limiter.observe(raw.headers)
+                    stream = await raw.parse()
+
+                    try:
+                        chunks = stream.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                            except StopAsyncIteration:
+                                break
+
+                            # Groq reports usage on the final chunk
+                            usage = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+                            if usage:
+                                self._count_tokens(usage)
+
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                started = True
+                                yield chunk.choices[0].delta.content
+                    finally:
+                        # Release the pooled connection even if the consumer stops early
+                        await stream.close()
+
+                self._observe_call(call_started, "success")
+                self.breaker.record_success()
+                return
+
+            except (asyncio.CancelledError, GeneratorExit):
+                self._observe_call(call_started, "cancelled")
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self._observe_call(call_started, "error")
+                error = self._on_failure(e, prefix)
+                if started or not error.retryable or attempt >= self.max_retries:
+                    raise error
+
+            await self._backoff(attempt, error)
+
+    def _build_messages(self, prompt: str, system_prompt: Optional[str]) -> list[dict]:
+        """Build the chat message list for a single-turn prompt"""
         messages = []
-        
+
         if system_prompt:
             messages.append({
                 "role": "system",
                 "content": system_prompt
             })
-        
+
         messages.append({
             "role": "user",
             "content": prompt
         })
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature or self.default_temperature,
-                max_tokens=max_tokens or self.default_max_tokens,
-                top_p=1,
-                stream=False
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            print(f"LLM Error: {str(e)}")
-            raise Exception(f"Failed to generate completion: {str(e)}")
-    
-    async def generate_with_history(
+
+        return messages
+
+    def _request_params(
         self,
         messages: list[dict],
-        temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        json_mode: bool = False
+    ) -> dict:
+        """Chat completion parameters shared by all call styles"""
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.default_temperature if temperature is None else temperature,
+            "max_tokens": max_tokens or self.default_max_tokens,
+            "top_p": 1
+        }
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    def stats(self) -> dict:
+        """Coalescing, retry, rate-limit, circuit breaker and admission counters"""
+        total = self.upstream_calls + self.coalesced_calls
+        return {
+            "in_flight": len(self._inflight),
+            "active_calls": self.active_calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "coalesced_ratio": round(self.coalesced_calls / total, 4) if total else 0.0,
+            "priority_raised": self.priority_raised,
+            "retries": self.retries,
+            "errors": dict(self.errors),
+            "degraded": self.degraded,
+            "rate_limiter": self.limiter.stats(),
+            "circuit_breaker": self.breaker.stats(),
+            "admission": self.admission.stats(),
+            "cassette": self.cassette.stats() if self.cassette else None
+        }
+
+    async def _complete(
+        self,
+        messages: list[dict],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        timeout: Optional[float],
+        json_mode: bool = False,
+        priority: str = "generation"
     ) -> str:
         """
-        Generate completion with conversation history
-        Useful for multi-turn scenarios
-        
-        Args:
-            messages: List of {"role": "user/assistant", "content": "..."}
-            
-        Returns:
-            Generated text response
+        Run one chat completion, sharing it with identical in-flight calls
+
+        Calls with the same model, messages and sampling parameters that
+        overlap in time wait on one upstream request, which is admitted at
+        the most urgent priority among its waiters (a live call joining a
+        speculative one lifts it out of the background class). A waiter
+        that is cancelled only stops waiting; the upstream request is
+        cancelled once no waiters are left.
         """
+        params = self._request_params(messages, temperature, max_tokens, json_mode)
+        key = make_cache_key(params)
+        priority = self._caller_priority(priority)
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            call_priority = _CallPriority(priority)
+            task = asyncio.create_task(self._complete_upstream(params, timeout, call_priority))
+            entry = self._inflight[key] = [task, 0, call_priority]
+            task.add_done_callback(lambda _: self._forget_inflight(key, entry))
+            self.upstream_calls += 1
+        else:
+            self.coalesced_calls += 1
+            self._raise_priority(entry[2], priority)
+
+        task = entry[0]
+        entry[1] += 1
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature or self.default_temperature,
-                max_tokens=max_tokens or self.default_max_tokens,
-                top_p=1,
-                stream=False
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            print(f"LLM Error: {str(e)}")
-            raise Exception(f"Failed to generate completion: {str(e)}")
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                # Last waiter left: abandon the upstream call, and let new
+                # callers start a fresh one rather than join a dying task
+                self._forget_inflight(key, entry)
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _forget_inflight(self, key: str, entry: list):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    @staticmethod
+    def _caller_priority(priority: str) -> str:
+        """Admission class for the calling task (speculative tasks always run as "background")"""
+        return "background" if background_priority.get() else priority
+
+    def _raise_priority(self, call_priority: _CallPriority, priority: str):
+        """Admit a shared call at ``priority`` if that is more urgent than its own"""
+        order = list(self.admission.classes)
+        if order.index(priority) < order.index(call_priority.name):
+            call_priority.name = priority
+            call_priority.raised.set()
+            self.priority_raised += 1
+
+    async def _complete_upstream(self, params: dict, timeout: Optional[float], priority: _CallPriority) -> str:
+        """
+        Run one chat completion under the rate limiter, breaker and global
+        concurrency limit, retrying retryable failures
+        """
+        timeout = timeout or self.timeout
+        prefix = "Failed to generate completion"
+
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            call_started = None
+            try:
+                estimated = await self._admit(params)
+                async with self._slot(priority):
+                    call_started = time.perf_counter()
+                    raw = await asyncio.wait_for(
+                        self.client.chat.completions.with_raw_response.create(
+                            **params,
+                            stream=False,
+                            timeout=timeout
+                        ),
+                        timeout=timeout
+                    )
+                self.limiter.observe(raw.headers)
+                response = await raw.parse()
+                self._observe_call(call_started, "success")
+
+                self.breaker.record_success()
+                self.limiter.reconcile(estimated, response.usage.total_tokens if response.usage else None)
+                if response.usage:
+                    self._count_tokens(response.usage)
+                return response.choices[0].message.content
+
+            except asyncio.CancelledError:
+                self._observe_call(call_started, "cancelled")
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self._observe_call(call_started, "error")
+                error = self._on_failure(e, prefix)
+                if not error.retryable or attempt >= self.max_retries:
+                    raise error
+
+            await self._backoff(attempt, error)
+
+    @asynccontextmanager
+    async def _slot(self, priority: _CallPriority):
+        """
+        Hold one of the global concurrency slots, admitted by priority
+
+        Background calls use the "background" class, which only gets slots
+        no live call is waiting for. If the call's priority is raised while
+        it is queued, it queues again in the new class. Time spent waiting
+        is recorded as the ``llm_queue`` phase.
+        """
+        queued = time.perf_counter()
+        while True:
+            name = priority.name
+            priority.raised.clear()
+            admitted = asyncio.ensure_future(self.admission.acquire(name))
+            raised = asyncio.ensure_future(priority.raised.wait())
+            try:
+                await asyncio.wait({admitted, raised}, return_when=asyncio.FIRST_COMPLETED)
+            except BaseException:
+                raised.cancel()
+                self._abandon_admission(admitted, name)
+                raise
+            raised.cancel()
+
+            if not admitted.done():
+                # Raised while queued: leave this class's queue for the new one
+                self._abandon_admission(admitted, name)
+                continue
+            started = admitted.result()
+            break
+
+        try:
+            async with self._active(queued):
+                yield
+        finally:
+            self.admission.release(name, started)
+
+    def _abandon_admission(self, admitted: asyncio.Future, name: str):
+        """Stop waiting for a slot, handing it back if it was just granted"""
+        if not admitted.done():
+            admitted.cancel()
+            admitted.add_done_callback(lambda t: t.cancelled() or t.exception())
+        elif not admitted.cancelled() and admitted.exception() is None:
+            self.admission.release(name, admitted.result())
+
+    @asynccontextmanager
+    async def _active(self, queued: float):
+        record_phase("llm_queue", time.perf_counter() - queued)
+        self.active_calls += 1
+        try:
+            yield
+        finally:
+            self.active_calls -= 1
+
+    def _observe_call(self, started: Optional[float], outcome: str):
+        """Record one upstream attempt's latency (if it got as far as the provider)"""
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        record_phase("llm", elapsed)
+        llm_call_seconds.observe(elapsed, current_route(), outcome)
+
+    def _count_tokens(self, usage):
+        route = current_route()
+        llm_tokens.inc(route, "prompt", amount=usage.prompt_tokens or 0)
+        llm_tokens.inc(route, "completion", amount=usage.completion_tokens or 0)
+
+    async def _admit(self, params: dict) -> int:
+        """Reserve rate-limit budget for a call; returns the token estimate"""
+        estimated = sum(len(m["content"]) for m in params["messages"]) // 4 + params["max_tokens"]
+        queued = time.perf_counter()
+        await self.limiter.acquire(estimated)
+        record_phase("llm_rate_limit", time.perf_counter() - queued)
+        return estimated
+
+    def _on_failure(self, e: Exception, prefix: str) -> LLMError:
+        """Classify a failed attempt and feed it to the limiter and breaker"""
+        error = classify_error(e, prefix)
+        kind = type(error).__name__
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        print(f"LLM Error [{kind}, {'retryable' if error.retryable else 'final'}]: {str(error)}")
+
+        if isinstance(error, LLMRateLimitError):
+            self.limiter.on_rate_limited(error.retry_after)
+            self.breaker.release()
+        elif isinstance(error, (LLMServerError, LLMTimeoutError)):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+        return error
+
+    async def _backoff(self, attempt: int, error: LLMError):
+        """
+        Jittered exponential backoff before the next attempt
+
+        Rate-limited calls skip it: the limiter already holds every caller
+        until the provider's Retry-After has passed.
+        """
+        self.retries += 1
+        if isinstance(error, LLMRateLimitError):
+            return
+        delay = min(config.LLM_RETRY_MAX_SECONDS, config.LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+        await asyncio.sleep(delay * (0.5 + random.random()))
 
 
 # Singleton instance
-llm_service = LLMService()
\ No newline at end of file
+llm_service = LLMService()
@@ -0,0 +1,244 @@
+# In-process metrics (Prometheus text format) and per-request timing
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import time
+
+# Seconds; spans cache hits (sub-millisecond) to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter; label values are passed positionally"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram
+
+    ``observe`` is one bisect and two additions; cumulative bucket counts
+    are only computed when the metrics are scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # labels -> [bucket counts..., sum]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+
+
+class Gauge:
+    """
+    Value read from a callback at scrape time
+
+    The callback returns either a number or a {label values: number} dict,
+    so existing stats() counters can be exported without touching hot paths.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable, labels: Tuple[str, ...] = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.kind = kind
+        self._read = read
+
+    def samples(self) -> Iterable[str]:
+        values = self._read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable, labels: Tuple[str, ...] = (), kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, help, read, labels, kind))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Metric {metric.name} failed to collect: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# endpoint function -> route template
+_route_paths: Dict[Callable, str] = {}
+
+
+class RequestTiming:
+    """
+    Time spent per phase while serving one request
+
+    Phases that run concurrently (e.g. analysis and consequences) are each
+    timed in full, so they can add up to more than the request took.
+    """
+    __slots__ = ("scope", "started", "phases")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @property
+    def route(self) -> str:
+        """Route template (e.g. /api/scenarios/{scenario_id}), once routing is done"""
+        endpoint = self.scope.get("endpoint") if self.scope else None
+        if endpoint is None:
+            return "unmatched"
+        path = _route_paths.get(endpoint)
+        if path is None:
+            path = "unmatched"
+            for route in getattr(self.scope.get("router"), "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            _route_paths[endpoint] = path
+        return path
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (durations in milliseconds)"""
+        entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# Timing of the request being served, if any (inherited by tasks it creates)
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def current_route() -> str:
+    """Route template of the current request, or "background" outside one"""
+    timing = current_timing.get()
+    return timing.route if timing is not None else "background"
+
+
+def record_phase(phase: str, seconds: float):
+    """Record time spent in a phase, for the current request and in aggregate"""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(phase, seconds)
+        route = timing.route
+    else:
+        route = "background"
+    phase_seconds.observe(seconds, route, phase)
+
+
+@contextmanager
+def timed(phase: str):
+    """Time the enclosed block as ``phase`` (usable around awaits)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+# Singleton registry and the metrics recorded on hot paths
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "dilemma_http_request_duration_seconds",
+    "HTTP request latency until the response is complete",
+    ("method", "route", "status")
+)
+phase_seconds = registry.histogram(
+    "dilemma_phase_duration_seconds",
+    "Time spent per request phase",
+    ("route", "phase")
+)
+llm_call_seconds = registry.histogram(
+    "dilemma_llm_call_duration_seconds",
+    "Upstream LLM call latency (one attempt)",
+    ("route", "outcome")
+)
+llm_tokens = registry.counter(
+    "dilemma_llm_tokens_total",
+    "LLM tokens used, by the route that caused the call",
+    ("route", "kind")
+)
@@ -0,0 +1,429 @@
+# Offline precomputation of analyses and consequences for library scenarios
+from services.framework_analyzer import framework_analyzer
+from services.consequence_generator import consequence_generator
+from services.scenario_engine import scenario_engine
+from services.llm_service import llm_service, background_priority
+from services.llm_resilience import LLMRateLimitError
+from models.scenario import Scenario, ConsequenceRule, UserDecisionHistory
+from typing import Optional, Dict, List
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import config
+
+
+def path_key(choice_ids: List[str]) -> str:
+    """Node key for a path of choice IDs, e.g. ['A', 'C'] -> 'A.C'"""
+    return ".".join(choice_ids)
+
+
+def rule_key(rule: ConsequenceRule) -> str:
+    """Compact identifier for a consequence rule, e.g. '1A>3'"""
+    return f"{rule.trigger_step}{rule.trigger_choice}>{rule.appears_at_step}"
+
+
+class PrecomputedStore:
+    """
+    Serves precomputed artifacts from ``data/precomputed/<scenario_id>.json``
+
+    Artifact layout (written without whitespace):
+        {
+          "scenario_id": "...",
+          "model": "...",
+          "nodes": {
+            "A.B": {
+              "h": "<analysis input hash>",
+              "a": "<raw analysis response>",
+              "c": {"1A>3": {"h": "<consequence input hash>", "t": "<text>"}}
+            }
+          }
+        }
+
+    Every entry carries the content hash of the prompt inputs it was
+    generated from, so an entry is only served while the live inputs match.
+
+    Loaded artifacts are memoized by file modification time, so one written
+    later (by ``python -m services.precompute`` or another worker) is
+    picked up on the next lookup.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # scenario_id -> (mtime_ns of the file it was read from, artifact)
+        self._artifacts: Dict[str, tuple[int, dict]] = {}
+
+    def _path(self, scenario_id: str) -> str:
+        return os.path.join(self.directory, f"{scenario_id}.json")
+
+    def load(self, scenario_id: str) -> Optional[dict]:
+        """Load (and memoize) the artifact for a scenario, None if there is none"""
+        path = self._path(scenario_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._artifacts.pop(scenario_id, None)
+            return None
+
+        cached = self._artifacts.get(scenario_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with open(path, 'r') as f:
+                artifact = json.load(f)
+        except FileNotFoundError:
+            return None
+        self._artifacts[scenario_id] = (mtime, artifact)
+        return artifact
+
+    def save(self, scenario_id: str, artifact: dict):
+        """Atomically write an artifact"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(scenario_id) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(artifact, f, separators=(",", ":"))
+        os.replace(tmp_path, self._path(scenario_id))
+        self._artifacts[scenario_id] = (os.stat(self._path(scenario_id)).st_mtime_ns, artifact)
+
+    def delete(self, scenario_id: str):
+        """Remove a scenario's artifact"""
+        try:
+            os.remove(self._path(scenario_id))
+        except FileNotFoundError:
+            pass
+        self._artifacts.pop(scenario_id, None)
+
+    def has(self, scenario_id: str) -> bool:
+        return self.load(scenario_id) is not None
+
+    def get_analysis(self, scenario_id: str, path: List[str], input_hash: str) -> Optional[str]:
+        """Raw analysis for a path, if precomputed from identical inputs"""
+        artifact = self.load(scenario_id)
+        if not artifact:
+            return None
+
+        node = artifact["nodes"].get(path_key(path))
+        if node and node.get("h") == input_hash:
+            return node.get("a")
+        return None
+
+    def closest_analysis(self, scenario_id: str, path: List[str]) -> Optional[str]:
+        """
+        Raw analysis for the last choice of a path, whatever its inputs:
+        the path's own node, else any node ending in the same choice at the
+        same step
+        """
+        artifact = self.load(scenario_id)
+        if not artifact or not path:
+            return None
+
+        nodes = artifact["nodes"]
+        node = nodes.get(path_key(path))
+        if node and node.get("a"):
+            return node["a"]
+
+        for key, node in nodes.items():
+            choices = key.split(".")
+            if len(choices) == len(path) and choices[-1] == path[-1] and node.get("a"):
+                return node["a"]
+        return None
+
+    def get_consequence(
+        self,
+        scenario_id: str,
+        path: List[str],
+        rule: ConsequenceRule,
+        input_hash: str
+    ) -> Optional[str]:
+        """Consequence text for a rule along a path, if precomputed from identical inputs"""
+        artifact = self.load(scenario_id)
+        if not artifact:
+            return None
+
+        node = artifact["nodes"].get(path_key(path))
+        entry = node.get("c", {}).get(rule_key(rule)) if node else None
+        if entry and entry.get("h") == input_hash:
+            return entry.get("t")
+        return None
+
+
+class RateLimitedScheduler:
+    """
+    Runs LLM jobs with bounded concurrency and a requests-per-minute pace
+
+    Failed jobs are retried with jittered exponential backoff; rate limit
+    errors (HTTP 429) also push back the start of every queued job.
+    """
+
+    def __init__(self, concurrency: int, requests_per_minute: int, max_retries: int = 4):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.max_retries = max_retries
+        self._next_start = 0.0
+        self._pace_lock = asyncio.Lock()
+
+    async def _pace(self):
+        """Wait until this job may start under the requests-per-minute budget"""
+        async with self._pace_lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def run(self, job):
+        """Run ``job`` (a zero-argument coroutine factory) with retries"""
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._pace()
+                try:
+                    return await job()
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        raise
+
+                    delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                    if isinstance(e, LLMRateLimitError):
+                        # Back off the whole queue, not just this job
+                        self._next_start = max(self._next_start, time.monotonic() + delay)
+                    print(f"Precompute job failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+
+
+class Precomputer:
+    """Enumerates every reachable path of a scenario and fills its artifact"""
+
+    def __init__(self, store: PrecomputedStore):
+        self.store = store
+        self._background: set[asyncio.Task] = set()
+        self._builds: Dict[str, dict] = {}  # latest build status per scenario
+        self._rebuild_requested: set[str] = set()  # edited while building
+
+    def enumerate_paths(self, scenario: Scenario, max_nodes: int) -> List[List[tuple]]:
+        """
+        All reachable paths as lists of (step, choice_id, choice_text)
+
+        Steps are visited in ascending order; each prefix is its own node.
+        """
+        points = sorted(scenario.decision_points, key=lambda dp: dp.step)
+        paths = []
+
+        def walk(index: int, prefix: List[tuple]):
+            if index == len(points):
+                return
+            for choice in points[index].choices:
+                if len(paths) >= max_nodes:
+                    return
+                path = prefix + [(points[index].step, choice.id, choice.text)]
+                paths.append(path)
+                walk(index + 1, path)
+
+        walk(0, [])
+        return paths
+
+    async def build(
+        self,
+        scenario_id: str,
+        concurrency: int = config.PRECOMPUTE_CONCURRENCY,
+        requests_per_minute: int = config.PRECOMPUTE_REQUESTS_PER_MINUTE,
+        max_nodes: int = config.PRECOMPUTE_MAX_NODES
+    ) -> dict:
+        """
+        Build or incrementally rebuild a scenario's artifact
+
+        Entries whose input hash still matches are kept, so editing a
+        scenario only regenerates the subtrees whose prompts changed.
+
+        Returns:
+            Counts of reused, generated and failed entries
+        """
+        scenario = scenario_engine.get_scenario(scenario_id)
+        if not scenario:
+            raise ValueError(f"Scenario not found: {scenario_id}")
+
+        previous = self.store.load(scenario_id) or {"nodes": {}}
+        nodes: Dict[str, dict] = {}
+        scheduler = RateLimitedScheduler(concurrency, requests_per_minute)
+        contexts = {dp.step: dp.context for dp in scenario.decision_points}
+        stats = {"reused": 0, "generated": 0, "failed": 0}
+        jobs = []
+
+        for path in self.enumerate_paths(scenario, max_nodes):
+            key = path_key([choice_id for _, choice_id, _ in path])
+            old_node = previous["nodes"].get(key, {})
+            node = nodes[key] = {"c": {}}
+
+            step, _, choice_text = path[-1]
+            history = UserDecisionHistory(
+                scenario_id=scenario_id,
+                session_id="precompute",
+                current_step=step,
+                choices_made=[
+                    {"step": s, "choice_id": c, "choice_text": t} for s, c, t in path
+                ]
+            )
+
+            # Framework analysis for this node
+            analysis_args = {
+                "context": contexts.get(step, scenario.description),
+                "choice": choice_text,
+                "decision_history": [t for _, _, t in path[:-1]],
+                "pinned": consequence_generator.pending_trigger_positions(
+                    history.choices_made[:-1], scenario.consequence_rules, step
+                )
+            }
+            node["h"] = framework_analyzer.cache_key(**analysis_args)
+            if old_node.get("h") == node["h"] and old_node.get("a"):
+                node["a"] = old_node["a"]
+                stats["reused"] += 1
+            else:
+                jobs.append(self._analysis_job(scheduler, node, analysis_args, stats))
+
+            # Consequences that fire at this node
+            rules = consequence_generator.check_consequence_triggers(
+                history=history,
+                current_step=step,
+                rules=scenario_engine.get_rules_at_step(scenario_id, step)
+            )
+            for rule in rules:
+                entry = node["c"][rule_key(rule)] = {
+                    "h": consequence_generator.input_key(
+                        rule, history, scenario.description, scenario.consequence_rules
+                    )
+                }
+                old_entry = old_node.get("c", {}).get(rule_key(rule), {})
+                if old_entry.get("h") == entry["h"] and old_entry.get("t"):
+                    entry["t"] = old_entry["t"]
+                    stats["reused"] += 1
+                else:
+                    jobs.append(self._consequence_job(scheduler, entry, rule, history, scenario, stats))
+
+        # Admitted behind live traffic, like other speculative work
+        token = background_priority.set(True)
+        try:
+            await asyncio.gather(*jobs)
+        finally:
+            background_priority.reset(token)
+
+        # Drop entries that failed so they are retried on the next build
+        for node in nodes.values():
+            node["c"] = {k: v for k, v in node["c"].items() if "t" in v}
+
+        self.store.save(scenario_id, {
+            "scenario_id": scenario_id,
+            "model": llm_service.model,
+            "built_at": time.time(),
+            "nodes": {k: v for k, v in nodes.items() if "a" in v or v["c"]}
+        })
+
+        return stats
+
+    async def _analysis_job(self, scheduler, node: dict, args: dict, stats: dict):
+        try:
+            analysis = await scheduler.run(lambda: framework_analyzer.analyze_decision(**args))
+            node["a"] = analysis.raw_response
+            stats["generated"] += 1
+        except Exception as e:
+            print(f"Precompute analysis failed: {str(e)}")
+            stats["failed"] += 1
+
+    async def _consequence_job(self, scheduler, entry: dict, rule, history, scenario, stats: dict):
+        try:
+            entry["t"] = await scheduler.run(
+                lambda: consequence_generator.generate_consequence(
+                    rule=rule,
+                    history=history,
+                    context=scenario.description,
+                    rules=scenario.consequence_rules
+                )
+            )
+            stats["generated"] += 1
+        except Exception as e:
+            print(f"Precompute consequence failed: {str(e)}")
+            stats["failed"] += 1
+
+    def schedule_build(self, scenario_id: str) -> dict:
+        """
+        Build a scenario's artifact in the background; returns its build status
+
+        A request made while the scenario is already building does not start
+        a second build; the running one is followed by an incremental rebuild
+        so later edits are still picked up.
+        """
+        status = self._builds.get(scenario_id)
+        if status and status["status"] == "running":
+            self._rebuild_requested.add(scenario_id)
+            return status
+
+        status = self._builds[scenario_id] = {
+            "scenario_id": scenario_id,
+            "status": "running",  # running, completed, failed
+            "started_at": time.time(),
+            "finished_at": None
+        }
+        task = asyncio.create_task(self._run_build(status))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return status
+
+    def schedule_rebuild(self, scenario_id: str):
+        """Incrementally rebuild a precomputed scenario in the background"""
+        if self.store.has(scenario_id):
+            self.schedule_build(scenario_id)
+
+    def build_status(self, scenario_id: str) -> Optional[dict]:
+        """Status of the scenario's latest build, if one was scheduled"""
+        return self._builds.get(scenario_id)
+
+    async def _run_build(self, status: dict):
+        scenario_id = status["scenario_id"]
+        try:
+            while True:
+                self._rebuild_requested.discard(scenario_id)
+                status["stats"] = await self.build(scenario_id)
+                print(f"Precompute built {scenario_id}: {status['stats']}")
+                if scenario_id not in self._rebuild_requested:
+                    break
+            status["status"] = "completed"
+        except Exception as e:
+            print(f"Precompute build failed for {scenario_id}: {str(e)}")
+            status["status"] = "failed"
+            status["error"] = str(e)
+        finally:
+            self._rebuild_requested.discard(scenario_id)
+            status["finished_at"] = time.time()
+
+
+# Singleton instances
+precomputed_store = PrecomputedStore(config.PRECOMPUTE_DIR)
+precomputer = Precomputer(precomputed_store)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Precompute analyses and consequences for library scenarios")
+    parser.add_argument("scenario_ids", nargs="*", help="Scenario IDs (default: whole library)")
+    parser.add_argument("--concurrency", type=int, default=config.PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=config.PRECOMPUTE_REQUESTS_PER_MINUTE)
+    parser.add_argument("--max-nodes", type=int, default=config.PRECOMPUTE_MAX_NODES)
+    args = parser.parse_args()
+
+    scenario_ids = args.scenario_ids or [s.id for s in scenario_engine.list_scenarios()]
+
+    try:
+        for scenario_id in scenario_ids:
+            stats = await precomputer.build(
+                scenario_id,
+                concurrency=args.concurrency,
+                requests_per_minute=args.rpm,
+                max_nodes=args.max_nodes
+            )
+            print(f"{scenario_id}: {stats}")
+    finally:
+        await llm_service.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+# Content-addressed LLM response cache (memory LRU + optional SQLite tier)
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Collapse whitespace so cosmetic differences map to the same key"""
+    return " ".join((text or "").split())
+
+
+def make_cache_key(*parts) -> str:
+    """Hash arbitrary JSON-serializable key parts into a stable hex digest"""
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses
+
+    The memory tier is an LRU bounded by ``max_entries``; every entry expires
+    after ``ttl_seconds``. When ``disk_path`` is set, entries are also written
+    to a SQLite file so they survive restarts, bounded by ``disk_max_entries``.
+
+    SQLite is kept off the event loop: writes are queued to one writer
+    thread (which commits them in batches), and an in-memory index of the
+    keys on disk answers misses and ``contains`` without touching the file.
+    Only a disk hit reads it, in a worker thread when looked up with
+    ``fetch``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        ttl_seconds: float = 86400,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 50000
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None  # reads only
+        self._db_lock = threading.Lock()
+        self._disk_index: "OrderedDict[str, float]" = OrderedDict()  # key -> created_at, oldest first
+        self._writes: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+        # Counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_write_errors = 0
+
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path: str):
+        """Open (or create) the on-disk tier, index its keys and start the writer"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        writer = self._connect(path)
+        writer.execute("PRAGMA journal_mode=WAL")
+        writer.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        writer.execute(
+            "CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)"
+        )
+        writer.commit()
+
+        self._db = self._connect(path)
+        for key, created_at in self._db.execute("SELECT key, created_at FROM entries ORDER BY created_at"):
+            self._disk_index[key] = created_at
+        self._prune_disk()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, args=(writer,), name=f"{self.name}-cache-writer", daemon=True
+        )
+        self._writer.start()
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        return sqlite3.connect(path, check_same_thread=False)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached value or None on miss/expiry (a disk hit reads the file here)"""
+        found, value = self._lookup(key)
+        if found:
+            return value
+        return self._loaded(key, self._read(key))
+
+    async def fetch(self, key: str) -> Optional[str]:
+        """Like get, but a disk hit is read in a worker thread"""
+        found, value = self._lookup(key)
+        if found:
+            return value
+        return self._loaded(key, await asyncio.to_thread(self._read, key))
+
+    def _lookup(self, key: str) -> tuple[bool, Optional[str]]:
+        """
+        Answer from memory and the disk index
+
+        Returns:
+            (True, value or None) when answered; (False, None) when the
+            value has to be read from disk
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if not self._expired(created_at):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return True, value
+
+            del self._memory[key]
+            self.expirations += 1
+
+        created_at = self._disk_index.get(key)
+        if created_at is not None:
+            if not self._expired(created_at):
+                return False, None
+
+            del self._disk_index[key]
+            self._writes.put(("delete", key))
+            self.expirations += 1
+
+        self.misses += 1
+        return True, None
+
+    def _read(self, key: str) -> Optional[tuple[str, float]]:
+        """(value, created_at) of a row on disk; safe to call from any thread"""
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _loaded(self, key: str, row: Optional[tuple[str, float]]) -> Optional[str]:
+        """Bring a row read from disk into memory"""
+        # Cleared, or replaced by a write still queued, while it was read
+        if row is None or self._disk_index.get(key) != row[1]:
+            self.misses += 1
+            return None
+
+        value, created_at = row
+        self._remember(key, value, created_at)
+        self.disk_hits += 1
+        return value
+
+    def contains(self, key: str) -> bool:
+        """Whether key is cached, without touching LRU order or counters"""
+        entry = self._memory.get(key)
+        if entry is not None and not self._expired(entry[0]):
+            return True
+
+        created_at = self._disk_index.get(key)
+        return created_at is not None and not self._expired(created_at)
+
+    def set(self, key: str, value: str):
+        """Store value in both tiers (the disk write is queued)"""
+        created_at = time.time()
+        self._remember(key, value, created_at)
+
+        if self._db is not None:
+            self._disk_index.pop(key, None)
+            self._disk_index[key] = created_at
+            self._writes.put(("set", key, value, created_at))
+            self._prune_disk()
+
+    def _remember(self, key: str, value: str, created_at: float):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _prune_disk(self):
+        """Drop expired rows and keep at most disk_max_entries newest rows"""
+        while self._disk_index:
+            key, created_at = next(iter(self._disk_index.items()))
+            if len(self._disk_index) <= self.disk_max_entries and not self._expired(created_at):
+                break
+            del self._disk_index[key]
+            self._writes.put(("delete", key))
+
+    def _write_loop(self, db: sqlite3.Connection):
+        """Writer thread: apply queued writes, committing each batch once"""
+        while True:
+            ops = [self._writes.get()]
+            while not self._writes.empty() and len(ops) < 500:
+                ops.append(self._writes.get_nowait())
+
+            try:
+                for op in ops:
+                    if op is None:
+                        break
+                    if op[0] == "set":
+                        db.execute(
+                            "INSERT OR REPLACE INTO entries (key, value, created_at) VALUES (?, ?, ?)",
+                            op[1:]
+                        )
+                    elif op[0] == "delete":
+                        db.execute("DELETE FROM entries WHERE key = ?", (op[1],))
+                    else:
+                        db.execute("DELETE FROM entries")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Response cache {self.name}: disk write failed: {str(e)}")
+                db.rollback()
+                self.disk_write_errors += len(ops)
+            finally:
+                for _ in ops:
+                    self._writes.task_done()
+
+            if None in ops:
+                db.close()
+                return
+
+    def flush(self):
+        """Block until queued disk writes are committed"""
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self):
+        """Commit queued disk writes and stop the writer thread"""
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+            self._db.close()
+            self._db = None
+
+    def clear(self):
+        """Drop all entries from both tiers"""
+        self._memory.clear()
+        if self._db is not None:
+            self._disk_index.clear()
+            self._writes.put(("clear",))
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_enabled": self._db is not None,
+            "disk_entries": len(self._disk_index),
+            "disk_writes_queued": self._writes.qsize(),
+            "disk_write_errors": self.disk_write_errors,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
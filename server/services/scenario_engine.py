@@ -1,32 +1,139 @@
 # Decision tree logic
-from models.scenario import Scenario, DecisionPoint, UserDecisionHistory
+from models.scenario import Scenario, ScenarioSummary, DecisionPoint, ChoiceOption, ConsequenceRule, UserDecisionHistory
 from typing import Optional, Dict
-import json
-import os
+from types import MappingProxyType
+from database.repositories.scenario_repo import scenario_repo
+
+class CompiledScenario:
+    """
+    Scenario compiled into read-only lookup tables at load time
+
+    Every per-submit lookup (decision point, choice, rules appearing at a
+    step, final/next step) is a single dict access regardless of how many
+    steps or rules the scenario has. The full and summary JSON forms are
+    serialized once here so listings only concatenate bytes.
+    
+    ``final_step`` marks a scenario that is still being generated: steps
+    up to it count as coming even if they are not in the scenario yet.
+    """
+    __slots__ = (
+        "scenario", "steps", "choices", "rules_by_step", "next_steps", "final_step",
+        "summary", "full_json", "summary_json"
+    )
+    
+    def __init__(self, scenario: Scenario, final_step: Optional[int] = None):
+        self.scenario = scenario
+        
+        # step -> DecisionPoint
+        self.steps = MappingProxyType({dp.step: dp for dp in scenario.decision_points})
+        
+        # (step, choice_id) -> ChoiceOption
+        self.choices = MappingProxyType({
+            (dp.step, choice.id): choice
+            for dp in scenario.decision_points
+            for choice in dp.choices
+        })
+        
+        # appears_at_step -> rules, in definition order
+        rules_by_step: Dict[int, list] = {}
+        for rule in scenario.consequence_rules:
+            rules_by_step.setdefault(rule.appears_at_step, []).append(rule)
+        self.rules_by_step = MappingProxyType({
+            step: tuple(rules) for step, rules in rules_by_step.items()
+        })
+        
+        # step -> following step (steps need not be dense)
+        ordered = sorted(self.steps)
+        next_steps = dict(zip(ordered, ordered[1:]))
+        self.final_step = ordered[-1] if ordered else 0
+        if final_step is not None and final_step > self.final_step:
+            # Partially generated: the next step is on its way
+            if ordered:
+                next_steps[ordered[-1]] = ordered[-1] + 1
+            self.final_step = final_step
+        self.next_steps = MappingProxyType(next_steps)
+        
+        # Pre-serialized listing entries
+        self.summary = ScenarioSummary(
+            id=scenario.id,
+            title=scenario.title,
+            description=scenario.description,
+            category=scenario.category,
+            difficulty=scenario.difficulty,
+            estimated_time=scenario.estimated_time,
+            num_decision_points=len(scenario.decision_points)
+        )
+        self.full_json = scenario.model_dump_json().encode()
+        self.summary_json = self.summary.model_dump_json().encode()
 
 class ScenarioEngine:
     """Manages scenario loading and progression"""
     
     def __init__(self):
         self.scenarios: Dict[str, Scenario] = {}
+        self._compiled: Dict[str, CompiledScenario] = {}
+        self._ordered: Optional[tuple[CompiledScenario, ...]] = None
+        
+        # Bumped on every catalogue change; keys anything derived from the listing
+        self.version = 0
         self._load_scenarios()
     
     def _load_scenarios(self):
-        """Load scenarios from JSON file"""
-        scenarios_path = os.path.join(
-            os.path.dirname(__file__), 
-            "../data/scenarios.json"
-        )
+        """Load (or fully reload) every scenario from the library"""
+        scenarios: Dict[str, Scenario] = {}
+        for scenario_data in scenario_repo.load_all():
+            scenario = Scenario(**scenario_data)
+            scenarios[scenario.id] = scenario
+        
+        if not scenarios:
+            print("Warning: scenario library is empty.")
         
-        try:
-            with open(scenarios_path, 'r') as f:
-                data = json.load(f)
-                for scenario_data in data['scenarios']:
-                    scenario = Scenario(**scenario_data)
-                    self.scenarios[scenario.id] = scenario
-        except FileNotFoundError:
-            print("Warning: scenarios.json not found. Using empty scenario list.")
-            self.scenarios = {}
+        # Swap in the new catalogue in one step so readers never see it half built
+        self._swap({sid: CompiledScenario(s) for sid, s in scenarios.items()}, scenarios)
+    
+    def _swap(self, compiled: Dict[str, CompiledScenario], scenarios: Dict[str, Scenario]):
+        """Install a new catalogue and invalidate everything derived from the old one"""
+        self._compiled = compiled
+        self.scenarios = scenarios
+        self._ordered = None
+        self.version += 1
+    
+    def upsert_scenario(self, scenario: Scenario, final_step: Optional[int] = None):
+        """
+        Add or replace one scenario, compiling only that scenario
+        
+        Pass ``final_step`` to publish a scenario whose later steps are
+        still being generated.
+        """
+        current = self._compiled.get(scenario.id)
+        if current is not None and current.scenario == scenario:
+            last_step = max((dp.step for dp in scenario.decision_points), default=0)
+            if current.final_step == max(last_step, final_step or 0):
+                return
+        
+        compiled = CompiledScenario(scenario, final_step)
+        
+        # Copy-on-write so concurrent readers keep a consistent catalogue
+        scenarios = dict(self.scenarios)
+        scenarios[scenario.id] = scenario
+        all_compiled = dict(self._compiled)
+        all_compiled[scenario.id] = compiled
+        
+        self._swap(all_compiled, scenarios)
+    
+    def remove_scenario(self, scenario_id: str):
+        """Drop one scenario from the catalogue"""
+        if scenario_id not in self.scenarios:
+            return
+        
+        self._swap(
+            {k: v for k, v in self._compiled.items() if k != scenario_id},
+            {k: v for k, v in self.scenarios.items() if k != scenario_id}
+        )
+    
+    def get_compiled(self, scenario_id: str) -> Optional[CompiledScenario]:
+        """Get the indexed form of a scenario"""
+        return self._compiled.get(scenario_id)
     
     def get_scenario(self, scenario_id: str) -> Optional[Scenario]:
         """Get scenario by ID"""
@@ -36,21 +143,54 @@ class ScenarioEngine:
         """Get all available scenarios"""
         return list(self.scenarios.values())
     
+    def list_compiled(self) -> tuple[CompiledScenario, ...]:
+        """Compiled scenarios ordered by ID (stable order for pagination)"""
+        ordered = self._ordered
+        if ordered is None:
+            compiled = self._compiled
+            ordered = self._ordered = tuple(compiled[sid] for sid in sorted(compiled))
+        return ordered
+    
     def get_decision_point(
         self, 
         scenario_id: str, 
         step: int
     ) -> Optional[DecisionPoint]:
         """Get specific decision point"""
-        scenario = self.get_scenario(scenario_id)
-        if not scenario:
+        compiled = self.get_compiled(scenario_id)
+        if not compiled:
+            return None
+        
+        return compiled.steps.get(step)
+    
+    def get_choice(
+        self,
+        scenario_id: str,
+        step: int,
+        choice_id: str
+    ) -> Optional[ChoiceOption]:
+        """Get a choice option by step and ID"""
+        compiled = self.get_compiled(scenario_id)
+        if not compiled:
             return None
         
-        for dp in scenario.decision_points:
-            if dp.step == step:
-                return dp
+        return compiled.choices.get((step, choice_id))
+    
+    def get_rules_at_step(self, scenario_id: str, step: int) -> tuple[ConsequenceRule, ...]:
+        """Consequence rules that appear at a step"""
+        compiled = self.get_compiled(scenario_id)
+        if not compiled:
+            return ()
+        
+        return compiled.rules_by_step.get(step, ())
+    
+    def get_next_step_number(self, scenario_id: str, current_step: int) -> Optional[int]:
+        """Step number that follows current_step, or None at the end"""
+        compiled = self.get_compiled(scenario_id)
+        if not compiled:
+            return None
         
-        return None
+        return compiled.next_steps.get(current_step)
     
     def get_next_step(
         self,
@@ -58,20 +198,20 @@ class ScenarioEngine:
         current_step: int
     ) -> Optional[DecisionPoint]:
         """Get next decision point"""
-        scenario = self.get_scenario(scenario_id)
-        if not scenario:
+        next_step = self.get_next_step_number(scenario_id, current_step)
+        if next_step is None:
             return None
         
-        return self.get_decision_point(scenario_id, current_step + 1)
+        return self.get_decision_point(scenario_id, next_step)
     
     def is_final_step(self, scenario_id: str, step: int) -> bool:
         """Check if this is the last step"""
-        scenario = self.get_scenario(scenario_id)
-        if not scenario:
+        compiled = self.get_compiled(scenario_id)
+        if not compiled:
             return True
         
-        return step >= len(scenario.decision_points)
+        return step >= compiled.final_step
 
 
 # Singleton instance
-scenario_engine = ScenarioEngine()
\ No newline at end of file
+scenario_engine = ScenarioEngine()
@@ -1,12 +1,171 @@
 from services.llm_service import llm_service
-from models.scenario import Scenario
+from services.llm_resilience import LLMError
+from models.scenario import Scenario, DecisionPoint, ConsequenceRule
+from utils.incremental_json import IncrementalJSONParser
+from pydantic import ValidationError
+from contextlib import aclosing
+import asyncio
 import json
 import uuid
-from typing import Optional
+from typing import AsyncIterator, Dict, List, Optional
+import config
+
+class _ScenarioDraft:
+    """
+    A scenario assembled from the completed parts of a streamed generation
+
+    Steps are published strictly in order: a step only becomes playable
+    once every step before it has arrived and validated.
+    """
+
+    HEADER_FIELDS = {"title": str, "description": str, "category": str, "difficulty": str, "estimated_time": int}
+
+    def __init__(self, scenario_id: str, topic: str, category: str, difficulty: str, num_decision_points: int):
+        self.scenario_id = scenario_id
+        self.topic = topic
+        self.category = category
+        self.difficulty = difficulty
+        self.num_decision_points = num_decision_points
+
+        self.header: Dict[str, object] = {}
+        self.decision_points: Dict[int, DecisionPoint] = {}
+        self.rules: List[ConsequenceRule] = []
+        self.rules_complete = False
+        self._header_sent = False
+        self._published = 0  # steps 1.._published are playable
+        self.dropped_steps = 0  # invalid, out of range or repeated steps
+
+    @property
+    def missing_steps(self) -> List[int]:
+        return [step for step in range(1, self.num_decision_points + 1) if step not in self.decision_points]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing_steps and self.rules_complete
+
+    def apply(self, path: tuple, value) -> List[dict]:
+        """Take one completed value from the parser; returns the events it unlocks"""
+        events = []
+        field = path[0] if path else None
+
+        if len(path) == 1 and field in self.HEADER_FIELDS:
+            if isinstance(value, self.HEADER_FIELDS[field]) and field not in self.header:
+                self.header[field] = value
+            if not self._header_sent and self.HEADER_FIELDS.keys() <= self.header.keys():
+                events.append(self._header_event())
+
+        elif field == "decision_points" and len(path) == 2:
+            point = self._validate(DecisionPoint, value)
+            if (
+                point is not None and point.choices
+                and 1 <= point.step <= self.num_decision_points
+                and point.step not in self.decision_points
+            ):
+                self.decision_points[point.step] = point
+                events.extend(self._publish())
+            else:
+                if point is not None:
+                    print(f"Skipped decision point for step {point.step}: no choices, out of range or repeated")
+                self.dropped_steps += 1
+
+        elif field == "consequence_rules":
+            if len(path) == 1:
+                self.rules_complete = True
+            else:
+                rule = self._validate(ConsequenceRule, value)
+                if rule is not None and rule not in self.rules:
+                    self.rules.append(rule)
+
+        return events
+
+    def snapshot(self) -> dict:
+        """Everything generated so far, as context for a tail request"""
+        return {
+            **self.header,
+            "decision_points": [
+                self.decision_points[step].model_dump() for step in sorted(self.decision_points)
+            ],
+            "consequence_rules": [rule.model_dump() for rule in self.rules]
+        }
+
+    def partial(self) -> Scenario:
+        """The playable prefix of the scenario"""
+        steps = [self.decision_points[step] for step in range(1, self._published + 1)]
+        return Scenario(
+            id=self.scenario_id,
+            title=self.header.get("title") or self.topic.capitalize(),
+            description=self.header.get("description", ""),
+            category=self.header.get("category", self.category),
+            difficulty=self.header.get("difficulty", self.difficulty),
+            estimated_time=self.header.get("estimated_time", 3 * self.num_decision_points),
+            decision_points=steps,
+            consequence_rules=self._valid_rules(steps)
+        )
+
+    def finish(self) -> Scenario:
+        """
+        The final scenario: every requested step, in order
+
+        Raises:
+            Exception: if steps are still missing after the tail requests;
+                a scenario shorter than asked for is never returned (or saved)
+        """
+        if self._published < self.num_decision_points:
+            missing = ", ".join(str(step) for step in self.missing_steps)
+            raise Exception(
+                f"only {len(self.decision_points)} of {self.num_decision_points} decision points "
+                f"were generated (missing steps: {missing})"
+            )
+        return self.partial()
+
+    def _publish(self) -> List[dict]:
+        events = []
+        while self._published + 1 in self.decision_points:
+            if not self._header_sent:
+                events.append(self._header_event())
+            self._published += 1
+            events.append({
+                "type": "decision_point",
+                "decision_point": self.decision_points[self._published],
+                "scenario": self.partial()
+            })
+        return events
+
+    def _header_event(self) -> dict:
+        self._header_sent = True
+        return {"type": "header", "scenario": self.partial()}
+
+    def _valid_rules(self, steps: List[DecisionPoint]) -> List[ConsequenceRule]:
+        """Rules whose trigger and target both exist among ``steps``"""
+        choices = {(point.step, choice.id) for point in steps for choice in point.choices}
+        numbers = {point.step for point in steps}
+        return [
+            rule for rule in self.rules
+            if (rule.trigger_step, rule.trigger_choice) in choices
+            and rule.appears_at_step in numbers
+            and rule.appears_at_step > rule.trigger_step
+        ]
+
+    @staticmethod
+    def _validate(model, value):
+        try:
+            return model.model_validate(value)
+        except ValidationError as e:
+            print(f"Skipped invalid {model.__name__}: {str(e)}")
+            return None
+
 
 class ScenarioGenerator:
     """Generate complete scenarios using LLM"""
     
+    # Follow-up requests for the missing tail of a cut-off streamed scenario
+    MAX_TAIL_ATTEMPTS = 2
+    
+    def __init__(self):
+        # Counters
+        self.tail_requests = 0
+        self.dropped_steps = 0
+    
     async def generate_scenario(
         self,
         topic: str,
@@ -26,7 +185,127 @@ class ScenarioGenerator:
         Returns:
             Complete Scenario object
         """
+        # One completion per request: nobody is watching the steps arrive, and
+        # parsing hundreds of stream chunks would cost more than it saves.
+        # No tail requests either; a short scenario fails and the caller
+        # (e.g. a batch job) retries the whole topic
+        events = self._generate(topic, category, difficulty, num_decision_points, progressive=False)
+        async with aclosing(events):
+            async for event in events:
+                if event["type"] == "scenario":
+                    return event["scenario"]
+        
+        raise Exception("Failed to generate scenario: generation ended without a scenario")
+    
+    async def stream_scenario(
+        self,
+        topic: str,
+        category: str,
+        difficulty: str = "intermediate",
+        num_decision_points: int = 3
+    ) -> AsyncIterator[dict]:
+        """
+        Generate a scenario progressively
         
+        The completion is streamed through an incremental JSON parser, so
+        each decision point is validated and emitted as soon as its closing
+        brace arrives. If the output is cut off (or a step fails
+        validation), only the missing steps and rules are requested again,
+        up to MAX_TAIL_ATTEMPTS times, with the finished part as context.
+        
+        Yields:
+            {"type": "header", "scenario": ...} partial Scenario (no steps yet)
+            {"type": "decision_point", "decision_point": ..., "scenario": ...}
+                each new step and the partial Scenario so far
+            {"type": "repair", "attempt": ..., "missing_steps": [...]}
+                before each tail request
+            {"type": "scenario", "scenario": ...} the complete Scenario, last
+        """
+        async for event in self._generate(topic, category, difficulty, num_decision_points, progressive=True):
+            yield event
+    
+    async def _generate(
+        self,
+        topic: str,
+        category: str,
+        difficulty: str,
+        num_decision_points: int,
+        progressive: bool
+    ) -> AsyncIterator[dict]:
+        """Shared body of generate_scenario and stream_scenario"""
+        draft = _ScenarioDraft(
+            scenario_id=f"gen_{uuid.uuid4().hex[:12]}",
+            topic=topic,
+            category=category,
+            difficulty=difficulty,
+            num_decision_points=num_decision_points
+        )
+        system_prompt, user_prompt = self._build_prompts(topic, category, difficulty, num_decision_points)
+        attempts = self.MAX_TAIL_ATTEMPTS + 1 if progressive else 1
+        
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    print(f"Requesting missing scenario steps {draft.missing_steps} (attempt {attempt})")
+                    self.tail_requests += 1
+                    yield {"type": "repair", "attempt": attempt, "missing_steps": draft.missing_steps}
+                    user_prompt = self._build_tail_prompt(draft)
+                
+                parser = IncrementalJSONParser()
+                try:
+                    async for chunk in self._completion_chunks(user_prompt, system_prompt, progressive):
+                        for path, value in parser.feed(chunk):
+                            for event in draft.apply(path, value):
+                                yield event
+                except LLMError as e:
+                    # Nothing to build on, or not worth retrying: give up
+                    if not draft.decision_points or not e.retryable:
+                        raise
+                    print(f"Scenario stream failed mid-way, repairing: {str(e)}")
+                
+                if parser.errors:
+                    print(f"Skipped malformed scenario parts: {'; '.join(parser.errors)}")
+                if draft.complete:
+                    break
+            
+            yield {"type": "scenario", "scenario": draft.finish()}
+        
+        except LLMError:
+            # Keep the type so callers can tell rate limits and outages apart
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to generate scenario: {str(e)}")
+        finally:
+            self.dropped_steps += draft.dropped_steps
+    
+    def stats(self) -> dict:
+        return {
+            "tail_requests": self.tail_requests,
+            "dropped_steps": self.dropped_steps
+        }
+    
+    async def _completion_chunks(self, prompt: str, system_prompt: str, progressive: bool) -> AsyncIterator[str]:
+        """Completion text, streamed or in one piece"""
+        params = {
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "temperature": 0.8,  # Higher for creativity
+            "max_tokens": 3000
+        }
+        if progressive:
+            async for chunk in llm_service.stream_completion(**params):
+                yield chunk
+        else:
+            yield await llm_service.generate_completion(**params)
+    
+    def _build_prompts(
+        self,
+        topic: str,
+        category: str,
+        difficulty: str,
+        num_decision_points: int
+    ) -> tuple[str, str]:
+        """Build (system_prompt, user_prompt) for a scenario request"""
         system_prompt = """You are an expert ethical scenario designer and educator.
 Create realistic, nuanced ethical dilemmas for training purposes.
 
@@ -89,57 +368,54 @@ Example consequence rule:
 
 Generate the complete scenario now as valid JSON."""
 
-        try:
-            response = await llm_service.generate_completion(
-                prompt=user_prompt,
-                system_prompt=system_prompt,
-                temperature=0.8,  # Higher for creativity
-                max_tokens=3000
-            )
-            
-            # Clean response (remove markdown if present)
-            cleaned = response.strip()
-            if cleaned.startswith("```json"):
-                cleaned = cleaned.replace("```json", "").replace("```", "").strip()
-            
-            # Parse JSON
-            scenario_data = json.loads(cleaned)
-            
-            # Generate unique ID
-            scenario_data["id"] = f"gen_{uuid.uuid4().hex[:12]}"
-            
-            # Validate and create Scenario object
-            scenario = Scenario(**scenario_data)
-            
-            return scenario
-            
-        except json.JSONDecodeError as e:
-            raise Exception(f"Failed to parse generated scenario JSON: {str(e)}\nResponse: {response}")
-        except Exception as e:
-            raise Exception(f"Failed to generate scenario: {str(e)}")
+        return system_prompt, user_prompt
+    
+    def _build_tail_prompt(self, draft: "_ScenarioDraft") -> str:
+        """Ask for only what is missing, with the finished part as context"""
+        missing = ", ".join(str(step) for step in draft.missing_steps) or "none"
+        rules = (
+            "an empty consequence_rules list" if draft.rules_complete
+            else f"{draft.num_decision_points - 1} consequence rules covering the whole scenario"
+        )
+        return f"""The scenario below was cut off before it was finished. Complete it.
+
+TOPIC: {draft.topic}
+CATEGORY: {draft.category}
+DIFFICULTY: {draft.difficulty}
+DECISION POINTS: {draft.num_decision_points}
+
+Scenario so far:
+{json.dumps(draft.snapshot())}
+
+Output ONLY valid JSON of the form {{"decision_points": [...], "consequence_rules": [...]}} with the
+decision points for steps {missing} (same structure as above, continuing the story) and {rules}.
+Do not repeat decision points that are already written."""
     
     async def generate_multiple(
         self,
         topics: list[str],
         category: str,
-        difficulty: str = "intermediate"
+        difficulty: str = "intermediate",
+        concurrency: int = config.BATCH_GENERATION_CONCURRENCY
     ) -> list[Scenario]:
-        """Generate multiple scenarios in batch"""
-        scenarios = []
+        """Generate multiple scenarios in batch, up to `concurrency` at a time"""
+        semaphore = asyncio.Semaphore(concurrency)
         
-        for topic in topics:
+        async def generate(topic: str) -> Optional[Scenario]:
             try:
-                scenario = await self.generate_scenario(
-                    topic=topic,
-                    category=category,
-                    difficulty=difficulty
-                )
-                scenarios.append(scenario)
+                async with semaphore:
+                    return await self.generate_scenario(
+                        topic=topic,
+                        category=category,
+                        difficulty=difficulty
+                    )
             except Exception as e:
                 print(f"Failed to generate scenario for '{topic}': {str(e)}")
-                continue
+                return None
+        
+        results = await asyncio.gather(*(generate(topic) for topic in topics))
         
-        return scenarios
+        return [scenario for scenario in results if scenario is not None]
     
     async def refine_scenario(
         self,
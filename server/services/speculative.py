@@ -0,0 +1,191 @@
+# Speculative prefetch of analyses and consequences for the choices on screen
+from services.framework_analyzer import framework_analyzer
+from services.consequence_generator import consequence_generator
+from services.scenario_engine import scenario_engine
+from services.precompute import precomputed_store
+from services.llm_service import background_priority
+from models.scenario import UserDecisionHistory
+from collections import OrderedDict
+from typing import Dict, Optional
+import asyncio
+import config
+
+
+class SpeculativePrefetcher:
+    """
+    Warms the analysis and consequence caches for every choice at a step
+
+    When a decision point is shown, each choice's analysis (and any
+    consequence it would trigger) is generated in the background at
+    background LLM priority, so the submit that follows is usually a cache
+    hit or joins the in-flight call. Each session may spend at most
+    ``max_calls_per_session`` LLM calls on speculation. Once the user's
+    choice arrives, jobs for the other choices are cancelled; the job for
+    the chosen one keeps running because the live request is waiting on it.
+    """
+
+    # Sessions whose spent budget is remembered
+    MAX_TRACKED_SESSIONS = 10000
+
+    def __init__(
+        self,
+        enabled: bool = config.SPECULATIVE_PREFETCH,
+        max_calls_per_session: int = config.SPECULATIVE_MAX_CALLS_PER_SESSION
+    ):
+        self.enabled = enabled
+        self.max_calls_per_session = max_calls_per_session
+        self._spent: "OrderedDict[str, int]" = OrderedDict()
+        self._jobs: Dict[str, Dict[tuple, asyncio.Task]] = {}
+
+        # Counters
+        self.scheduled_calls = 0
+        self.skipped_cached = 0
+        self.skipped_budget = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def prefetch(
+        self,
+        scenario_id: str,
+        step: int,
+        session: Optional[UserDecisionHistory]
+    ) -> int:
+        """
+        Start background jobs for every choice at ``step``
+
+        Without a session only the first step can be predicted (there is no
+        history yet); those jobs are shared by all anonymous viewers.
+
+        Returns:
+            Number of LLM calls scheduled
+        """
+        compiled = scenario_engine.get_compiled(scenario_id)
+        if not self.enabled or not compiled or step not in compiled.steps:
+            return 0
+
+        if session is None:
+            if step != min(compiled.steps):
+                return 0
+            session = UserDecisionHistory(scenario_id=scenario_id, session_id="", current_step=step)
+            owner = f"anonymous:{scenario_id}"
+        else:
+            owner = session.session_id
+
+        decision_point = compiled.steps[step]
+        history = [c["choice_text"] for c in session.choices_made]
+        path = [c["choice_id"] for c in session.choices_made]
+        rules = compiled.scenario.consequence_rules
+        pinned = consequence_generator.pending_trigger_positions(session.choices_made, rules, step)
+        jobs = self._jobs.setdefault(owner, {})
+        scheduled = 0
+
+        for choice in decision_point.choices:
+            if (step, choice.id) in jobs:
+                continue
+
+            calls = []
+
+            # Analysis the submit for this choice would ask for
+            analysis_key = framework_analyzer.cache_key(decision_point.context, choice.text, history, pinned)
+            if framework_analyzer.cache.contains(analysis_key) or precomputed_store.get_analysis(
+                scenario_id, path + [choice.id], analysis_key
+            ):
+                self.skipped_cached += 1
+            else:
+                calls.append(lambda c=choice: framework_analyzer.analyze_decision(
+                    context=decision_point.context,
+                    choice=c.text,
+                    decision_history=history,
+                    pinned=pinned
+                ))
+
+            # Consequences that choosing it would trigger
+            hypothetical = session.model_copy(update={
+                "choices_made": session.choices_made + [
+                    {"step": step, "choice_id": choice.id, "choice_text": choice.text}
+                ]
+            })
+            for rule in consequence_generator.check_consequence_triggers(
+                history=hypothetical,
+                current_step=step,
+                rules=compiled.rules_by_step.get(step, ())
+            ):
+                key = consequence_generator.input_key(rule, hypothetical, compiled.scenario.description, rules)
+                if consequence_generator.cache.contains(key) or precomputed_store.get_consequence(
+                    scenario_id, path + [choice.id], rule, key
+                ):
+                    self.skipped_cached += 1
+                    continue
+                calls.append(lambda r=rule, h=hypothetical: consequence_generator.generate_consequence(
+                    rule=r,
+                    history=h,
+                    context=compiled.scenario.description,
+                    rules=rules
+                ))
+
+            if not calls:
+                continue
+            if not self._spend(owner, len(calls)):
+                self.skipped_budget += len(calls)
+                continue
+
+            task = asyncio.create_task(self._run(calls))
+            jobs[(step, choice.id)] = task
+            task.add_done_callback(lambda t, k=(step, choice.id): self._forget(owner, k, t))
+            scheduled += len(calls)
+
+        self.scheduled_calls += scheduled
+        if not jobs:
+            self._jobs.pop(owner, None)
+        return scheduled
+
+    def on_choice(self, session_id: str, step: int, choice_id: str):
+        """The real choice arrived: cancel every other speculative job of the session"""
+        for key, task in list(self._jobs.get(session_id, {}).items()):
+            if key != (step, choice_id):
+                task.cancel()
+                self.cancelled += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_calls_per_session": self.max_calls_per_session,
+            "running_jobs": sum(len(jobs) for jobs in self._jobs.values()),
+            "scheduled_calls": self.scheduled_calls,
+            "skipped_cached": self.skipped_cached,
+            "skipped_budget": self.skipped_budget,
+            "cancelled": self.cancelled,
+            "failed": self.failed
+        }
+
+    def _spend(self, owner: str, calls: int) -> bool:
+        """Charge ``calls`` to an owner's budget if it has room"""
+        spent = self._spent.get(owner, 0)
+        if spent + calls > self.max_calls_per_session:
+            return False
+
+        self._spent[owner] = spent + calls
+        self._spent.move_to_end(owner)
+        while len(self._spent) > self.MAX_TRACKED_SESSIONS:
+            self._spent.popitem(last=False)
+        return True
+
+    async def _run(self, calls: list):
+        """Run one choice's calls concurrently at background priority"""
+        background_priority.set(True)
+        results = await asyncio.gather(*(call() for call in calls), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Speculative prefetch failed: {str(result)}")
+                self.failed += 1
+
+    def _forget(self, owner: str, key: tuple, task: asyncio.Task):
+        jobs = self._jobs.get(owner)
+        if jobs is not None and jobs.get(key) is task:
+            del jobs[key]
+            if not jobs:
+                del self._jobs[owner]
+
+
+# Singleton instance
+speculative_prefetcher = SpeculativePrefetcher()
@@ -0,0 +1,249 @@
+# Idempotent decision submission and per-session ordering
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from fastapi import HTTPException
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import time
+import config
+
+
+class Submission:
+    """One submit, in flight or finished, and what it was for"""
+    __slots__ = ("session_id", "fingerprint", "keys", "finished_at", "_body")
+
+    def __init__(self, session_id: str, fingerprint: tuple):
+        self.session_id = session_id
+        self.fingerprint = fingerprint  # (scenario_id, step, choice_id)
+        self.keys: List[str] = []
+        self.finished_at: Optional[float] = None
+        self._body: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def done(self) -> bool:
+        return self._body.done()
+
+    async def body(self) -> str:
+        """The stored response; waits if the original is still running"""
+        return await asyncio.shield(self._body)
+
+
+class SubmissionLog:
+    """
+    Replays decision submissions instead of running them twice
+
+    A submit is looked up by its ``Idempotency-Key`` and, once the session
+    is known, by (session_id, step). A replay gets the stored response body
+    without touching the session or the LLM; one that arrives while the
+    original is still running waits for it. Reusing a key for a different
+    choice is rejected (422), as is answering a step twice with different
+    choices (409).
+
+    Submits are ordered per session: looking up, recording the choice and
+    registering the submission happen under the session's lock, so
+    concurrent submits cannot interleave their writes. The LLM work runs
+    outside the lock. Finished responses are kept for ``ttl_seconds``, at
+    most ``max_entries`` of them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = config.SUBMISSION_REPLAY_MAX_ENTRIES,
+        ttl_seconds: float = config.SUBMISSION_REPLAY_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Submission]" = OrderedDict()
+        self._locks: Dict[str, tuple[asyncio.Lock, int]] = {}  # key -> (lock, users)
+
+        # Counters
+        self.recorded = 0
+        self.replayed = 0
+        self.joined = 0  # replays that waited for the original
+        self.rejected = 0
+        self.lock_waits = 0
+
+    @asynccontextmanager
+    async def ordered(self, session_id: Optional[str], idempotency_key: Optional[str]) -> AsyncIterator[None]:
+        """Hold the lock for a session (or, before one exists, an idempotency key)"""
+        if session_id:
+            key = f"session:{session_id}"
+        elif idempotency_key:
+            key = self._idempotency_key(idempotency_key)
+        else:
+            yield
+            return
+
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        if lock.locked():
+            self.lock_waits += 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def find(
+        self,
+        session_id: Optional[str],
+        idempotency_key: Optional[str],
+        fingerprint: tuple
+    ) -> Optional[Submission]:
+        """
+        Earlier submission this one repeats, if any
+
+        Raises:
+            HTTPException: 422 if the key was used for a different choice,
+                409 if the step was already answered with a different choice
+        """
+        self._purge()
+
+        if idempotency_key:
+            entry = self._entries.get(self._idempotency_key(idempotency_key))
+            if entry is not None:
+                if entry.fingerprint != fingerprint or (session_id and session_id != entry.session_id):
+                    self.rejected += 1
+                    raise HTTPException(
+                        status_code=422,
+                        detail="Idempotency-Key was already used for a different submission"
+                    )
+                return self._replay(entry)
+
+        if session_id:
+            entry = self._entries.get(self._step_key(session_id, fingerprint[1]))
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    self.rejected += 1
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"Step {fingerprint[1]} was already answered with a different choice"
+                    )
+                return self._replay(entry)
+
+        return None
+
+    def start(self, session_id: str, idempotency_key: Optional[str], fingerprint: tuple) -> Submission:
+        """Register a submission about to run, so repeats can find it"""
+        entry = Submission(session_id, fingerprint)
+        entry.keys.append(self._step_key(session_id, fingerprint[1]))
+        if idempotency_key:
+            entry.keys.append(self._idempotency_key(idempotency_key))
+
+        for key in entry.keys:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+        return entry
+
+    def complete(self, entry: Submission, body: str, replayable: bool = True):
+        """
+        Store the response sent for a submission
+
+        Repeats already waiting on it get the response either way; a
+        response that is not ``replayable`` (e.g. degraded) is then
+        forgotten so the next retry runs the submission again.
+        """
+        if entry.done:
+            return
+        entry._body.set_result(body)
+        entry.finished_at = time.time()
+        self.recorded += 1
+        if not replayable:
+            self._drop(entry)
+        self._evict()
+
+    def fail(self, entry: Submission, error: BaseException):
+        """
+        Forget a submission that produced no response
+
+        Repeats waiting on it get the same HTTP error (or a 409 asking them
+        to retry); the next retry runs the submission again.
+        """
+        self._drop(entry)
+        if entry.done:
+            return
+
+        if not isinstance(error, HTTPException):
+            error = HTTPException(
+                status_code=409,
+                detail="The original submission did not complete; retry the request"
+            )
+        entry._body.set_exception(error)
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        entry._body.exception()
+
+    def forget_session(self, session_id: str):
+        """Drop every stored response for a session (e.g. on restart)"""
+        for key in [k for k, e in self._entries.items() if e.session_id == session_id]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len({id(e) for e in self._entries.values()}),
+            "max_entries": self.max_entries,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "joined_in_flight": self.joined,
+            "rejected": self.rejected,
+            "lock_waits": self.lock_waits,
+            "locked_sessions": len(self._locks)
+        }
+
+    def _replay(self, entry: Submission) -> Submission:
+        self.replayed += 1
+        if not entry.done:
+            self.joined += 1
+        return entry
+
+    @staticmethod
+    def _idempotency_key(key: str) -> str:
+        return f"key:{key}"
+
+    @staticmethod
+    def _step_key(session_id: str, step: int) -> str:
+        return f"step:{session_id}:{step}"
+
+    def _drop(self, entry: Submission):
+        for key in entry.keys:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def _evict(self):
+        """Drop the oldest finished responses beyond max_entries (each has up to two keys)"""
+        excess = len(self._entries) - 2 * self.max_entries
+        if excess <= 0:
+            return
+
+        # Walk from the oldest end only as far as needed, without copying the log
+        evicted = []
+        for key, entry in self._entries.items():
+            if len(evicted) == excess:
+                break
+            if entry.done:
+                evicted.append(key)
+        for key in evicted:
+            del self._entries[key]
+
+    def _purge(self):
+        """Forget responses older than ttl_seconds (entries are roughly oldest first)"""
+        cutoff = time.time() - self.ttl_seconds
+        expired = []
+        for key, entry in self._entries.items():
+            if entry.finished_at is None:
+                continue
+            if entry.finished_at >= cutoff:
+                break
+            expired.append(key)
+        for key in expired:
+            del self._entries[key]
+
+
+# Singleton instance
+submission_log = SubmissionLog()
@@ -0,0 +1,280 @@
+# Pre-warmed topic suggestion pools
+from services.llm_service import llm_service, background_priority
+from services.scenario_engine import scenario_engine
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set
+import asyncio
+import json
+import random
+import re
+import config
+
+# Words that don't tell two topics apart
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "in", "on", "for", "to", "with", "at", "by",
+    "or", "vs", "versus", "about", "over", "from", "into", "their", "your", "its"
+}
+
+
+def topic_words(text: str) -> frozenset:
+    """Content words of a topic or title (plurals folded), for duplicate detection"""
+    words = (w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS)
+    return frozenset(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def is_duplicate(words: frozenset, other: frozenset) -> bool:
+    """Same topic in other words: one contains the other, or they mostly overlap"""
+    if not words or not other:
+        return False
+    if words <= other or other <= words:
+        return True
+    return len(words & other) / len(words | other) >= 0.75
+
+
+class _Pool:
+    """One category's topics, in serving order, with how often each was served"""
+
+    def __init__(self):
+        self.topics: Deque[list] = deque()  # [topic, words, times served]
+        self.refill: Optional[asyncio.Task] = None
+        self.served = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.duplicates = 0
+
+
+class TopicSuggestionPool:
+    """
+    Topic suggestions served from memory
+
+    Each category keeps a pool of LLM-suggested topics. A request gets the
+    next ``count`` topics, which then move to the back of the pool, so
+    consecutive requests see different topics. A topic is retired after
+    ``max_serves`` requests, unless that would leave too few topics for a
+    response. When fewer than ``low_water`` topics have serves left, one
+    background call (at background LLM priority) asks for another batch,
+    which goes to the front of the pool. Topics that duplicate one already
+    pooled, retired or present in the scenario library are dropped, both
+    when a batch comes in and when serving (the library changes).
+
+    The configured categories are filled at startup when prewarming is on
+    (SUGGESTION_PREWARM), otherwise once the first request comes in. Only
+    a request that finds its pool empty waits for the LLM.
+    """
+
+    def __init__(
+        self,
+        categories: List[str] = config.SUGGESTION_CATEGORIES,
+        pool_size: int = config.SUGGESTION_POOL_SIZE,
+        low_water: int = config.SUGGESTION_POOL_LOW_WATER,
+        batch_size: int = config.SUGGESTION_BATCH_SIZE,
+        max_serves: int = config.SUGGESTION_MAX_SERVES,
+        max_categories: int = config.SUGGESTION_MAX_CATEGORIES
+    ):
+        self.categories = [c.lower() for c in categories]
+        self.pool_size = pool_size
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self.max_serves = max_serves
+        self.max_categories = max_categories
+
+        # Most recently used last; configured categories are never dropped
+        self._pools: "OrderedDict[str, _Pool]" = OrderedDict()
+        # Retired topics per category, so later batches don't bring them back
+        self._retired: Dict[str, Set[frozenset]] = {}
+
+        # Whether the configured categories have been asked to fill
+        self.started = False
+
+        # Counters
+        self.waited = 0
+
+    def start(self):
+        """Start filling every configured category in the background"""
+        self.started = True
+        for category in self.categories:
+            self._schedule_refill(category, self._pool(category))
+
+    async def stop(self):
+        """Cancel refills still running"""
+        tasks = [p.refill for p in self._pools.values() if p.refill and not p.refill.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def suggest(self, category: str, count: int = 10) -> List[str]:
+        """
+        Next ``count`` topics for a category
+
+        Raises:
+            LLMError: if the pool is empty and filling it fails
+        """
+        category = category.lower()
+        pool = self._pool(category)
+
+        if not pool.topics:
+            # Nothing to serve yet: wait for (or start) a refill at request priority
+            self.waited += 1
+            task = self._schedule_refill(category, pool, background=False)
+            if not self.started:
+                # First request without prewarming: fill the other categories too
+                self.start()
+            await asyncio.shield(task)
+
+        library = self._library_words(category)
+        served = []
+        while pool.topics and len(served) < count:
+            entry = pool.topics.popleft()
+            if any(is_duplicate(entry[1], other) for other in library):
+                pool.duplicates += 1
+                self._retire(category, entry)
+                continue
+            entry[2] += 1
+            served.append(entry)
+
+        # Rotate: what was just served waits behind everything else
+        pool.topics.extend(served)
+        self._prune(category, pool, keep=count)
+
+        pool.served += 1
+        if sum(1 for entry in pool.topics if entry[2] < self.max_serves) < self.low_water:
+            self._schedule_refill(category, pool)
+        return [entry[0] for entry in served]
+
+    def stats(self) -> dict:
+        return {
+            "started": self.started,
+            "waited_for_llm": self.waited,
+            "categories": {
+                category: {
+                    "topics": len(pool.topics),
+                    "served": pool.served,
+                    "refills": pool.refills,
+                    "refill_failures": pool.refill_failures,
+                    "duplicates_dropped": pool.duplicates,
+                    "refilling": pool.refill is not None and not pool.refill.done()
+                }
+                for category, pool in self._pools.items()
+            }
+        }
+
+    def _pool(self, category: str) -> _Pool:
+        pool = self._pools.get(category)
+        if pool is None:
+            pool = self._pools[category] = _Pool()
+            self._drop_unused()
+        self._pools.move_to_end(category)
+        return pool
+
+    def _drop_unused(self):
+        """Forget the least recently used ad-hoc categories beyond max_categories"""
+        for category in list(self._pools):
+            if len(self._pools) <= self.max_categories:
+                break
+            if category in self.categories:
+                continue
+            pool = self._pools.pop(category)
+            self._retired.pop(category, None)
+            if pool.refill is not None:
+                pool.refill.cancel()
+
+    def _prune(self, category: str, pool: _Pool, keep: int):
+        """Retire topics served max_serves times while more than ``keep`` are left"""
+        excess = len(pool.topics) - keep
+        if excess <= 0:
+            return
+
+        kept = deque()
+        for entry in pool.topics:
+            if excess > 0 and entry[2] >= self.max_serves:
+                self._retire(category, entry)
+                excess -= 1
+            else:
+                kept.append(entry)
+        pool.topics = kept
+
+    def _retire(self, category: str, entry: list):
+        self._retired.setdefault(category, set()).add(entry[1])
+
+    def _library_words(self, category: str) -> List[frozenset]:
+        return [
+            topic_words(scenario.title)
+            for scenario in scenario_engine.list_scenarios()
+            if scenario.category.lower() == category
+        ]
+
+    def _schedule_refill(self, category: str, pool: _Pool, background: bool = True) -> asyncio.Task:
+        """The pool's running refill, or a new one"""
+        if pool.refill is None or pool.refill.done():
+            pool.refill = asyncio.create_task(self._refill(category, pool, background))
+            # Failures are counted in _refill; don't warn when nobody awaits it
+            pool.refill.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return pool.refill
+
+    async def _refill(self, category: str, pool: _Pool, background: bool):
+        if background:
+            background_priority.set(True)
+
+        pooled = [entry[0] for entry in pool.topics]
+        known = [entry[1] for entry in pool.topics]
+        known += self._library_words(category)
+        known += self._retired.get(category, ())
+
+        try:
+            batch = await self._generate(category, self.batch_size, avoid=pooled)
+        except Exception as e:
+            print(f"Topic suggestion refill failed for {category}: {str(e)}")
+            pool.refill_failures += 1
+            raise
+
+        pool.refills += 1
+        random.shuffle(batch)
+        fresh = []
+        for topic in batch:
+            words = topic_words(topic)
+            if not words or any(is_duplicate(words, other) for other in known):
+                pool.duplicates += 1
+                continue
+            fresh.append([topic, words, 0])
+            known.append(words)
+
+        # New topics are served first; the most served make room for them
+        pool.topics.extendleft(reversed(fresh))
+        self._prune(category, pool, keep=self.pool_size)
+        while len(pool.topics) > self.pool_size:
+            self._retire(category, pool.topics.pop())
+
+    async def _generate(self, category: str, count: int, avoid: List[str]) -> List[str]:
+        """One LLM call for a batch of topics"""
+        system_prompt = "You suggest ethical dilemma topics for training scenarios. Output only a JSON array of strings."
+
+        avoid_text = ""
+        if avoid:
+            avoid_text = "\n\nDo not repeat these topics:\n" + "\n".join(f"- {topic}" for topic in avoid)
+
+        user_prompt = f"""Suggest {count} compelling ethical dilemma topics for the {category} category.
+
+Topics should be:
+- Realistic and relevant to modern professionals
+- Morally complex with no easy answers
+- Suitable for training and education
+- Culturally sensitive{avoid_text}
+
+Output format: ["topic 1", "topic 2", ...]"""
+
+        response = await llm_service.generate_completion(
+            prompt=user_prompt,
+            system_prompt=system_prompt,
+            temperature=0.9,
+            max_tokens=40 * count
+        )
+
+        cleaned = response.strip().replace("```json", "").replace("```", "").strip()
+        topics = json.loads(cleaned)
+        if not isinstance(topics, list):
+            raise ValueError("Topic suggestions are not a JSON array")
+        return [" ".join(t.split()) for t in topics if isinstance(t, str) and t.strip()]
+
+
+# Singleton instance
+topic_suggestions = TopicSuggestionPool()
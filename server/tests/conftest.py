@@ -0,0 +1,43 @@
+# Shared test setup: isolated configuration, offline LLM
+import os
+import sys
+import tempfile
+
+# Isolate all state before the app modules read their configuration
+os.environ["GROQ_API_KEY"] = "stub"
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["ANALYSIS_CACHE_PATH"] = ""
+os.environ["LLM_CASSETTE_MODE"] = ""
+os.environ["SUGGESTION_PREWARM"] = "0"
+os.environ["SCENARIO_LIBRARY_DIR"] = tempfile.mkdtemp(prefix="test-library-")
+os.environ["PRECOMPUTE_DIR"] = tempfile.mkdtemp(prefix="test-precomputed-")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def stub_llm():
+    from benchmarks.stub_llm import StubLLM
+    return StubLLM(latency=0.0)
+
+
+@pytest.fixture
+async def client(stub_llm):
+    """The app (lifespan started) over an in-process transport, LLM calls answered by the stub"""
+    import httpx
+    import main
+    from benchmarks.stub_llm import install
+    from services.llm_service import llm_service
+
+    async with main.app.router.lifespan_context(main.app):
+        install(llm_service, stub_llm)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            yield http
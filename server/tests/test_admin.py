@@ -0,0 +1,110 @@
+# Admin API
+from services.degraded_mode import degraded_fallback
+from services.framework_analyzer import framework_analyzer
+from services.precompute import precomputer
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ADMIN_KEY = "test-admin-key"
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEY", ADMIN_KEY)
+    return {"api_key": ADMIN_KEY}
+
+
+async def test_clear_cache_drops_degraded_stand_ins(client, admin):
+    analysis = degraded_fallback.template_analysis("Tell the truth")
+    degraded_fallback.remember("scenario", 1, "A", analysis)
+    framework_analyzer.cache.set("key", "response")
+
+    stats = (await client.get("/api/admin/cache/stats", params=admin)).json()
+    assert stats["degraded_mode"]["analyses"]["entries"] >= 1
+
+    response = await client.delete("/api/admin/cache", params=admin)
+    assert response.status_code == 200
+
+    stats = (await client.get("/api/admin/cache/stats", params=admin)).json()
+    assert stats["degraded_mode"]["analyses"]["entries"] == 0
+    assert stats["framework_analysis"]["entries"] == 0
+    assert degraded_fallback.analyses.get(degraded_fallback._key("scenario", 1, "A")) is None
+
+
+async def test_admin_routes_need_the_key(client):
+    response = await client.delete("/api/admin/cache", params={"api_key": "wrong"})
+    assert response.status_code == 403
+
+
+async def wait_for_builds():
+    await asyncio.gather(*precomputer._background)
+
+
+async def test_precompute_runs_in_the_background(client, admin, monkeypatch):
+    started = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def build(scenario_id):
+        started.set()
+        await finish.wait()
+        return {"reused": 0, "generated": 3, "failed": 0}
+
+    monkeypatch.setattr(precomputer, "build", build)
+    response = await client.post("/api/admin/precompute/leaked_report_001", params=admin)
+    assert response.status_code == 202
+    assert response.json()["status"] == "running"
+
+    await started.wait()
+    status = (await client.get("/api/admin/precompute/leaked_report_001", params=admin)).json()
+    assert status["status"] == "running"
+
+    finish.set()
+    await wait_for_builds()
+    status = (await client.get("/api/admin/precompute/leaked_report_001", params=admin)).json()
+    assert status["status"] == "completed"
+    assert status["stats"]["generated"] == 3
+    assert status["finished_at"] is not None
+
+
+async def test_precompute_requested_while_building_runs_once_more(client, admin, monkeypatch):
+    started = asyncio.Event()
+    finish = asyncio.Event()
+    builds = []
+
+    async def build(scenario_id):
+        builds.append(scenario_id)
+        started.set()
+        await finish.wait()
+        return {"reused": 0, "generated": 0, "failed": 0}
+
+    monkeypatch.setattr(precomputer, "build", build)
+    await client.post("/api/admin/precompute/leaked_report_001", params=admin)
+    await started.wait()
+
+    # Requests during the build share one follow-up rebuild
+    for _ in range(2):
+        assert (await client.post("/api/admin/precompute/leaked_report_001", params=admin)).status_code == 202
+    assert len(precomputer._background) == 1
+
+    finish.set()
+    await wait_for_builds()
+    assert len(builds) == 2
+
+
+async def test_failed_precompute_is_reported(client, admin, monkeypatch):
+    async def build(scenario_id):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(precomputer, "build", build)
+    await client.post("/api/admin/precompute/leaked_report_001", params=admin)
+    await wait_for_builds()
+
+    status = (await client.get("/api/admin/precompute/leaked_report_001", params=admin)).json()
+    assert (status["status"], status["error"]) == ("failed", "disk full")
+
+
+async def test_precompute_of_unknown_scenario(client, admin):
+    assert (await client.post("/api/admin/precompute/missing", params=admin)).status_code == 404
+    assert (await client.get("/api/admin/precompute/missing", params=admin)).status_code == 404
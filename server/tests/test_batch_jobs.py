@@ -0,0 +1,81 @@
+# Background batch scenario generation
+from database.repositories.scenario_repo import scenario_repo
+from services.batch_jobs import BatchJobManager
+from services.scenario_engine import scenario_engine
+from services.scenario_generator import scenario_generator
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def manager():
+    return BatchJobManager(concurrency=2, max_retries=0, retention_seconds=60)
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Generate a copy of a library scenario per topic; topics starting "bad" fail"""
+    release = asyncio.Event()
+    release.set()
+
+    async def generate_scenario(topic, category, difficulty="intermediate", **kwargs):
+        await release.wait()
+        if topic.startswith("bad"):
+            raise Exception(f"Failed to generate scenario: {topic}")
+        return scenario_engine.get_scenario("leaked_report_001").model_copy(update={"id": f"gen_{topic}"})
+
+    monkeypatch.setattr(scenario_generator, "generate_scenario", generate_scenario)
+    return release
+
+
+async def follow(manager: BatchJobManager, job_id: str) -> list:
+    return [event async for event in manager.events(job_id)]
+
+
+async def test_job_reports_each_topic_then_done(manager, generated):
+    job = manager.submit(["one", "bad", "two"], category="business")
+    events = await asyncio.wait_for(follow(manager, job.job_id), timeout=1)
+
+    names = [name for name, _ in events]
+    assert sorted(names[:-1]) == ["failed", "scenario", "scenario"]
+    assert events[-1] == ("done", manager.summary(job))
+    assert (job.status, len(job.scenarios), len(job.failed)) == ("completed", 2, 1)
+    assert job.failed[0].topic == "bad"
+
+
+async def test_late_follower_gets_the_replay(manager, generated):
+    job = manager.submit(["one"], category="business")
+    await asyncio.wait_for(follow(manager, job.job_id), timeout=1)
+
+    events = await follow(manager, job.job_id)
+    assert [name for name, _ in events] == ["scenario", "done"]
+
+
+async def test_cancel_keeps_finished_scenarios_and_ends_followers(manager, generated):
+    generated.clear()
+    job = manager.submit(["one", "two"], category="business")
+    follower = asyncio.create_task(follow(manager, job.job_id))
+    await asyncio.sleep(0)
+
+    assert await manager.cancel(job.job_id)
+    assert not await manager.cancel(job.job_id)
+
+    events = await asyncio.wait_for(follower, timeout=1)
+    assert events[-1][0] == "done"
+    assert events[-1][1]["status"] == "cancelled"
+    assert job.finished_at is not None
+
+
+async def test_unexpected_failure_ends_the_job(manager, generated, monkeypatch):
+    def save(scenario, overwrite=True):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(scenario_repo, "save", save)
+    job = manager.submit(["one"], category="business", save_to_library=True)
+
+    events = await asyncio.wait_for(follow(manager, job.job_id), timeout=1)
+    assert events[-1][0] == "done"
+    assert (events[-1][1]["status"], events[-1][1]["error"]) == ("failed", "disk full")
+    assert job.done and job.finished_at is not None
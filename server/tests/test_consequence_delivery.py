@@ -0,0 +1,71 @@
+# Deferred consequence delivery
+from services.consequence_delivery import ConsequenceDelivery
+from models.scenario import ConsequenceRule
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+RULE = ConsequenceRule(trigger_choice="A", trigger_step=1, appears_at_step=3, consequence_template="Later")
+
+
+async def never_finishes() -> str:
+    await asyncio.Event().wait()
+
+
+async def follow(delivery: ConsequenceDelivery, session_id: str, handle_ids: list) -> list:
+    return [handle async for handle in delivery.events(session_id, handle_ids)]
+
+
+async def test_follower_gets_handles_in_completion_order():
+    delivery = ConsequenceDelivery(pregenerate=False)
+    release = asyncio.Event()
+
+    async def slow() -> str:
+        await release.wait()
+        return "slow"
+
+    async def fast() -> str:
+        return "fast"
+
+    first = delivery.deliver("s1", RULE, "Act", slow)
+    second = delivery.deliver("s1", RULE, "Act", fast)
+    follower = asyncio.create_task(follow(delivery, "s1", [first.handle_id, second.handle_id]))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    handles = await asyncio.wait_for(follower, timeout=1)
+    assert [h.text for h in handles] == ["fast", "slow"]
+    assert all(h.status == "ready" for h in handles)
+
+
+async def test_failed_generation_falls_back_to_degraded_text():
+    delivery = ConsequenceDelivery(pregenerate=False)
+
+    async def failing() -> str:
+        raise RuntimeError("provider down")
+
+    handle = delivery.deliver("s1", RULE, "Act", failing, fallback=lambda e: "Template")
+    await delivery.wait(handle.handle_id, timeout=1)
+
+    assert (handle.status, handle.text, handle.degraded) == ("ready", "Template", True)
+
+
+@pytest.mark.parametrize("started", [True, False])
+async def test_forgetting_a_session_ends_its_followers(started):
+    delivery = ConsequenceDelivery(pregenerate=False)
+    handle = delivery.deliver("s1", RULE, "Act", never_finishes)
+    follower = asyncio.create_task(follow(delivery, "s1", [handle.handle_id]))
+    if started:
+        # Let the generation and the follower start waiting
+        await asyncio.sleep(0.01)
+
+    delivery.forget_session("s1")
+
+    handles = await asyncio.wait_for(follower, timeout=1)
+    # A follower that starts after the delete finds nothing to wait for
+    assert handles == ([handle] if started else [])
+    assert handle.status == "failed"
+    assert handle.error == "session deleted"
+    assert delivery.get(handle.handle_id) is None
+    assert delivery.stats()["handles_pending"] == 0
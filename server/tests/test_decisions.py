@@ -0,0 +1,296 @@
+# Decision submit API
+from api.decisions import DecisionSubmitRequest, submit_decision_stream
+from services.consequence_delivery import consequence_delivery
+from services.consequence_generator import consequence_generator
+from services.degraded_mode import degraded_fallback
+from services.framework_analyzer import framework_analyzer
+from services.llm_resilience import LLMServerError
+from services.scenario_engine import scenario_engine
+from services.submission_log import submission_log
+from database.repositories.user_session_repo import session_repo
+import asyncio
+import json
+import pytest
+import uuid
+
+pytestmark = pytest.mark.anyio
+
+
+def submit_body(step: int = 1, choice_id: str = None, **overrides) -> dict:
+    scenario = scenario_engine.list_scenarios()[0]
+    point = next(p for p in scenario.decision_points if p.step == step)
+    choice = next((c for c in point.choices if c.id == choice_id), point.choices[0])
+    return {
+        "scenario_id": scenario.id,
+        "step": step,
+        "choice_id": choice.id,
+        "choice_text": choice.text,
+        **overrides
+    }
+
+
+@pytest.mark.parametrize("field, value", [("session_id", "s" * 65), ("choice_id", "c" * 33)])
+async def test_submit_rejects_ids_longer_than_their_columns(client, stub_llm, field, value):
+    response = await client.post("/api/decisions/submit", json={**submit_body(), field: value})
+
+    assert response.status_code == 422
+    assert stub_llm.requests == 0
+
+
+async def test_repeated_submit_replays_stored_response(client, stub_llm):
+    body = submit_body(session_id=str(uuid.uuid4()))
+    first = await client.post("/api/decisions/submit", json=body)
+    calls = stub_llm.requests
+
+    second = await client.post("/api/decisions/submit", json=body)
+
+    assert first.status_code == second.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json() == first.json()
+    assert stub_llm.requests == calls
+
+
+async def test_idempotency_key_replays_submit_without_session(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    first = await client.post("/api/decisions/submit", json=submit_body(), headers=headers)
+    second = await client.post("/api/decisions/submit", json=submit_body(), headers=headers)
+
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json()["session_id"] == first.json()["session_id"]
+
+
+async def test_different_choice_for_answered_step_conflicts(client):
+    scenario = scenario_engine.list_scenarios()[0]
+    first_choice, other_choice = [c.id for c in scenario.decision_points[0].choices[:2]]
+    session_id = str(uuid.uuid4())
+
+    first = await client.post("/api/decisions/submit", json=submit_body(choice_id=first_choice, session_id=session_id))
+    second = await client.post("/api/decisions/submit", json=submit_body(choice_id=other_choice, session_id=session_id))
+
+    assert first.status_code == 200
+    assert second.status_code == 409
+    session = await session_repo.get(session_id)
+    assert [c["choice_id"] for c in session.choices_made] == [first_choice]
+
+
+async def test_concurrent_identical_submits_run_once(client, stub_llm):
+    stub_llm.latency = 0.05
+    body = submit_body(session_id=str(uuid.uuid4()))
+
+    responses = await asyncio.gather(*(client.post("/api/decisions/submit", json=body) for _ in range(5)))
+
+    assert [r.status_code for r in responses] == [200] * 5
+    assert sum("Idempotent-Replayed" not in r.headers for r in responses) == 1
+    assert len({r.content for r in responses}) == 1
+    session = await session_repo.get(body["session_id"])
+    assert len(session.choices_made) == 1
+
+
+async def test_concurrent_submits_for_one_session_are_serialized(client, stub_llm, monkeypatch):
+    stub_llm.latency = 0.05
+    scenario = scenario_engine.list_scenarios()[0]
+    step = scenario.decision_points[1].step
+    choices = [c.id for c in scenario.decision_points[1].choices[:2]]
+    session_id = str(uuid.uuid4())
+    await client.post("/api/decisions/submit", json=submit_body(session_id=session_id))
+
+    # Both submits now load the session from the database
+    await session_repo.flush()
+    monkeypatch.setattr(session_repo, "idle_seconds", -1)
+    session_repo._evict_idle()
+
+    responses = await asyncio.gather(*(
+        client.post("/api/decisions/submit", json=submit_body(step=step, choice_id=choice, session_id=session_id))
+        for choice in choices
+    ))
+
+    assert sorted(r.status_code for r in responses) == [200, 409]
+    accepted = choices[[r.status_code for r in responses].index(200)]
+    await session_repo.flush()
+    session_repo._evict_idle()
+    session = await session_repo.get(session_id)
+    assert [c["choice_id"] for c in session.choices_made][1:] == [accepted]
+
+
+async def reach_consequence_step(client, monkeypatch) -> dict:
+    """
+    Play leaked_report_001 up to step 3, whose consequence choice A at step 1
+    triggers; returns the step-3 submit body (consequences not pre-generated)
+    """
+    monkeypatch.setattr(consequence_delivery, "pregenerate_enabled", False)
+    scenario = scenario_engine.get_scenario("leaked_report_001")
+    session_id = str(uuid.uuid4())
+
+    def body(step: int, choice_id: str) -> dict:
+        point = next(p for p in scenario.decision_points if p.step == step)
+        choice = next(c for c in point.choices if c.id == choice_id)
+        return {"scenario_id": scenario.id, "session_id": session_id, "step": step,
+                "choice_id": choice.id, "choice_text": choice.text}
+
+    for step, choice_id in ((1, "A"), (2, scenario.decision_points[1].choices[0].id)):
+        assert (await client.post("/api/decisions/submit", json=body(step, choice_id))).status_code == 200
+    return body(3, scenario.decision_points[2].choices[0].id)
+
+
+def sse_events(text: str) -> list[tuple[str, dict]]:
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def test_stream_sends_tokens_then_sections_then_result(client, stub_llm):
+    framework_analyzer.cache.clear()
+    response = await client.post("/api/decisions/submit/stream", json=submit_body(session_id=str(uuid.uuid4())))
+    events = sse_events(response.text)
+    names = [name for name, _ in events]
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert names[0] == "token"
+    assert names[-1] == "result"
+    # Every section follows the tokens it was built from; the result comes last
+    assert names.count("section") == len(framework_analyzer.FIELD_NAMES)
+    assert names.index("section") > names.index("token")
+    assert events[-1][1]["degraded"] is False
+    assert {data["framework"] for name, data in events if name == "section"} == set(framework_analyzer.FIELD_NAMES.values())
+
+
+async def test_stream_failure_mid_analysis(client, stub_llm, monkeypatch):
+    async def stream_analysis(**kwargs):
+        yield {"type": "token", "text": "Partial"}
+        raise LLMServerError("Failed to stream completion: 503")
+
+    monkeypatch.setattr(framework_analyzer, "stream_analysis", stream_analysis)
+    body = submit_body(session_id=str(uuid.uuid4()))
+
+    # Degraded mode: the stand-in sections replace the partial text
+    events = sse_events((await client.post("/api/decisions/submit/stream", json=body)).text)
+    assert [name for name, _ in events] == ["token"] + ["section"] * len(framework_analyzer.FIELD_NAMES) + ["result"]
+    assert events[-1][1]["degraded"] is True
+
+    # Otherwise the stream ends with an error event, and a retry runs again
+    monkeypatch.setattr(degraded_fallback, "enabled", False)
+    body = submit_body(session_id=str(uuid.uuid4()))
+    events = sse_events((await client.post("/api/decisions/submit/stream", json=body)).text)
+    assert [name for name, _ in events] == ["token", "error"]
+    assert events[-1][1]["status_code"] == 500
+    assert submission_log.find(body["session_id"], None, (body["scenario_id"], body["step"], body["choice_id"])) is None
+
+
+async def test_client_disconnect_stops_the_submission(client, stub_llm, monkeypatch):
+    """Closing the stream cancels the consequence work and forgets the submission"""
+    step3 = await reach_consequence_step(client, monkeypatch)
+    session_id = step3["session_id"]
+
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def generate_consequence(**kwargs):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def stream_analysis(**kwargs):
+        yield {"type": "token", "text": "Partial"}
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(consequence_generator, "generate_consequence", generate_consequence)
+    monkeypatch.setattr(framework_analyzer, "stream_analysis", stream_analysis)
+
+    response = await submit_decision_stream(DecisionSubmitRequest(**step3), idempotency_key=None)
+    stream = response.body_iterator
+    assert (await anext(stream)).startswith("event: token")
+    await asyncio.wait_for(started.wait(), timeout=1)
+    await stream.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    fingerprint = (step3["scenario_id"], step3["step"], step3["choice_id"])
+    assert submission_log.find(session_id, None, fingerprint) is None
+
+
+@pytest.fixture
+async def consequence_step(client, stub_llm, monkeypatch):
+    """Step-3 body; analysis and consequence calls are then scripted by the test"""
+    step3 = await reach_consequence_step(client, monkeypatch)
+    monkeypatch.setattr(degraded_fallback, "enabled", False)
+    return step3
+
+
+def script(monkeypatch, analysis=None, consequence=None):
+    """Replace the analysis and consequence calls; None means the job succeeds"""
+    async def analyze_decision(**kwargs):
+        return await (analysis() if analysis else ok_analysis())
+
+    async def generate_consequence(**kwargs):
+        return await (consequence() if consequence else ok_consequence())
+
+    monkeypatch.setattr(framework_analyzer, "analyze_decision", analyze_decision)
+    monkeypatch.setattr(consequence_generator, "generate_consequence", generate_consequence)
+
+
+async def ok_analysis():
+    return framework_analyzer.build_analysis(json.dumps({
+        "utilitarian": "U", "deontological": "D", "virtue_ethics": "V", "care_ethics": "C"
+    }))
+
+
+async def ok_consequence():
+    return "The report leaks"
+
+
+async def failing():
+    raise Exception("Failed to generate completion: bad response")
+
+
+async def test_analysis_and_consequence_run_concurrently(client, consequence_step, monkeypatch):
+    # Each job only finishes once the other has started
+    analysis_started = asyncio.Event()
+    consequence_started = asyncio.Event()
+
+    async def analysis():
+        analysis_started.set()
+        await asyncio.wait_for(consequence_started.wait(), timeout=1)
+        return await ok_analysis()
+
+    async def consequence():
+        consequence_started.set()
+        await asyncio.wait_for(analysis_started.wait(), timeout=1)
+        return await ok_consequence()
+
+    script(monkeypatch, analysis, consequence)
+    response = await client.post("/api/decisions/submit", json=consequence_step)
+
+    assert response.status_code == 200
+    assert response.json()["analysis"]["utilitarian"] == "U"
+    assert [c["text"] for c in response.json()["consequences"]] == ["The report leaks"]
+
+
+async def test_failed_consequence_still_returns_the_analysis(client, consequence_step, monkeypatch):
+    script(monkeypatch, consequence=failing)
+    response = await client.post("/api/decisions/submit", json=consequence_step)
+
+    assert response.status_code == 200
+    assert response.json()["analysis"]["utilitarian"] == "U"
+    assert response.json()["consequences"] == []
+
+
+async def test_failed_analysis_still_returns_the_consequence(client, consequence_step, monkeypatch):
+    script(monkeypatch, analysis=failing)
+    response = await client.post("/api/decisions/submit", json=consequence_step)
+
+    assert response.status_code == 200
+    assert response.json()["analysis"]["utilitarian"] == "Analysis unavailable"
+    assert [c["text"] for c in response.json()["consequences"]] == ["The report leaks"]
+
+
+async def test_both_failing_is_an_error(client, consequence_step, monkeypatch):
+    script(monkeypatch, analysis=failing, consequence=failing)
+    response = await client.post("/api/decisions/submit", json=consequence_step)
+
+    assert response.status_code == 500
@@ -0,0 +1,98 @@
+# Degraded-mode stand-ins for failed LLM calls
+from models.scenario import ConsequenceRule
+from services import degraded_mode
+from services.degraded_mode import DegradedFallback
+from services.framework_analyzer import framework_analyzer
+from services.llm_resilience import LLMServerError, LLMUnavailableError
+from services.precompute import PrecomputedStore
+import json
+import pytest
+import uuid
+
+pytestmark = pytest.mark.anyio
+
+
+def raw_analysis(label: str) -> str:
+    return json.dumps({
+        "utilitarian": f"{label} U", "deontological": f"{label} D",
+        "virtue_ethics": f"{label} V", "care_ethics": f"{label} C"
+    })
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = PrecomputedStore(str(tmp_path))
+    monkeypatch.setattr(degraded_mode, "precomputed_store", store)
+    return store
+
+
+@pytest.fixture
+def fallback(store):
+    return DegradedFallback(enabled=True)
+
+
+def test_only_llm_failures_fall_back(fallback):
+    assert fallback.applies(LLMServerError("503"))
+    assert fallback.applies(LLMUnavailableError("circuit open"))
+    assert not fallback.applies(ValueError("bug"))
+    assert not DegradedFallback(enabled=False).applies(LLMServerError("503"))
+
+
+def test_template_is_the_last_resort(fallback):
+    analysis, source = fallback.analysis("s1", 2, ["A", "B"], "  Tell   the truth. ")
+
+    assert source == "template"
+    assert '"Tell the truth"' in analysis.utilitarian
+    assert framework_analyzer.is_complete(analysis)
+
+
+def test_precomputed_analysis_of_the_same_choice_is_used(fallback, store):
+    # Written for another path that ends in the same choice at the same step
+    store.save("s1", {"scenario_id": "s1", "nodes": {"A.B": {"h": "x", "a": raw_analysis("Precomputed")}}})
+
+    analysis, source = fallback.analysis("s1", 2, ["C", "B"], "Wait")
+    assert (source, analysis.utilitarian) == ("precomputed", "Precomputed U")
+
+    # A different choice at that step has no stand-in
+    assert fallback.analysis("s1", 2, ["A", "C"], "Act")[1] == "template"
+
+
+def test_analysis_seen_in_another_session_comes_first(fallback, store):
+    store.save("s1", {"scenario_id": "s1", "nodes": {"A.B": {"h": "x", "a": raw_analysis("Precomputed")}}})
+    fallback.remember("s1", 2, "B", framework_analyzer.build_analysis(raw_analysis("Live")))
+
+    analysis, source = fallback.analysis("s1", 2, ["C", "B"], "Wait")
+    assert (source, analysis.utilitarian) == ("cached", "Live U")
+    assert fallback.stats()["served"] == {"cached": 1, "precomputed": 0, "template": 0, "consequence_template": 0}
+
+
+def test_incomplete_analyses_are_not_kept(fallback):
+    partial = framework_analyzer.build_analysis(json.dumps({"utilitarian": "Only one"}))
+    fallback.remember("s1", 1, "A", partial)
+
+    assert fallback.analysis("s1", 1, ["A"], "Act")[1] == "template"
+
+
+def test_failed_consequence_uses_its_rule_template(fallback):
+    rule = ConsequenceRule(trigger_choice="A", trigger_step=1, appears_at_step=3, consequence_template="It leaks")
+
+    assert fallback.consequence(rule) == "It leaks"
+    assert fallback.served["consequence_template"] == 1
+
+
+async def test_submit_during_an_outage_gets_a_flagged_stand_in(client, stub_llm, monkeypatch):
+    body = {"scenario_id": "leaked_report_001", "step": 1, "choice_id": "A", "choice_text": "Report it"}
+    live = await client.post("/api/decisions/submit", json={**body, "session_id": str(uuid.uuid4())})
+    assert live.json()["degraded"] is False
+
+    async def analyze_decision(**kwargs):
+        raise LLMUnavailableError("LLM circuit open")
+
+    monkeypatch.setattr(framework_analyzer, "analyze_decision", analyze_decision)
+    response = await client.post("/api/decisions/submit", json={**body, "session_id": str(uuid.uuid4())})
+
+    assert response.status_code == 200
+    assert response.json()["degraded"] is True
+    # The analysis served to the first session stands in for it
+    assert response.json()["analysis"] == live.json()["analysis"]
+    assert "Idempotent-Replayed" not in response.headers
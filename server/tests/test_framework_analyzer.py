@@ -0,0 +1,70 @@
+# Streaming framework analysis
+from services.framework_analyzer import FrameworkAnalyzer
+from services.llm_service import llm_service
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """Replace the streaming LLM call; returns the kwargs of each call"""
+    calls = []
+
+    def stream_chunks(*chunks):
+        async def stream_completion(**kwargs):
+            calls.append(kwargs)
+            for chunk in chunks:
+                yield chunk
+        monkeypatch.setattr(llm_service, "stream_completion", stream_completion)
+        return calls
+
+    return stream_chunks
+
+
+async def collect(analyzer: FrameworkAnalyzer) -> list:
+    return [event async for event in analyzer.stream_analysis(context="A context", choice="A choice")]
+
+
+def sections(events: list) -> dict:
+    return {e["framework"]: e["text"] for e in events if e["type"] == "section"}
+
+
+async def test_streamed_sections_accept_raw_newlines(streamed):
+    calls = streamed(
+        '{"utilitarian": "line1\nline2", ',
+        '"deontological": "Duty \\"first\\".", ',
+        '"virtue_ethics": "Honest.", "care_ethics": "Kind."}'
+    )
+    events = await collect(FrameworkAnalyzer("json"))
+
+    assert sections(events) == {
+        "utilitarian": "line1\nline2",
+        "deontological": 'Duty "first".',
+        "virtue_ethics": "Honest.",
+        "care_ethics": "Kind."
+    }
+    analysis = events[-1]["analysis"]
+    assert analysis.utilitarian == "line1\nline2"
+    assert "json_mode" not in calls[0]
+
+
+async def test_unparseable_section_is_left_to_the_final_parse(streamed):
+    streamed(
+        '```json\n{"utilitarian": "Bad \\x escape", "deontological": "Duty.", ',
+        '"virtue_ethics": "Honest.", "care_ethics": "Kind."}\n```'
+    )
+    events = await collect(FrameworkAnalyzer("json"))
+
+    section_events = [e for e in events if e["type"] == "section"]
+    assert [e["framework"] for e in section_events] == ["deontological", "virtue_ethics", "care_ethics", "utilitarian"]
+    assert section_events[-1]["text"] == "Analysis unavailable"
+
+
+def test_final_parse_tolerates_prose_and_raw_newlines():
+    analyzer = FrameworkAnalyzer("json")
+    analysis = analyzer.build_analysis(
+        'Here is the analysis:\n{"utilitarian": "a\nb", "deontological": "c", "virtue_ethics": "d", "care_ethics": "e"}'
+    )
+    assert analyzer.is_complete(analysis)
+    assert analysis.utilitarian == "a\nb"
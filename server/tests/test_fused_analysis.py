@@ -0,0 +1,146 @@
+# Fused analysis and consequence call
+from services.consequence_delivery import consequence_delivery
+from services.consequence_generator import consequence_generator
+from services.framework_analyzer import framework_analyzer
+from services.fused_analysis import FusedAnalyzer, fused_analyzer
+from services.llm_resilience import LLMServerError
+from services.llm_service import llm_service
+from services.scenario_engine import scenario_engine
+from models.scenario import ConsequenceRule, UserDecisionHistory
+import json
+import pytest
+import uuid
+
+pytestmark = pytest.mark.anyio
+
+SECTIONS = {"utilitarian": "U", "deontological": "D", "virtue_ethics": "V", "care_ethics": "C"}
+RULE = ConsequenceRule(trigger_choice="A", trigger_step=1, appears_at_step=3, consequence_template="Fallout")
+
+
+@pytest.mark.parametrize("response, sections, consequences", [
+    (json.dumps({**SECTIONS, "consequences": ["One", "Two"]}), True, ["One", "Two"]),
+    ("```json\n" + json.dumps({**SECTIONS, "consequences": ["One", "Two"]}) + "\n```", True, ["One", "Two"]),
+    # Salvaged: too few consequences, or the analysis incomplete
+    (json.dumps({**SECTIONS, "consequences": ["One"]}), True, ["One", None]),
+    (json.dumps({"utilitarian": "U", "consequences": ["One", " "]}), False, ["One", None]),
+    ("not json", False, [None, None]),
+    ("[1, 2]", False, [None, None])
+])
+def test_parse_salvages_what_is_valid(response, sections, consequences):
+    parsed, texts = FusedAnalyzer(enabled=True)._parse(response, 2)
+
+    assert (parsed is not None) == sections
+    assert texts == consequences
+
+
+def history() -> UserDecisionHistory:
+    return UserDecisionHistory(
+        scenario_id="s",
+        session_id="s1",
+        choices_made=[
+            {"step": 1, "choice_id": "A", "choice_text": "Report it"},
+            {"step": 2, "choice_id": "B", "choice_text": "Wait"},
+            {"step": 3, "choice_id": "A", "choice_text": "Speak up"}
+        ]
+    )
+
+
+async def analyze(analyzer: FusedAnalyzer):
+    return await analyzer.analyze(
+        context="Step 3 context",
+        scenario_context="Scenario",
+        choice="Speak up",
+        history=history(),
+        position=2,
+        pinned=[],
+        triggered=[RULE]
+    )
+
+
+async def test_fused_results_are_cached_apart_from_two_call_results(monkeypatch):
+    calls = []
+
+    async def generate_completion(**kwargs):
+        calls.append(kwargs)
+        return json.dumps({**SECTIONS, "consequences": ["Fallout text"]})
+
+    monkeypatch.setattr(llm_service, "generate_completion", generate_completion)
+    analyzer = FusedAnalyzer(enabled=True)
+    two_call_entries = (framework_analyzer.cache.stats()["entries"], consequence_generator.cache.stats()["entries"])
+
+    analysis, texts = await analyze(analyzer)
+    again, texts_again = await analyze(analyzer)
+
+    assert analysis.utilitarian == again.utilitarian == "U"
+    assert texts == texts_again == ["Fallout text"]
+    assert len(calls) == 1
+    assert (framework_analyzer.cache.stats()["entries"], consequence_generator.cache.stats()["entries"]) == two_call_entries
+
+
+async def test_incomplete_response_is_not_cached(monkeypatch):
+    async def generate_completion(**kwargs):
+        return json.dumps({**SECTIONS, "consequences": []})
+
+    monkeypatch.setattr(llm_service, "generate_completion", generate_completion)
+    analyzer = FusedAnalyzer(enabled=True)
+
+    analysis, texts = await analyze(analyzer)
+
+    assert analysis is not None and texts == [None]
+    assert analyzer.cache.stats()["entries"] == 0
+    assert analyzer.stats()["missing_consequences"] == 1
+
+
+@pytest.fixture
+def fused(monkeypatch):
+    monkeypatch.setattr(fused_analyzer, "enabled", True)
+    monkeypatch.setattr(consequence_delivery, "pregenerate_enabled", False)
+
+
+async def play_to_consequence_step(client) -> tuple[str, dict]:
+    """Submit steps 1-2 of leaked_report_001 (choosing A at step 1); returns the session and the step-3 body"""
+    scenario = scenario_engine.get_scenario("leaked_report_001")
+    session_id = str(uuid.uuid4())
+
+    def body(step: int, choice_id: str) -> dict:
+        point = next(p for p in scenario.decision_points if p.step == step)
+        choice = next(c for c in point.choices if c.id == choice_id)
+        return {"scenario_id": scenario.id, "session_id": session_id, "step": step,
+                "choice_id": choice.id, "choice_text": choice.text}
+
+    for step in (1, 2):
+        choice_id = "A" if step == 1 else scenario.decision_points[step - 1].choices[0].id
+        assert (await client.post("/api/decisions/submit", json=body(step, choice_id))).status_code == 200
+    return session_id, body(3, scenario.decision_points[2].choices[0].id)
+
+
+async def test_llm_failure_of_fused_call_is_not_retried_as_separate_calls(client, stub_llm, fused, monkeypatch):
+    _, step3 = await play_to_consequence_step(client)
+
+    async def failing(**kwargs):
+        raise LLMServerError("Failed to generate completion: 503")
+
+    monkeypatch.setattr(fused_analyzer, "analyze", failing)
+    calls = stub_llm.requests
+    response = await client.post("/api/decisions/submit", json=step3)
+
+    assert response.status_code == 200
+    assert response.json()["degraded"] is True
+    assert response.json()["consequences"][0]["degraded"] is True
+    assert stub_llm.requests == calls
+
+
+async def test_incomplete_fused_answer_is_completed_by_separate_calls(client, stub_llm, fused, monkeypatch):
+    _, step3 = await play_to_consequence_step(client)
+
+    async def partial(**kwargs):
+        return None, ["Fused consequence"]
+
+    monkeypatch.setattr(fused_analyzer, "analyze", partial)
+    calls = stub_llm.requests
+    response = await client.post("/api/decisions/submit", json=step3)
+
+    assert response.status_code == 200
+    assert response.json()["degraded"] is False
+    assert response.json()["consequences"][0]["text"] == "Fused consequence"
+    assert stub_llm.requests == calls + 1
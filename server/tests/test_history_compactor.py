@@ -0,0 +1,71 @@
+# Token-budgeted decision history compaction
+from services.history_compactor import HistoryCompactor, estimate_tokens
+import pytest
+
+
+def choice(i: int, words: int = 20) -> str:
+    return f"Choice {i}: " + " ".join(f"word{i}_{w}" for w in range(words))
+
+
+def verbatim_positions(result) -> list:
+    return [position for position, _ in result.verbatim]
+
+
+def test_history_within_budget_is_untouched():
+    texts = [choice(i, words=3) for i in range(3)]
+    result = HistoryCompactor(token_budget=1000).compact(texts)
+
+    assert result.summary is None
+    assert result.verbatim == list(enumerate(texts))
+    assert result.tokens_before == result.tokens_after == sum(map(estimate_tokens, texts))
+
+
+def test_oldest_choices_are_folded_first():
+    texts = [choice(i) for i in range(8)]
+    budget = sum(map(estimate_tokens, texts)) // 2
+    result = HistoryCompactor(token_budget=budget, keep_recent=2, summary_words=3).compact(texts)
+
+    folded = [p for p in range(8) if p not in verbatim_positions(result)]
+    assert folded == list(range(len(folded)))
+    assert result.summary.startswith("Choice 0: word0_0...")
+    assert result.tokens_after <= budget < result.tokens_before
+
+
+def test_recent_and_pinned_choices_stay_verbatim():
+    texts = [choice(i) for i in range(8)]
+    result = HistoryCompactor(token_budget=50, keep_recent=2, summary_words=3).compact(texts, pinned=[1])
+
+    assert {1, 6, 7} <= set(verbatim_positions(result))
+    assert dict(result.verbatim)[1] == texts[1]
+
+
+@pytest.mark.parametrize("budget", [60, 80, 120])
+def test_summary_is_cut_to_fit_the_budget(budget):
+    # Recent choices alone take about 60 tokens; the rest only fits as a summary
+    texts = [choice(i, words=8) for i in range(40)]
+    result = HistoryCompactor(token_budget=budget, keep_recent=2, summary_words=3).compact(texts)
+
+    assert verbatim_positions(result) == [38, 39]
+    assert result.tokens_after <= max(budget, sum(estimate_tokens(t) for t in texts[-2:]))
+    if budget == 60:
+        assert "earlier decisions omitted" in result.summary
+
+
+def test_stats_count_only_recorded_prompts():
+    compactor = HistoryCompactor(token_budget=50, keep_recent=1, summary_words=3)
+    texts = [choice(i) for i in range(5)]
+    compactor.compact(texts)
+    assert compactor.stats()["prompts"] == 0
+
+    result = compactor.compact(texts, record=True)
+    compactor.compact(texts[:1], record=True)
+
+    stats = compactor.stats()
+    assert (stats["prompts"], stats["prompts_compacted"]) == (2, 1)
+    assert stats["history_tokens_after"] == result.tokens_after + estimate_tokens(texts[0])
+    assert 0 < stats["saved_ratio"] < 1
+
+
+def test_compaction_is_deterministic():
+    texts = [choice(i) for i in range(8)]
+    assert HistoryCompactor(token_budget=60).compact(texts) == HistoryCompactor(token_budget=60).compact(texts)
@@ -0,0 +1,79 @@
+# Incremental JSON parsing of streamed LLM output
+from utils.incremental_json import IncrementalJSONParser
+import json
+import pytest
+
+DOCUMENT = {
+    "title": "A \"quoted\" title, with {braces}",
+    "estimated_time": 8,
+    "decision_points": [
+        {"step": 1, "choices": [{"id": "A", "text": "Go [left]"}]},
+        {"step": 2, "choices": []}
+    ],
+    "consequence_rules": []
+}
+
+
+def feed_all(parser: IncrementalJSONParser, text: str, chunk_size: int) -> list:
+    events = []
+    for i in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[i:i + chunk_size]))
+    return events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 10000])
+def test_values_complete_in_document_order_whatever_the_chunking(chunk_size):
+    parser = IncrementalJSONParser()
+    events = feed_all(parser, "```json\n" + json.dumps(DOCUMENT, indent=2) + "\n```", chunk_size)
+
+    assert [path for path, _ in events] == [
+        ("title",),
+        ("estimated_time",),
+        ("decision_points", 0),
+        ("decision_points", 1),
+        ("decision_points",),
+        ("consequence_rules",),
+        ()
+    ]
+    assert dict(events)[()] == DOCUMENT
+    assert dict(events)[("decision_points", 0)] == DOCUMENT["decision_points"][0]
+    assert parser.done and not parser.errors
+
+
+def test_value_is_emitted_as_soon_as_it_closes():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"decision_points": [{"step": 1}') == []
+    assert parser.feed(', ') == [(("decision_points", 0), {"step": 1})]
+    assert parser.open_paths == [(), ("decision_points",)]
+
+
+def test_cut_off_document_keeps_completed_values():
+    parser = IncrementalJSONParser()
+    events = parser.feed('{"title": "T", "decision_points": [{"step": 1}, {"step": 2, "context": "Half')
+
+    assert events == [(("title",), "T"), (("decision_points", 0), {"step": 1})]
+    assert not parser.done
+    assert parser.open_paths == [(), ("decision_points",), ("decision_points", 1)]
+
+
+def test_raw_newlines_in_strings_are_accepted():
+    parser = IncrementalJSONParser()
+    events = parser.feed('{"title": "line1\nline2"}')
+
+    assert events[0] == (("title",), "line1\nline2")
+    assert not parser.errors
+
+
+def test_malformed_value_is_skipped_and_reported():
+    parser = IncrementalJSONParser()
+    events = parser.feed('{"decision_points": [{"step": 1,}, {"step": 2}]}')
+
+    assert (("decision_points", 1), {"step": 2}) in events
+    assert all(path != ("decision_points", 0) for path, _ in events)
+    assert parser.errors and parser.errors[0].startswith("decision_points/0")
+
+
+def test_text_after_the_document_is_ignored():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": 1}')
+    assert parser.feed(' trailing {"b": 2}') == []
@@ -0,0 +1,187 @@
+# Record/replay of LLM provider traffic
+from groq import AsyncGroq
+from services.llm_cassette import LLMCassette, request_fingerprint, summary
+from services.llm_service import LLMService
+import httpx
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+URL = "https://api.groq.com/openai/v1/chat/completions"
+
+
+def completion(text: str) -> dict:
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15}
+    }
+
+
+class Upstream:
+    """Mock provider answering "answer N" to the Nth request"""
+
+    def __init__(self, status: int = 200):
+        self.status = status
+        self.requests = 0
+        self.transport = httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return httpx.Response(
+            self.status,
+            json=completion(f"answer {self.requests}"),
+            headers={"x-ratelimit-remaining-tokens": "5000", "x-request-id": "dropped"}
+        )
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "llm.cassette")
+
+
+async def post(cassette: LLMCassette, prompt: str = "hello") -> httpx.Response:
+    async with httpx.AsyncClient(transport=cassette) as client:
+        return await client.post(URL, json={"model": "test-model", "messages": [{"role": "user", "content": prompt}]})
+
+
+def text(response: httpx.Response) -> str:
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def test_fingerprint_ignores_key_order():
+    assert request_fingerprint({"a": 1, "b": [1, 2]}) == request_fingerprint({"b": [1, 2], "a": 1})
+    assert request_fingerprint({"a": 1, "b": [1, 2]}) != request_fingerprint({"a": 1, "b": [2, 1]})
+
+
+def test_modes_are_checked(path):
+    with pytest.raises(ValueError, match="Unknown cassette mode"):
+        LLMCassette(path, mode="rewind")
+    with pytest.raises(ValueError, match="needs an upstream"):
+        LLMCassette(path, mode="record")
+
+
+async def test_recording_replays_without_the_provider(path):
+    upstream = Upstream()
+    recorder = LLMCassette(path, mode="record", upstream=upstream.transport)
+    recorded = await post(recorder)
+    recorder.close()
+
+    player = LLMCassette(path, mode="replay")
+    replayed = await post(player)
+
+    assert text(replayed) == text(recorded) == "answer 1"
+    assert replayed.status_code == 200
+    # Only the headers the client reacts to are kept
+    assert replayed.headers["x-ratelimit-remaining-tokens"] == "5000"
+    assert "x-request-id" not in replayed.headers
+    assert upstream.requests == 1
+    assert (player.stats()["recordings"], player.replayed) == (1, 1)
+    player.close()
+
+
+async def test_repeated_requests_replay_in_order_and_wrap(path):
+    recorder = LLMCassette(path, mode="record", upstream=Upstream().transport)
+    for _ in range(2):
+        await post(recorder)
+    recorder.close()
+
+    player = LLMCassette(path, mode="replay")
+    assert [text(await post(player)) for _ in range(3)] == ["answer 1", "answer 2", "answer 1"]
+    player.close()
+
+
+async def test_unrecorded_request_fails_or_goes_to_the_fallback(path):
+    player = LLMCassette(path, mode="replay")
+    missing = await post(player, "never recorded")
+    assert missing.status_code == 400
+    assert player.misses == 1
+    player.close()
+
+    fallback = Upstream()
+    player = LLMCassette(path, mode="replay", fallback=fallback.transport)
+    assert text(await post(player, "never recorded")) == "answer 1"
+    assert fallback.requests == 1
+    player.close()
+
+
+async def test_auto_mode_records_only_what_is_missing(path):
+    upstream = Upstream()
+    cassette = LLMCassette(path, mode="auto", upstream=upstream.transport)
+
+    first = await post(cassette, "one")
+    again = await post(cassette, "one")
+    other = await post(cassette, "two")
+
+    assert text(first) == text(again) == "answer 1"
+    assert text(other) == "answer 2"
+    assert upstream.requests == 2
+    assert (cassette.recorded, cassette.replayed) == (2, 1)
+    cassette.close()
+
+
+async def test_streamed_body_keeps_its_chunks(path):
+    events = [
+        b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n\n',
+        b'data: {"choices":[{"delta":{"content":"lo"}}]}\n\n',
+        b'data: {"x_groq":{"usage":{"prompt_tokens":7,"completion_tokens":2}}}\n\n',
+        b"data: [DONE]\n\n"
+    ]
+
+    async def stream(request):
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, stream=httpx.ByteStream(b"".join(events))
+        )
+
+    recorder = LLMCassette(path, mode="record", upstream=httpx.MockTransport(stream))
+    async with httpx.AsyncClient(transport=recorder) as client:
+        async with client.stream("POST", URL, json={"stream": True}) as response:
+            recorded = b"".join([part async for part in response.aiter_raw()])
+    recorder.close()
+
+    player = LLMCassette(path, mode="replay")
+    async with httpx.AsyncClient(transport=player) as client:
+        async with client.stream("POST", URL, json={"stream": True}) as response:
+            replayed = b"".join([part async for part in response.aiter_raw()])
+    player.close()
+
+    assert replayed == recorded == b"".join(events)
+    assert summary(path)["prompt_tokens"] == 7
+    assert summary(path)["completion_tokens"] == 2
+
+
+async def test_abandoned_response_is_not_recorded(path):
+    async def stream(request):
+        return httpx.Response(200, stream=httpx.ByteStream(b"partial"))
+
+    recorder = LLMCassette(path, mode="record", upstream=httpx.MockTransport(stream))
+    async with httpx.AsyncClient(transport=recorder) as client:
+        async with client.stream("POST", URL, json={}):
+            pass  # closed without reading the body
+    assert recorder.stats()["recordings"] == 0
+    recorder.close()
+
+
+def groq_client(cassette: LLMCassette) -> AsyncGroq:
+    return AsyncGroq(api_key="test", http_client=httpx.AsyncClient(transport=cassette), max_retries=0)
+
+
+async def test_llm_service_runs_on_a_replayed_cassette(path):
+    recorder = LLMCassette(path, mode="record", upstream=Upstream().transport)
+    recording = LLMService()
+    recording.set_client(groq_client(recorder), recorder)
+    recorded = await recording.generate_completion("Analyze this", priority="analysis")
+    recorder.close()
+
+    player = LLMCassette(path, mode="replay")
+    replaying = LLMService()
+    replaying.set_client(groq_client(player), player)
+
+    assert await replaying.generate_completion("Analyze this", priority="analysis") == recorded == "answer 1"
+    assert replaying.stats()["cassette"]["replayed"] == 1
+    report = summary(path)
+    assert (report["recordings"], report["prompt_tokens"], report["statuses"]) == (1, 12, {200: 1})
+    player.close()
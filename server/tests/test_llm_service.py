@@ -0,0 +1,455 @@
+# LLM resilience: error classification, rate limiting, circuit breaking and admission
+from services import llm_resilience
+from services.llm_resilience import (
+    LLMError,
+    LLMOverloadedError,
+    LLMRateLimitError,
+    LLMServerError,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    AdmissionController,
+    CircuitBreaker,
+    RateLimiter,
+    TokenBucket,
+    classify_error,
+    parse_duration
+)
+from services.llm_service import LLMService, background_priority
+import asyncio
+import groq
+import httpx
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    """Stands in for time.monotonic and asyncio.sleep; waits pass instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+        self._yield = asyncio.sleep
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            # The event loop's own yields, not a wait
+            return await self._yield(0)
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_resilience.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(llm_resilience.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def status_error(status: int, headers: dict = None) -> groq.APIStatusError:
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    error_class = {429: groq.RateLimitError, 500: groq.InternalServerError}.get(status, groq.APIStatusError)
+    return error_class(f"HTTP {status}", response=response, body=None)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1m26.4s", 86.4),
+    ("600ms", 0.6),
+    ("2m59.56s", 179.56),
+    ("1h", 3600.0),
+    ("7", 7.0),
+    ("0.5", 0.5)
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", ["", None, "soon"])
+def test_parse_duration_unparseable(value):
+    assert parse_duration(value) is None
+
+
+def test_classify_rate_limit_carries_retry_after():
+    error = classify_error(status_error(429, {"retry-after": "1m26.4s"}), "Analysis")
+    assert isinstance(error, LLMRateLimitError)
+    assert error.retryable
+    assert error.retry_after == pytest.approx(86.4)
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 408])
+def test_classify_server_errors_are_retryable(status):
+    error = classify_error(status_error(status), "Analysis")
+    assert isinstance(error, LLMServerError)
+    assert error.retryable
+
+
+@pytest.mark.parametrize("status", [400, 401, 404])
+def test_classify_client_errors_are_final(status):
+    error = classify_error(status_error(status), "Analysis")
+    assert type(error) is LLMError
+    assert not error.retryable
+
+
+@pytest.mark.parametrize("cause", [
+    asyncio.TimeoutError(),
+    groq.APITimeoutError(request=httpx.Request("POST", "https://api.groq.com"))
+])
+def test_classify_timeouts(cause):
+    error = classify_error(cause, "Analysis")
+    assert isinstance(error, LLMTimeoutError)
+    assert error.retryable
+    assert str(error) == "Analysis: timed out"
+
+
+def test_classify_connection_failure_and_passthrough():
+    connection = groq.APIConnectionError(request=httpx.Request("POST", "https://api.groq.com"))
+    assert isinstance(classify_error(connection, "x"), LLMServerError)
+
+    already = LLMUnavailableError("open")
+    assert classify_error(already, "x") is already
+    assert type(classify_error(ValueError("bad"), "x")) is LLMError
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.times_opened == 1
+
+    with pytest.raises(LLMUnavailableError) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == pytest.approx(30)
+    assert breaker.rejected == 1
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_probe_closes_on_success(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_half_open_probe_reopens_on_failure(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 31
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_breaker_released_probe_lets_the_next_one_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+async def test_token_bucket_waits_for_refill(clock):
+    bucket = TokenBucket(per_minute=60)
+    for _ in range(60):
+        await bucket.acquire()
+    assert clock.slept == []
+
+    await bucket.acquire()
+    assert clock.slept == [pytest.approx(1.0)]
+    assert bucket.waited_seconds == pytest.approx(1.0)
+
+
+async def test_token_bucket_oversized_request_waits_for_full_bucket(clock):
+    bucket = TokenBucket(per_minute=60)
+    await bucket.acquire(30)
+    await bucket.acquire(100)
+    assert sum(clock.slept) == pytest.approx(30.0)
+    assert bucket.level == pytest.approx(-40.0)
+
+
+async def test_token_bucket_refund_clamp_and_block(clock):
+    bucket = TokenBucket(per_minute=100)
+    await bucket.acquire(80)
+    bucket.refund(50)
+    assert bucket.level == pytest.approx(70)
+
+    bucket.clamp(10)
+    assert bucket.level == pytest.approx(10)
+
+    bucket.block(5)
+    await bucket.acquire(1)
+    assert clock.slept == [pytest.approx(5.0)]
+
+
+async def test_unlimited_bucket_still_honors_block(clock):
+    bucket = TokenBucket(per_minute=0)
+    for _ in range(1000):
+        await bucket.acquire()
+    assert clock.slept == []
+
+    bucket.block(2)
+    await bucket.acquire()
+    assert clock.slept == [pytest.approx(2.0)]
+
+
+async def test_rate_limiter_reconciles_usage(clock):
+    limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=1000)
+    await limiter.acquire(estimated_tokens=400)
+    limiter.reconcile(400, used_tokens=150)
+    assert limiter.requests.level == pytest.approx(9)
+    assert limiter.tokens.level == pytest.approx(850)
+
+    # Using more than estimated is not charged twice
+    limiter.reconcile(100, used_tokens=300)
+    assert limiter.tokens.level == pytest.approx(850)
+
+
+def test_rate_limiter_follows_provider_headers(clock):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=1000)
+    limiter.observe({
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-tokens": "0",
+        "x-ratelimit-reset-tokens": "1m26.4s",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "600ms"
+    })
+    assert limiter.tokens.capacity == 6000
+    assert limiter.tokens.level == 0
+    assert limiter.tokens.blocked_until == pytest.approx(clock.now + 86.4)
+    assert limiter.requests.blocked_until == pytest.approx(clock.now + 0.6)
+
+
+def test_rate_limiter_429_blocks_every_caller(clock):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    limiter.on_rate_limited(retry_after=None)
+    assert limiter.requests.blocked_until == pytest.approx(clock.now + 1.0)
+
+    limiter.on_rate_limited(retry_after=12)
+    assert limiter.requests.blocked_until == pytest.approx(clock.now + 12)
+    assert limiter.rate_limited == 2
+
+
+def test_failures_feed_limiter_and_breaker_by_kind(clock):
+    service = LLMService()
+    service.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+
+    error = service._on_failure(status_error(429, {"retry-after": "3"}), "Analysis")
+    assert isinstance(error, LLMRateLimitError)
+    assert service.limiter.requests.blocked_until == pytest.approx(clock.now + 3)
+    assert service.breaker.failures == 0
+
+    service._on_failure(status_error(400), "Analysis")
+    assert service.breaker.failures == 0
+
+    service._on_failure(status_error(503), "Analysis")
+    service._on_failure(asyncio.TimeoutError(), "Analysis")
+    assert service.breaker.state == "open"
+    assert service.stats()["errors"] == {
+        "LLMRateLimitError": 1,
+        "LLMError": 1,
+        "LLMServerError": 1,
+        "LLMTimeoutError": 1
+    }
+
+
+async def test_provider_limit_starts_from_reported_remaining_tokens(clock):
+    # Static token limit off (the default): the first response sets it
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    limiter.observe({"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "5100"})
+
+    assert limiter.tokens.capacity == 6000
+    assert limiter.tokens.level == pytest.approx(5100)
+    await limiter.acquire(estimated_tokens=900)
+    assert clock.slept == []
+
+
+def test_changed_provider_limit_replaces_the_configured_one(clock):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=1000)
+    limiter.observe({"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "5900"})
+    assert limiter.tokens.level == pytest.approx(5900)
+
+    # Same limit again: usage elsewhere only lowers the level
+    limiter.tokens.level = 3000
+    limiter.observe({"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "4000"})
+    assert limiter.tokens.level == pytest.approx(3000)
+
+
+@pytest.fixture
+def service(stub_llm):
+    """An LLMService answered by the stub, with one slot per class"""
+    from benchmarks.stub_llm import install
+    service = LLMService()
+    service.admission = AdmissionController(2, {"analysis": (8, 5, 2), "background": (8, 5, 1)})
+    install(service, stub_llm)
+    return service
+
+
+async def background_call(service: LLMService, prompt: str) -> str:
+    background_priority.set(True)
+    return await service.generate_completion(prompt, priority="analysis")
+
+
+async def test_identical_overlapping_calls_share_one_upstream_request(service, stub_llm):
+    stub_llm.latency = 0.05
+    results = await asyncio.gather(*(service.generate_completion("same", priority="analysis") for _ in range(3)))
+
+    assert len(set(results)) == 1
+    assert stub_llm.requests == 1
+    assert (service.upstream_calls, service.coalesced_calls) == (1, 2)
+
+
+async def test_cancelled_waiter_does_not_cancel_shared_request(service, stub_llm):
+    stub_llm.latency = 0.05
+    first = asyncio.create_task(service.generate_completion("same", priority="analysis"))
+    second = asyncio.create_task(service.generate_completion("same", priority="analysis"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second
+    assert stub_llm.requests == 1
+
+
+async def test_live_caller_lifts_queued_background_call(service, stub_llm):
+    # The only background slot is taken, so a speculative call queues
+    held = await service.admission.acquire("background")
+    speculative = asyncio.create_task(background_call(service, "prefetch"))
+    await asyncio.sleep(0.01)
+    assert service.admission.stats()["classes"]["background"]["queued_now"] == 1
+
+    # A live call for the same request runs now, at its own priority
+    live = await asyncio.wait_for(service.generate_completion("prefetch", priority="analysis"), timeout=1)
+
+    assert await speculative == live
+    assert stub_llm.requests == 1
+    assert service.priority_raised == 1
+    stats = service.admission.stats()["classes"]
+    assert stats["background"]["queued_now"] == 0
+    assert stats["analysis"]["admitted"] == 1
+    service.admission.release("background", held)
+    assert service.admission.active == 0
+
+
+async def test_background_caller_does_not_lower_a_live_call(service, stub_llm):
+    stub_llm.latency = 0.05
+    live = asyncio.create_task(service.generate_completion("same", priority="analysis"))
+    await asyncio.sleep(0)
+    await asyncio.gather(live, background_call(service, "same"))
+
+    assert service.priority_raised == 0
+    assert service.admission.stats()["classes"]["analysis"]["admitted"] == 1
+
+
+@pytest.fixture
+def admission():
+    """One slot; background may use it but only queues two deep"""
+    return AdmissionController(1, {"analysis": (4, 5, 1), "background": (2, 5, 1)})
+
+
+async def test_freed_slot_goes_to_the_highest_waiting_class(admission):
+    held = await admission.acquire("background")
+    order = []
+
+    async def call(name: str):
+        admission.release(name, await admission.acquire(name))
+        order.append(name)
+
+    # The background call queued first, but the live one is admitted first
+    waiters = [asyncio.create_task(call("background")), asyncio.create_task(call("analysis"))]
+    await asyncio.sleep(0)
+    admission.release("background", held)
+    await asyncio.gather(*waiters)
+
+    assert order == ["analysis", "background"]
+    assert admission.active == 0
+
+
+async def test_class_cap_leaves_slots_for_higher_classes():
+    admission = AdmissionController(2, {"analysis": (4, 5, 2), "background": (4, 5, 1)})
+    held = await admission.acquire("background")
+
+    # Background is at its cap while a slot is free: it queues, live calls do not
+    queued = asyncio.create_task(admission.acquire("background"))
+    await asyncio.sleep(0)
+    assert not queued.done()
+    live = await asyncio.wait_for(admission.acquire("analysis"), timeout=1)
+
+    admission.release("background", held)
+    admission.release("background", await queued)
+    admission.release("analysis", live)
+    assert admission.active == 0
+
+
+async def test_full_queue_sheds_immediately(admission):
+    held = await admission.acquire("analysis")
+    queued = [asyncio.create_task(admission.acquire("background")) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(LLMOverloadedError) as error:
+        await admission.acquire("background")
+    assert error.value.retry_after >= 1
+    assert admission.stats()["classes"]["background"]["shed"] == 1
+
+    for task in queued:
+        task.cancel()
+    await asyncio.gather(*queued, return_exceptions=True)
+    admission.release("analysis", held)
+    assert admission.stats()["classes"]["background"]["queued_now"] == 0
+
+
+async def test_queue_deadline_sheds_the_waiting_call():
+    admission = AdmissionController(1, {"analysis": (4, 0.01, 1)})
+    held = await admission.acquire("analysis")
+
+    with pytest.raises(LLMOverloadedError) as error:
+        await admission.acquire("analysis")
+    assert error.value.retry_after >= 1
+    stats = admission.stats()["classes"]["analysis"]
+    assert (stats["expired"], stats["queued_now"]) == (1, 0)
+
+    # The expired waiter does not take the next free slot
+    admission.release("analysis", held)
+    assert admission.active == 0
+
+
+async def test_shed_request_gets_503_with_retry_after(client, monkeypatch):
+    from services.llm_service import llm_service
+    monkeypatch.setattr(llm_service, "admission", AdmissionController(1, {"generation": (0, 5, 1)}))
+    held = await llm_service.admission.acquire("generation")
+
+    response = await client.post("/api/generate/generate", json={"topic": "whistleblowing", "category": "business"})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    llm_service.admission.release("generation", held)
@@ -0,0 +1,108 @@
+# Metrics rendering, Server-Timing and /metrics
+from services.metrics import Histogram, MetricsRegistry, RequestTiming, current_timing, phase_seconds, timed
+import config
+import pytest
+import re
+import uuid
+
+pytestmark = pytest.mark.anyio
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of the sample with exactly these labels (in any order)"""
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}(?:\{{(.*)\}})? (\S+)", line)
+        if match:
+            found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(1) or ""))
+            if found == {k: str(v) for k, v in labels.items()}:
+                return float(match.group(2))
+    raise AssertionError(f"no sample {name} {labels}")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", ("route", ), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/a")
+
+    text = "\n".join(histogram.samples())
+    assert sample(text, "latency_seconds_bucket", route="/a", le="0.1") == 2
+    assert sample(text, "latency_seconds_bucket", route="/a", le="1") == 3
+    assert sample(text, "latency_seconds_bucket", route="/a", le="+Inf") == 4
+    assert sample(text, "latency_seconds_count", route="/a") == 4
+    assert sample(text, "latency_seconds_sum", route="/a") == pytest.approx(3.65)
+
+
+def test_registry_renders_every_metric_and_skips_failing_ones():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests", ("path", ))
+    counter.inc('say "hi"\n')
+    registry.gauge("broken", "Fails to collect", lambda: 1 / 0)
+    registry.gauge("by_class", "Per class", lambda: {("a", ): 1, ("b", ): 2.5}, ("class", ))
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{path="say \\"hi\\"\\n"} 1' in text
+    assert "broken" not in text
+    assert sample(text, "by_class", **{"class": "b"}) == 2.5
+
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Again")
+
+
+def test_phases_outside_a_request_count_as_background():
+    def count() -> int:
+        return sum(phase_seconds._series.get(("background", "test_phase"), [0])[:-1])
+
+    before = count()
+    with timed("test_phase"):
+        pass
+    assert count() == before + 1
+
+
+def test_concurrent_phases_are_each_timed_in_full():
+    timing = RequestTiming()
+    token = current_timing.set(timing)
+    try:
+        with timed("analysis"):
+            with timed("consequences"):
+                pass
+    finally:
+        current_timing.reset(token)
+
+    assert timing.phases.keys() == {"analysis", "consequences"}
+    assert timing.phases["analysis"] >= timing.phases["consequences"]
+    entries = timing.server_timing().split(", ")
+    assert [e.split(";")[0] for e in entries] == list(timing.phases) + ["total"]
+    assert all(re.fullmatch(r"\w+;dur=\d+\.\d", e) for e in entries)
+
+
+async def test_submit_reports_server_timing_and_latency(client, stub_llm):
+    body = {
+        "scenario_id": "leaked_report_001", "session_id": str(uuid.uuid4()),
+        "step": 1, "choice_id": "A", "choice_text": "Report it"
+    }
+    response = await client.post("/api/decisions/submit", json=body)
+
+    assert response.status_code == 200
+    phases = dict(entry.split(";dur=") for entry in response.headers["server-timing"].split(", "))
+    assert {"cache", "total"} <= phases.keys()
+    assert all(float(ms) >= 0 for ms in phases.values())
+
+    text = (await client.get("/metrics")).text
+    labels = {"method": "POST", "route": "/api/decisions/submit", "status": 200}
+    assert sample(text, "dilemma_http_request_duration_seconds_count", **labels) >= 1
+    assert sample(text, "dilemma_phase_duration_seconds_count", route="/api/decisions/submit", phase="cache") >= 1
+
+
+async def test_unknown_paths_share_one_route_label(client):
+    path = f"/no/such/{uuid.uuid4()}"
+    await client.get(path)
+
+    text = (await client.get("/metrics")).text
+    assert sample(text, "dilemma_http_request_duration_seconds_count", method="GET", route="unmatched", status=404) >= 1
+    assert path not in text
+
+
+async def test_metrics_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    assert (await client.get("/metrics")).status_code == 404
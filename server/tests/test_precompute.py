@@ -0,0 +1,67 @@
+# Precomputed artifact store and builds
+from services.consequence_generator import consequence_generator
+from services.framework_analyzer import framework_analyzer
+from services.llm_service import llm_service, background_priority
+from services.precompute import Precomputer, PrecomputedStore
+import json
+import os
+import pytest
+
+
+def write_artifact(directory: str, scenario_id: str, analysis: str):
+    """Write an artifact the way another process would"""
+    with open(os.path.join(directory, f"{scenario_id}.json"), "w") as f:
+        json.dump({"scenario_id": scenario_id, "nodes": {"A": {"h": "hash", "a": analysis}}}, f)
+
+
+def test_artifact_written_after_a_miss_is_served(tmp_path):
+    store = PrecomputedStore(str(tmp_path))
+    assert not store.has("s1")
+
+    write_artifact(str(tmp_path), "s1", "first")
+    assert store.has("s1")
+    assert store.get_analysis("s1", ["A"], "hash") == "first"
+
+
+def test_rewritten_artifact_is_reloaded(tmp_path):
+    store = PrecomputedStore(str(tmp_path))
+    write_artifact(str(tmp_path), "s1", "first")
+    assert store.get_analysis("s1", ["A"], "hash") == "first"
+
+    write_artifact(str(tmp_path), "s1", "second")
+    path = os.path.join(str(tmp_path), "s1.json")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert store.get_analysis("s1", ["A"], "hash") == "second"
+
+
+def test_removed_artifact_is_no_longer_served(tmp_path):
+    store = PrecomputedStore(str(tmp_path))
+    store.save("s1", {"scenario_id": "s1", "nodes": {"A": {"h": "hash", "a": "saved"}}})
+    assert store.get_analysis("s1", ["A"], "hash") == "saved"
+
+    os.remove(os.path.join(str(tmp_path), "s1.json"))
+    assert not store.has("s1")
+    assert store.get_analysis("s1", ["A"], "hash") is None
+
+
+@pytest.mark.anyio
+async def test_build_runs_at_background_priority(tmp_path, monkeypatch):
+    # Build jobs must queue behind live traffic, whoever awaits the build
+    priorities = []
+
+    async def generate_completion(prompt, **kwargs):
+        priorities.append(background_priority.get())
+        return json.dumps({"utilitarian": "U", "deontological": "D", "virtue_ethics": "V", "care_ethics": "C"})
+
+    monkeypatch.setattr(llm_service, "generate_completion", generate_completion)
+    framework_analyzer.cache.clear()
+    consequence_generator.cache.clear()
+
+    stats = await Precomputer(PrecomputedStore(str(tmp_path))).build(
+        "leaked_report_001", requests_per_minute=0, max_nodes=4
+    )
+
+    assert stats["generated"] == len(priorities) > 0
+    assert all(priorities)
+    assert not background_priority.get()
@@ -0,0 +1,138 @@
+# LLM response cache: keys, expiry, LRU and the SQLite tier
+from services import response_cache
+from services.response_cache import ResponseCache, make_cache_key, normalize_text
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeTime:
+    now = 1000.0
+
+    @classmethod
+    def time(cls) -> float:
+        return cls.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    FakeTime.now = 1000.0
+    monkeypatch.setattr(response_cache, "time", FakeTime)
+    return FakeTime
+
+
+@pytest.fixture
+def disk_path(tmp_path):
+    return str(tmp_path / "cache" / "responses.db")
+
+
+def test_key_depends_on_every_part_in_order():
+    key = make_cache_key("analysis", 1, "model", ["A", "B"])
+
+    assert key == make_cache_key("analysis", 1, "model", ["A", "B"])
+    assert key != make_cache_key("analysis", 2, "model", ["A", "B"])
+    assert key != make_cache_key("analysis", 1, "model", ["B", "A"])
+    assert make_cache_key({"a": 1, "b": 2}) == make_cache_key({"b": 2, "a": 1})
+
+
+def test_whitespace_is_normalized():
+    assert normalize_text("Tell\n the   truth\t") == "Tell the truth"
+    assert normalize_text(None) == ""
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache("test", ttl_seconds=60)
+    cache.set("key", "value")
+
+    clock.now += 59
+    assert cache.get("key") == "value"
+    assert cache.contains("key")
+
+    clock.now += 2
+    assert not cache.contains("key")
+    assert cache.get("key") is None
+    assert (cache.expirations, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache("test", max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
+    assert cache.evictions == 1
+
+
+async def test_disk_tier_survives_a_restart(disk_path):
+    cache = ResponseCache("test", disk_path=disk_path)
+    cache.set("key", "value")
+    cache.close()
+
+    reopened = ResponseCache("test", disk_path=disk_path)
+    assert reopened.contains("key")
+    assert await reopened.fetch("key") == "value"
+    assert reopened.disk_hits == 1
+
+    # Now served from memory
+    assert reopened.get("key") == "value"
+    assert (reopened.memory_hits, reopened.disk_hits) == (1, 1)
+    reopened.close()
+
+
+async def test_disk_misses_do_not_read_the_file(disk_path, monkeypatch):
+    cache = ResponseCache("test", disk_path=disk_path)
+
+    def read(key):
+        raise AssertionError("read the disk tier")
+
+    monkeypatch.setattr(cache, "_read", read)
+    assert await cache.fetch("missing") is None
+    assert not cache.contains("missing")
+    assert cache.misses == 1
+    cache.close()
+
+
+async def test_disk_writes_happen_off_the_caller(disk_path):
+    cache = ResponseCache("test", disk_path=disk_path, max_entries=1)
+    cache.set("a", "1")
+    cache.set("b", "2")  # evicts "a" from memory
+    cache.flush()
+
+    assert cache._read("a") == ("1", pytest.approx(cache._disk_index["a"]))
+    assert await cache.fetch("a") == "1"
+    assert cache.stats()["disk_writes_queued"] == 0
+    cache.close()
+
+
+async def test_clear_and_expiry_reach_the_disk(disk_path, clock):
+    cache = ResponseCache("test", disk_path=disk_path, ttl_seconds=60)
+    cache.set("old", "1")
+    clock.now += 30
+    cache.set("new", "2")
+    cache.clear()
+    assert await cache.fetch("new") is None
+
+    cache.set("new", "2")
+    clock.now += 40
+    cache.close()
+
+    reopened = ResponseCache("test", disk_path=disk_path, ttl_seconds=60)
+    assert not reopened.contains("old")
+    assert await reopened.fetch("new") == "2"
+    reopened.close()
+
+
+async def test_disk_tier_keeps_the_newest_entries(disk_path, clock):
+    cache = ResponseCache("test", disk_path=disk_path, max_entries=1, disk_max_entries=2)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.set(key, key)
+    cache.close()
+
+    reopened = ResponseCache("test", disk_path=disk_path, disk_max_entries=2)
+    assert [k for k in ("a", "b", "c") if reopened.contains(k)] == ["b", "c"]
+    assert reopened._read("a") is None
+    reopened.close()
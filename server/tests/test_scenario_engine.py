@@ -0,0 +1,120 @@
+# Scenario catalogue: compiled lookups, copy-on-write updates and removal
+from models.scenario import Scenario
+from services.scenario_engine import ScenarioEngine
+import pytest
+
+
+def scenario(scenario_id: str = "test_scenario", steps=(1, 2, 3), title: str = "Title") -> Scenario:
+    return Scenario(
+        id=scenario_id,
+        title=title,
+        description="Description",
+        category="business",
+        difficulty="beginner",
+        estimated_time=5,
+        decision_points=[
+            {
+                "step": step,
+                "context": f"Context {step}",
+                "prompt": f"Prompt {step}?",
+                "choices": [{"id": "A", "text": f"Act at {step}"}, {"id": "B", "text": f"Wait at {step}"}]
+            }
+            for step in steps
+        ],
+        consequence_rules=[
+            {"trigger_choice": "A", "trigger_step": steps[0], "appears_at_step": steps[-1],
+             "consequence_template": "Fallout"}
+        ]
+    )
+
+
+@pytest.fixture
+def engine():
+    engine = ScenarioEngine()
+    engine.upsert_scenario(scenario(steps=(1, 3, 5)))
+    return engine
+
+
+def test_lookups(engine):
+    assert engine.get_decision_point("test_scenario", 3).context == "Context 3"
+    assert engine.get_decision_point("test_scenario", 2) is None
+    assert engine.get_choice("test_scenario", 5, "B").text == "Wait at 5"
+    assert engine.get_choice("test_scenario", 5, "C") is None
+    assert [r.trigger_step for r in engine.get_rules_at_step("test_scenario", 5)] == [1]
+    assert engine.get_rules_at_step("test_scenario", 3) == ()
+
+
+def test_sparse_steps_are_followed_in_order(engine):
+    assert engine.get_next_step_number("test_scenario", 1) == 3
+    assert engine.get_next_step("test_scenario", 3).step == 5
+    assert engine.get_next_step("test_scenario", 5) is None
+    assert not engine.is_final_step("test_scenario", 3)
+    assert engine.is_final_step("test_scenario", 5)
+
+
+def test_unknown_scenario(engine):
+    assert engine.get_scenario("missing") is None
+    assert engine.get_decision_point("missing", 1) is None
+    assert engine.get_choice("missing", 1, "A") is None
+    assert engine.get_rules_at_step("missing", 1) == ()
+    assert engine.get_next_step("missing", 1) is None
+    assert engine.is_final_step("missing", 1)
+
+
+def test_upsert_swaps_in_a_new_catalogue(engine):
+    version = engine.version
+    before = engine.scenarios
+    listing = engine.list_compiled()
+
+    engine.upsert_scenario(scenario(title="Renamed", steps=(1, 3, 5)))
+
+    assert engine.version == version + 1
+    assert engine.get_scenario("test_scenario").title == "Renamed"
+    # Readers holding the old catalogue keep a consistent view
+    assert before["test_scenario"].title == "Title"
+    assert engine.scenarios is not before
+    assert engine.list_compiled() is not listing
+    assert [c.scenario.title for c in engine.list_compiled() if c.scenario.id == "test_scenario"] == ["Renamed"]
+
+
+def test_unchanged_upsert_keeps_the_version(engine):
+    version = engine.version
+    listing = engine.list_compiled()
+
+    engine.upsert_scenario(scenario(steps=(1, 3, 5)))
+
+    assert engine.version == version
+    assert engine.list_compiled() is listing
+
+
+def test_partially_generated_scenario_points_at_the_next_step(engine):
+    engine.upsert_scenario(scenario("partial", steps=(1, 2)), final_step=4)
+    assert engine.get_next_step_number("partial", 2) == 3
+    assert not engine.is_final_step("partial", 2)
+
+    # Publishing the rest bumps the version even though final_step is reached
+    version = engine.version
+    engine.upsert_scenario(scenario("partial", steps=(1, 2, 3, 4)))
+    assert engine.version == version + 1
+    assert engine.is_final_step("partial", 4)
+
+
+def test_remove_scenario(engine):
+    version = engine.version
+    engine.remove_scenario("test_scenario")
+
+    assert engine.get_scenario("test_scenario") is None
+    assert engine.get_compiled("test_scenario") is None
+    assert "test_scenario" not in [c.scenario.id for c in engine.list_compiled()]
+    assert engine.version == version + 1
+
+    # Removing it again changes nothing
+    engine.remove_scenario("test_scenario")
+    assert engine.version == version + 1
+
+
+def test_listing_is_ordered_by_id(engine):
+    engine.upsert_scenario(scenario("aaa_first"))
+    ids = [c.scenario.id for c in engine.list_compiled()]
+    assert ids == sorted(ids)
+    assert ids[0] == "aaa_first"
@@ -0,0 +1,154 @@
+# Scenario generation: tail repair of cut-off output and dropped steps
+from services.llm_service import llm_service
+from services.scenario_generator import ScenarioGenerator
+import json
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def decision_point(step: int) -> dict:
+    return {
+        "step": step,
+        "context": f"Context {step}",
+        "prompt": f"Prompt {step}?",
+        "choices": [{"id": "A", "text": "Act"}, {"id": "B", "text": "Wait"}]
+    }
+
+
+def rule(trigger_step: int) -> dict:
+    return {
+        "trigger_choice": "A",
+        "trigger_step": trigger_step,
+        "appears_at_step": trigger_step + 2,
+        "consequence_template": f"Fallout from step {trigger_step}"
+    }
+
+
+HEADER = {
+    "title": "Title",
+    "description": "Description",
+    "category": "business",
+    "difficulty": "intermediate",
+    "estimated_time": 8
+}
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """Script the LLM: each call returns the next response; prompts are recorded"""
+    prompts = []
+
+    def script(*responses):
+        remaining = list(responses)
+
+        async def generate_completion(prompt, **kwargs):
+            prompts.append(prompt)
+            return remaining.pop(0)
+
+        async def stream_completion(prompt, **kwargs):
+            response = await generate_completion(prompt, **kwargs)
+            for i in range(0, len(response), 16):
+                yield response[i:i + 16]
+
+        monkeypatch.setattr(llm_service, "generate_completion", generate_completion)
+        monkeypatch.setattr(llm_service, "stream_completion", stream_completion)
+        return prompts
+
+    return script
+
+
+def cut_off(document: dict, after: str) -> str:
+    """The document's JSON, truncated just after the first occurrence of ``after``"""
+    text = json.dumps(document)
+    return text[:text.index(after) + len(after)]
+
+
+async def test_complete_response_needs_no_repair(completions):
+    prompts = completions(json.dumps({
+        **HEADER,
+        "decision_points": [decision_point(1), decision_point(2), decision_point(3)],
+        "consequence_rules": [rule(1)]
+    }))
+    scenario = await ScenarioGenerator().generate_scenario("topic", "business", num_decision_points=3)
+
+    assert [p.step for p in scenario.decision_points] == [1, 2, 3]
+    assert len(scenario.consequence_rules) == 1
+    assert len(prompts) == 1
+
+
+async def test_cut_off_tail_is_requested_again(completions):
+    document = {**HEADER, "decision_points": [decision_point(1), decision_point(2), decision_point(3)]}
+    prompts = completions(
+        cut_off(document, '"Context 3"'),
+        json.dumps({"decision_points": [decision_point(3)], "consequence_rules": [rule(1)]})
+    )
+
+    events = [
+        event async for event in
+        ScenarioGenerator().stream_scenario("topic", "business", num_decision_points=3)
+    ]
+
+    assert [e["type"] for e in events] == [
+        "header", "decision_point", "decision_point", "repair", "decision_point", "scenario"
+    ]
+    assert events[3]["missing_steps"] == [3]
+    scenario = events[-1]["scenario"]
+    assert [p.step for p in scenario.decision_points] == [1, 2, 3]
+    assert [r.trigger_step for r in scenario.consequence_rules] == [1]
+    # The tail request carries the finished steps as context
+    assert "steps 3" in prompts[1] and "Context 2" in prompts[1]
+
+
+async def test_out_of_order_steps_are_published_in_order(completions):
+    completions(json.dumps({
+        **HEADER,
+        "decision_points": [decision_point(2), decision_point(1)],
+        "consequence_rules": []
+    }))
+    events = [
+        event async for event in
+        ScenarioGenerator().stream_scenario("topic", "business", num_decision_points=2)
+    ]
+
+    published = [e["decision_point"].step for e in events if e["type"] == "decision_point"]
+    assert published == [1, 2]
+
+
+async def test_scenario_still_short_after_repairs_fails(completions):
+    document = {**HEADER, "decision_points": [decision_point(1), decision_point(2), decision_point(3)]}
+    still_missing = json.dumps({"decision_points": [], "consequence_rules": []})
+    prompts = completions(cut_off(document, '"Context 3"'), still_missing, still_missing)
+    generator = ScenarioGenerator()
+
+    with pytest.raises(Exception, match="only 2 of 3 decision points"):
+        async for _ in generator.stream_scenario("topic", "business", num_decision_points=3):
+            pass
+    assert len(prompts) == ScenarioGenerator.MAX_TAIL_ATTEMPTS + 1
+    assert generator.stats()["tail_requests"] == ScenarioGenerator.MAX_TAIL_ATTEMPTS
+
+
+async def test_non_streaming_generation_makes_one_call(completions):
+    document = {**HEADER, "decision_points": [decision_point(1), decision_point(2), decision_point(3)]}
+    prompts = completions(cut_off(document, '"Context 3"'))
+    generator = ScenarioGenerator()
+
+    with pytest.raises(Exception, match="only 2 of 3 decision points"):
+        await generator.generate_scenario("topic", "business", num_decision_points=3)
+    assert len(prompts) == 1
+    assert generator.stats()["tail_requests"] == 0
+
+
+async def test_dropped_steps_are_counted(completions):
+    invalid = {"step": 2, "context": "Context 2"}  # no prompt or choices
+    completions(json.dumps({
+        **HEADER,
+        "decision_points": [decision_point(1), invalid, decision_point(2), decision_point(1), decision_point(7)],
+        "consequence_rules": []
+    }))
+    generator = ScenarioGenerator()
+
+    scenario = await generator.generate_scenario("topic", "business", num_decision_points=2)
+
+    assert [p.step for p in scenario.decision_points] == [1, 2]
+    assert generator.stats()["dropped_steps"] == 3
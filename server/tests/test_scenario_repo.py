@@ -0,0 +1,120 @@
+# File-backed scenario library: records, atomic writes, locking and seeding
+from database.repositories import scenario_repo as scenario_repo_module
+from database.repositories.scenario_repo import ScenarioRepository
+from models.scenario import Scenario
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import json
+import os
+import pytest
+import threading
+
+
+def scenario(scenario_id: str, title: str = "Title") -> Scenario:
+    return Scenario(
+        id=scenario_id,
+        title=title,
+        description="Description",
+        category="business",
+        difficulty="beginner",
+        estimated_time=5,
+        decision_points=[{
+            "step": 1,
+            "context": "Context",
+            "prompt": "Prompt?",
+            "choices": [{"id": "A", "text": "Act"}, {"id": "B", "text": "Wait"}]
+        }],
+        consequence_rules=[]
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return ScenarioRepository(str(tmp_path / "library"))
+
+
+def test_records_round_trip_in_id_order(repo):
+    assert repo.save(scenario("b"))
+    assert repo.save(scenario("a"))
+
+    assert [r["id"] for r in repo.load_all()] == ["a", "b"]
+    assert repo.get("a")["title"] == "Title"
+    assert repo.get("missing") is None
+
+
+def test_create_does_not_overwrite(repo):
+    assert repo.save(scenario("a"), overwrite=False)
+    assert not repo.save(scenario("a", title="Other"), overwrite=False)
+    assert repo.get("a")["title"] == "Title"
+
+    assert repo.save(scenario("a", title="Other"))
+    assert repo.get("a")["title"] == "Other"
+
+
+def test_delete(repo):
+    repo.save(scenario("a"))
+    assert repo.delete("a")
+    assert not repo.delete("a")
+    assert not repo.exists("a")
+
+
+@pytest.mark.parametrize("scenario_id", ["../escape", "a/b", "", "x" * 129])
+def test_ids_must_be_safe_file_names(repo, scenario_id):
+    with pytest.raises(ValueError):
+        repo.get(scenario_id)
+    with pytest.raises(ValueError):
+        repo.delete(scenario_id)
+
+
+def test_failed_write_leaves_the_record_intact(repo, monkeypatch):
+    repo.save(scenario("a"))
+
+    def dump(data, f, **kwargs):
+        f.write('{"id": "a", "ti')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(scenario_repo_module.json, "dump", dump)
+    with pytest.raises(OSError):
+        repo.save(scenario("a", title="Other"))
+    monkeypatch.undo()
+
+    assert repo.get("a")["title"] == "Title"
+    assert sorted(os.listdir(repo.directory)) == [".lock", ".seeded", "a.json"]
+
+
+def test_concurrent_creates_of_one_id_keep_one(repo):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        created = list(pool.map(lambda i: repo.save(scenario("a", title=f"T{i}"), overwrite=False), range(8)))
+
+    assert created.count(True) == 1
+    assert repo.get("a")["title"] == f"T{created.index(True)}"
+
+
+def test_writes_wait_for_another_processes_lock(repo):
+    repo.save(scenario("a"))
+
+    # A separate open file description conflicts like another process would
+    with open(os.path.join(repo.directory, ".lock"), "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        writer = threading.Thread(target=repo.save, args=(scenario("a", title="Other"),))
+        writer.start()
+        writer.join(timeout=0.2)
+        assert writer.is_alive()
+        assert repo.get("a")["title"] == "Title"
+        fcntl.flock(handle, fcntl.LOCK_UN)
+
+    writer.join(timeout=5)
+    assert repo.get("a")["title"] == "Other"
+
+
+def test_library_is_seeded_once(tmp_path):
+    seed_path = tmp_path / "scenarios.json"
+    seed_path.write_text(json.dumps({"scenarios": [scenario("a").model_dump(), scenario("b").model_dump()]}))
+    repo = ScenarioRepository(str(tmp_path / "library"), str(seed_path))
+
+    assert [r["id"] for r in repo.load_all()] == ["a", "b"]
+
+    # A deleted seed scenario stays deleted after a restart
+    repo.delete("a")
+    restarted = ScenarioRepository(str(tmp_path / "library"), str(seed_path))
+    assert [r["id"] for r in restarted.load_all()] == ["b"]
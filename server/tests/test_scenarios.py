@@ -0,0 +1,36 @@
+# Scenario listing API
+from models.scenario import Scenario, ScenarioSummary
+from pydantic import TypeAdapter
+from typing import List
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("view, model", [("full", Scenario), ("summary", ScenarioSummary)])
+async def test_listing_matches_its_declared_model(client, view, model):
+    response = await client.get("/api/scenarios/", params={"view": view})
+
+    assert response.status_code == 200
+    scenarios = TypeAdapter(List[model]).validate_json(response.content)
+    assert scenarios
+
+
+async def test_listing_pages_by_cursor_header(client):
+    first = await client.get("/api/scenarios/", params={"view": "summary", "limit": 1})
+    second = await client.get(
+        "/api/scenarios/", params={"view": "summary", "limit": 1, "cursor": first.headers["X-Next-Cursor"]}
+    )
+
+    assert len(first.json()) == len(second.json()) == 1
+    assert first.json()[0]["id"] < second.json()[0]["id"]
+
+
+async def test_listing_schema_documents_both_views(client):
+    schema = (await client.get("/openapi.json")).json()
+    listing = schema["paths"]["/api/scenarios/"]["get"]["responses"]
+
+    variants = listing["200"]["content"]["application/json"]["schema"]["anyOf"]
+    refs = {variant["items"]["$ref"].rsplit("/", 1)[-1].split("-")[0] for variant in variants}
+    assert refs == {"Scenario", "ScenarioSummary"}
+    assert "304" in listing
@@ -0,0 +1,38 @@
+# Submission replay log: expiry and eviction
+from services.submission_log import SubmissionLog
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def submit(log: SubmissionLog, session_id: str, finish: bool = True):
+    entry = log.start(session_id, None, ("scenario", 1, "A"))
+    if finish:
+        log.complete(entry, f"response for {session_id}")
+    return entry
+
+
+async def test_expired_responses_are_purged_but_in_flight_ones_kept():
+    log = SubmissionLog(max_entries=10, ttl_seconds=60)
+    running = submit(log, "running", finish=False)
+    old = submit(log, "old")
+    submit(log, "fresh")
+    old.finished_at -= 120
+
+    assert log.find("old", None, ("scenario", 1, "A")) is None
+    assert log.find("running", None, ("scenario", 1, "A")) is running
+    assert log.find("fresh", None, ("scenario", 1, "A")) is not None
+
+
+async def test_oldest_finished_responses_are_evicted_first():
+    # Room for one response's two keys; these have only the step key
+    log = SubmissionLog(max_entries=1, ttl_seconds=60)
+    running = submit(log, "running", finish=False)
+    for session_id in ("s1", "s2", "s3"):
+        submit(log, session_id)
+
+    assert log.stats()["entries"] == 2
+    assert log.find("s1", None, ("scenario", 1, "A")) is None
+    assert log.find("s2", None, ("scenario", 1, "A")) is None
+    assert log.find("running", None, ("scenario", 1, "A")) is running
+    assert log.find("s3", None, ("scenario", 1, "A")) is not None
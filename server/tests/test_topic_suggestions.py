@@ -0,0 +1,50 @@
+# Topic suggestion pools
+from services.topic_suggestions import TopicSuggestionPool
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def make_pool(monkeypatch) -> tuple[TopicSuggestionPool, list]:
+    """Pool whose LLM batches are canned; returns it and the categories generated for"""
+    pool = TopicSuggestionPool(categories=["business", "medical"], pool_size=8, low_water=2, batch_size=4)
+    generated = []
+
+    async def generate(category, count, avoid):
+        generated.append(category)
+        return [f"{category} dilemma number {len(generated)}{i}" for i in range(count)]
+
+    monkeypatch.setattr(pool, "_generate", generate)
+    monkeypatch.setattr(pool, "_library_words", lambda category: [])
+    return pool, generated
+
+
+async def test_first_request_fills_every_configured_category(monkeypatch):
+    pool, generated = make_pool(monkeypatch)
+    assert not pool.started
+
+    topics = await pool.suggest("medical", count=3)
+    await asyncio.sleep(0)
+
+    assert len(topics) == 3 and all(t.startswith("medical") for t in topics)
+    assert pool.started
+    assert sorted(generated) == ["business", "medical"]
+    assert pool.waited == 1
+
+    await pool.suggest("business", count=3)
+    assert pool.waited == 1
+    await pool.stop()
+
+
+async def test_started_pool_does_not_refill_on_each_request(monkeypatch):
+    pool, generated = make_pool(monkeypatch)
+    pool.start()
+    await asyncio.sleep(0)
+
+    await pool.suggest("business", count=1)
+    await pool.suggest("business", count=1)
+
+    assert generated.count("business") == 1
+    assert pool.waited == 0
+    await pool.stop()
@@ -0,0 +1,230 @@
+# Write-behind session repository: flush ordering, failures and eviction
+from database.connection import create_db_engine
+from database.repositories.user_session_repo import SessionRepository
+from sqlalchemy.exc import OperationalError
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def choice(step: int, choice_id: str = "A") -> dict:
+    return {"step": step, "choice_id": choice_id, "choice_text": f"Choice {choice_id} at step {step}"}
+
+
+@pytest.fixture
+def engine():
+    return create_db_engine("sqlite://")
+
+
+@pytest.fixture
+def repo(engine):
+    return SessionRepository(engine, idle_seconds=900, flush_interval=60, max_retries=2)
+
+
+def locked(ops):
+    raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+
+async def test_flush_writes_in_order(engine, repo):
+    session = repo.create("scenario_1", "s1", current_step=1)
+    repo.append_choice(session, choice(1, "A"))
+    repo.append_choice(session, choice(2, "B"))
+    await repo.flush()
+
+    stored = SessionRepository(engine)._load("s1")
+    assert [c["choice_id"] for c in stored.choices_made] == ["A", "B"]
+    assert stored.current_step == 2
+    assert repo.stats()["pending_writes"] == 0
+
+
+async def test_delete_then_recreate_keeps_order(engine, repo):
+    session = repo.create("scenario_1", "s1")
+    repo.append_choice(session, choice(1, "A"))
+    assert await repo.delete("s1")
+
+    session = repo.create("scenario_2", "s1")
+    repo.append_choice(session, choice(1, "C"))
+    await repo.flush()
+
+    stored = SessionRepository(engine)._load("s1")
+    assert stored.scenario_id == "scenario_2"
+    assert [c["choice_id"] for c in stored.choices_made] == ["C"]
+
+
+async def test_rejected_write_does_not_block_the_rest(engine, repo):
+    # Another worker already created s1
+    other = SessionRepository(engine)
+    other.create("scenario_1", "s1")
+    await other.flush()
+
+    session = repo.create("scenario_1", "s1")
+    repo.append_choice(session, choice(1, "A"))
+    session = repo.create("scenario_1", "s2")
+    repo.append_choice(session, choice(1, "B"))
+    await repo.flush()
+
+    assert repo.stats()["pending_writes"] == 0
+    assert repo.dropped_writes == 1
+    (op, error), = repo.dead_letters
+    assert op[0] == "create" and op[1]["session_id"] == "s1"
+
+    reader = SessionRepository(engine)
+    assert [c["choice_id"] for c in reader._load("s1").choices_made] == ["A"]
+    assert [c["choice_id"] for c in reader._load("s2").choices_made] == ["B"]
+
+    # Later writes still go through
+    repo.append_choice(session, choice(2, "C"))
+    await repo.flush()
+    assert [c["choice_id"] for c in reader._load("s2").choices_made] == ["B", "C"]
+
+
+async def test_transient_failure_is_retried_in_order(engine, repo, monkeypatch):
+    session = repo.create("scenario_1", "s1")
+    repo.append_choice(session, choice(1, "A"))
+
+    monkeypatch.setattr(repo, "_apply", locked)
+    await repo.flush()
+    assert repo.flush_retries == 1
+
+    # Written while the database was failing: queued behind the retried batch
+    repo.append_choice(session, choice(2, "B"))
+    assert [op[0] for op in repo._pending] == ["create", "append", "append"]
+
+    monkeypatch.undo()
+    await repo.flush()
+    assert repo.stats()["pending_writes"] == 0
+    assert repo.dropped_writes == 0
+    assert repo._retries == 0
+    stored = SessionRepository(engine)._load("s1")
+    assert [c["choice_id"] for c in stored.choices_made] == ["A", "B"]
+
+
+async def test_transient_failure_gives_up_after_max_retries(engine, repo, monkeypatch):
+    session = repo.create("scenario_1", "s1")
+    repo.append_choice(session, choice(1, "A"))
+
+    monkeypatch.setattr(repo, "_apply", locked)
+    for _ in range(repo.max_retries):
+        await repo.flush()
+        assert repo.stats()["pending_writes"] == 2
+
+    await repo.flush()
+    assert repo.stats()["pending_writes"] == 0
+    assert repo.dropped_writes == 2
+    assert len(repo.dead_letters) == 2
+
+    # The queue is usable again once the database recovers
+    monkeypatch.undo()
+    repo.create("scenario_1", "s2")
+    await repo.flush()
+    assert SessionRepository(engine)._load("s2") is not None
+
+
+async def test_dead_letters_are_bounded(engine):
+    repo = SessionRepository(engine, dead_letter_max_entries=2)
+    other = SessionRepository(engine)
+    for i in range(3):
+        other.create("scenario_1", f"s{i}")
+    await other.flush()
+
+    for i in range(3):
+        repo.create("scenario_1", f"s{i}")
+    await repo.flush()
+
+    assert repo.dropped_writes == 3
+    assert [op[1]["session_id"] for op, _ in repo.dead_letters] == ["s1", "s2"]
+
+
+async def test_idle_sessions_are_evicted_once_flushed(engine):
+    repo = SessionRepository(engine, idle_seconds=0)
+    session = repo.create("scenario_1", "s1")
+    repo.append_choice(session, choice(1, "A"))
+
+    # Queued writes keep the session cached
+    repo._evict_idle()
+    assert repo.stats()["cached_sessions"] == 1
+
+    await repo.flush()
+    repo._evict_idle()
+    assert repo.stats()["cached_sessions"] == 0
+    assert repo.evictions == 1
+
+    # Evicted sessions are reloaded from the database
+    reloaded = await repo.get("s1")
+    assert [c["choice_id"] for c in reloaded.choices_made] == ["A"]
+    assert repo.cache_misses == 1
+
+
+async def test_sessions_with_dropped_writes_are_evicted(engine, repo, monkeypatch):
+    repo.idle_seconds = 0
+    repo.create("scenario_1", "s1")
+
+    monkeypatch.setattr(repo, "_apply", locked)
+    for _ in range(repo.max_retries + 1):
+        await repo.flush()
+
+    repo._evict_idle()
+    assert repo.stats()["cached_sessions"] == 0
+
+
+async def test_recently_used_sessions_stay_cached(repo):
+    repo.create("scenario_1", "s1")
+    await repo.flush()
+    repo._evict_idle()
+    assert repo.stats()["cached_sessions"] == 1
+
+
+async def shared_session(engine) -> tuple[SessionRepository, SessionRepository]:
+    """Two workers' repositories that both have s1 (with one choice) cached"""
+    first = SessionRepository(engine, idle_seconds=900, flush_interval=60)
+    second = SessionRepository(engine, idle_seconds=900, flush_interval=60)
+    session = first.create("scenario_1", "s1")
+    first.append_choice(session, choice(1, "A"))
+    await first.flush()
+    assert len((await second.get("s1")).choices_made) == 1
+    return first, second
+
+
+async def test_revalidated_read_sees_another_workers_append(engine):
+    first, second = await shared_session(engine)
+    first.append_choice(await first.get("s1", revalidate=True), choice(2, "B"))
+    await first.flush()
+
+    # A plain read may serve the stale copy; one before a write may not
+    assert len((await second.get("s1")).choices_made) == 1
+    session = await second.get("s1", revalidate=True)
+    assert [c["choice_id"] for c in session.choices_made] == ["A", "B"]
+    assert second.stats()["stale_reloads"] == 1
+
+
+async def test_revalidation_is_skipped_while_own_writes_are_queued(engine):
+    first, _ = await shared_session(engine)
+    session = await first.get("s1", revalidate=True)
+    first.append_choice(session, choice(2, "B"))
+    checks = first.stats()["revalidations"]
+
+    assert await first.get("s1", revalidate=True) is session
+    assert first.stats()["revalidations"] == checks
+
+
+async def test_session_deleted_by_another_worker_is_not_served_for_writes(engine):
+    first, second = await shared_session(engine)
+    assert await first.delete("s1")
+
+    assert await second.get("s1", revalidate=True) is None
+
+
+async def test_conflicting_appends_from_two_workers_keep_one(engine):
+    first, second = await shared_session(engine)
+    # Both append step 2 from their own copy, before either flushes
+    first.append_choice(await first.get("s1"), choice(2, "B"))
+    second.append_choice(await second.get("s1"), choice(2, "C"))
+    await first.flush()
+    await second.flush()
+
+    stored = SessionRepository(engine)._load("s1")
+    assert [c["choice_id"] for c in stored.choices_made] == ["A", "B"]
+    assert second.stats()["dropped_writes"] == 1
+    # The loser reloads instead of keeping its rejected choice
+    session = await second.get("s1")
+    assert [c["choice_id"] for c in session.choices_made] == ["A", "B"]
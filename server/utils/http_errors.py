@@ -0,0 +1,19 @@
+# Mapping LLM failures onto HTTP errors
+from fastapi import HTTPException
+from services.llm_resilience import LLMOverloadedError, LLMRateLimitError, LLMUnavailableError
+import math
+
+
+def llm_http_error(error: Exception, detail: str) -> HTTPException:
+    """
+    503 with Retry-After while the provider is throttling us, the circuit
+    breaker is open or admission control is shedding load (the client should
+    simply come back later); 500 otherwise
+    """
+    if isinstance(error, (LLMRateLimitError, LLMUnavailableError, LLMOverloadedError)):
+        return HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(math.ceil(error.retry_after or 1))}
+        )
+    return HTTPException(status_code=500, detail=detail)
@@ -0,0 +1,144 @@
+# Incremental JSON parsing for streamed LLM output
+from typing import Any, List, Optional, Tuple
+import json
+
+
+class _Frame:
+    """An open object or array"""
+    __slots__ = ("kind", "path", "key", "index", "value_start", "expect_key")
+
+    def __init__(self, kind: str, path: Tuple):
+        self.kind = kind  # "{" or "["
+        self.path = path
+        self.key: Optional[str] = None
+        self.index = 0
+        self.value_start: Optional[int] = None
+        self.expect_key = kind == "{"
+
+    @property
+    def member(self):
+        return self.key if self.kind == "{" else self.index
+
+
+class IncrementalJSONParser:
+    """
+    Emits values of one JSON document as soon as each one is complete
+
+    Text is fed in arbitrary chunks. ``feed`` returns ``(path, value)`` for
+    every value that completed in the chunk and sits less than
+    ``max_depth`` containers deep, e.g. with the default depth of 2:
+    ``(("title",), "...")``, ``(("decision_points", 0), {...})`` and, when
+    the array closes, ``(("decision_points",), [...])``. Deeper values are
+    delivered as part of their ancestors, and the whole document comes last
+    with the path ``()``. Anything before the first ``{`` or ``[`` (such as
+    a markdown fence) is ignored.
+
+    Each character is scanned once; completed values are decoded with
+    ``json.loads`` on their slice of the buffer, allowing the raw newlines
+    models put in strings. A value that does not decode is reported in
+    ``errors`` and skipped.
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.done = False
+        self.errors: List[str] = []
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._root_start = 0
+
+    @property
+    def open_paths(self) -> List[Tuple]:
+        """Paths of the containers still open (outermost first)"""
+        return [frame.path for frame in self._stack]
+
+    def feed(self, text: str) -> List[Tuple[Tuple, Any]]:
+        self.buffer += text
+        if self.done:
+            return []
+
+        events: List[Tuple[Tuple, Any]] = []
+        buffer = self.buffer
+        stack = self._stack
+
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = stack[-1] if stack else None
+                    if frame is not None and frame.expect_key:
+                        try:
+                            frame.key = json.loads(buffer[self._string_start:i + 1], strict=False)
+                        except ValueError:
+                            frame.key = buffer[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                if stack and not stack[-1].expect_key and stack[-1].value_start is None:
+                    stack[-1].value_start = i
+                continue
+
+            if ch in "{[":
+                if stack:
+                    parent = stack[-1]
+                    if parent.value_start is None:
+                        parent.value_start = i
+                    path = parent.path + (parent.member, )
+                else:
+                    path = ()
+                    self._root_start = i
+                stack.append(_Frame(ch, path))
+                continue
+
+            if not stack:
+                continue
+
+            frame = stack[-1]
+            if ch in "}]":
+                self._complete_member(frame, i, events)
+                stack.pop()
+                if not stack:
+                    self.done = True
+                    self._emit((), self._root_start, i + 1, events)
+                    self._pos = i + 1
+                    return events
+            elif ch == ",":
+                self._complete_member(frame, i, events)
+                frame.value_start = None
+                frame.index += 1
+                frame.key = None
+                frame.expect_key = frame.kind == "{"
+            elif ch == ":":
+                if frame.kind == "{":
+                    frame.expect_key = False
+            elif frame.value_start is None and not frame.expect_key and not ch.isspace():
+                frame.value_start = i
+
+        self._pos = len(buffer)
+        return events
+
+    def _complete_member(self, frame: _Frame, end: int, events: list):
+        """The member that started at frame.value_start ends just before ``end``"""
+        if frame.value_start is None:
+            return
+        if len(frame.path) < self.max_depth:
+            self._emit(frame.path + (frame.member, ), frame.value_start, end, events)
+
+    def _emit(self, path: Tuple, start: int, end: int, events: list):
+        raw = self.buffer[start:end].strip()
+        try:
+            events.append((path, json.loads(raw, strict=False)))
+        except ValueError as e:
+            self.errors.append(f"{'/'.join(map(str, path)) or '<root>'}: {str(e)}")
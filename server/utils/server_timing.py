@@ -0,0 +1,57 @@
+# Request timing middleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import RequestTiming, current_timing, http_request_seconds
+import time
+
+
+class ServerTimingMiddleware:
+    """
+    Times every HTTP request and reports the breakdown
+
+    Adds a ``Server-Timing`` header listing the phases recorded before the
+    response started (for streamed responses, only what preceded the first
+    byte) and records the full request latency by route template.
+    Written as plain ASGI so streamed bodies pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming(scope)
+        token = current_timing.set(timing)
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            recorded = True
+            http_request_seconds.observe(
+                time.perf_counter() - timing.started,
+                scope["method"],
+                timing.route,
+                status
+            )
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing.server_timing().encode("latin-1"))
+                ]
+            await send(message)
+            # Background tasks run after the last body chunk; don't count them
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
+            if not recorded:
+                record()
@@ -0,0 +1,11 @@
+# Server-Sent Events helpers
+import json
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Headers that keep proxies from buffering an event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}